@@ -9,11 +9,12 @@ pip install Flask Flask-SQLAlchemy Flask-Migrate werkzeug
 mv app.py venv/app.py
 mv static venv/static
 mv templates venv/templates
+mv migrations venv/migrations
 
 cd venv
 
-flask db init
-flask db migrate -m "Initial migration."
+flask init-db
+
 flask db upgrade
 
 xdg-open http://127.0.0.1:5000 &
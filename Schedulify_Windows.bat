@@ -9,11 +9,12 @@ pip install Flask Flask-SQLAlchemy Flask-Migrate werkzeug
 move app.py venv\app.py
 move static venv\static
 move templates venv\templates
+move migrations venv\migrations
 
 cd venv
 
-flask db init
-flask db migrate -m "Initial migration."
+flask init-db
+
 flask db upgrade
 
 start http://127.0.0.1:5000
@@ -1,21 +1,252 @@
+import atexit
 import json
-from flask import Flask, render_template, request, redirect, url_for, flash, session
+import click
+from flask import (
+    Flask,
+    render_template,
+    request,
+    redirect,
+    url_for,
+    flash,
+    g,
+    get_flashed_messages,
+    session,
+    jsonify,
+    make_response,
+    Response,
+    stream_with_context,
+    appcontext_pushed,
+    before_render_template,
+    template_rendered,
+)
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
 from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
-from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy import delete, event, func, insert, or_, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import configure_mappers
+from markupsafe import Markup, escape
+from werkzeug.datastructures import CallbackDict
+from werkzeug.security import (
+    DEFAULT_PBKDF2_ITERATIONS,
+    generate_password_hash,
+    check_password_hash,
+    safe_join,
+)
+from concurrent.futures import ProcessPoolExecutor
+from collections import OrderedDict, namedtuple
+from itertools import groupby
+from types import SimpleNamespace
+import cProfile
+import contextvars
 import datetime
+import functools
+import hashlib
+import io
+import math
+import os
+import pickle
+import queue
+import random
+import re
+import secrets
+import shutil
+import sqlite3
+import struct
+import tempfile
+import threading
+import time
+import zlib
+
+try:
+    import fcntl
+except ImportError:  # Windows, where the write cap can only be kept per worker
+    fcntl = None
 
 # Initializing our Flask app and configuring it
 app = Flask(__name__, template_folder="./templates")
 app._static_folder = "./static"
-app.secret_key = "your_secret_key"  # Idk if we should change this?
+app.secret_key = os.environ.get(
+    "SECRET_KEY", "your_secret_key"
+)  # Set SECRET_KEY in production
+
+# Database configuration, everything can be overridden from the environment for production
+app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get(
+    "DATABASE_URL", "sqlite:///plannerpad.db"  # Using a local SQLite database
+)
+app.config["SQLITE_JOURNAL_MODE"] = os.environ.get("SQLITE_JOURNAL_MODE", "WAL")
+app.config["SQLITE_SYNCHRONOUS"] = os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL")
+app.config["SQLITE_BUSY_TIMEOUT"] = int(
+    os.environ.get("SQLITE_BUSY_TIMEOUT", 5000)
+)  # Milliseconds a write waits for the lock before failing
+if app.config["SQLALCHEMY_DATABASE_URI"] not in ("sqlite://", "sqlite:///:memory:"):
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
+        "pool_size": int(os.environ.get("DB_POOL_SIZE", 5)),
+        "max_overflow": int(os.environ.get("DB_MAX_OVERFLOW", 10)),
+        "pool_timeout": int(os.environ.get("DB_POOL_TIMEOUT", 30)),
+        "pool_recycle": int(os.environ.get("DB_POOL_RECYCLE", 3600)),
+    }
+
+# Password hashing settings, the method's cost parameters can be raised at any time and existing
+# hashes get upgraded on login. The pool size and queue cap bound how much CPU logins can take
+app.config["PASSWORD_HASH_METHOD"] = os.environ.get(
+    "PASSWORD_HASH_METHOD", f"pbkdf2:sha256:{DEFAULT_PBKDF2_ITERATIONS}"
+)
+app.config["PASSWORD_HASH_WORKERS"] = int(os.environ.get("PASSWORD_HASH_WORKERS", 2))
+app.config["PASSWORD_HASH_MAX_QUEUE"] = int(
+    os.environ.get("PASSWORD_HASH_MAX_QUEUE", 32)
+)
+
+# How the hour grid of a week gets stored, "rows" (a Schedule row per cell) or "grid" (packed)
+app.config["SCHEDULE_STORAGE"] = os.environ.get("SCHEDULE_STORAGE", "rows")
+
+# Range view settings, the longest range one request can ask for and the rows fetched at a time
+app.config["RANGE_MAX_WEEKS"] = 260
+app.config["RANGE_BATCH_SIZE"] = 500
+
+# Export/import settings, the rows read at a time by an export and written per import transaction
+app.config["EXPORT_BATCH_SIZE"] = 1000
+app.config["IMPORT_BATCH_SIZE"] = 5000
+
+# Week page cache settings. WEEK_CACHE_BACKEND is "memory" to keep the entries in each worker or
+# "redis" to share them between the workers (REDIS_URL). Then the entries kept per worker and the
+# seconds before an entry goes stale
+app.config["WEEK_CACHE_BACKEND"] = os.environ.get("WEEK_CACHE_BACKEND", "memory")
+app.config["WEEK_CACHE_MAX_ENTRIES"] = 1024
+app.config["WEEK_CACHE_TTL"] = 300
+
+# Profiling settings, off by default. When on, /metrics has per route histograms and a sample of
+# the requests (PROFILE_SAMPLE_RATE, 0 to 1) runs under cProfile, getting dumped into PROFILE_DIR
+# when they take longer than PROFILE_SLOW_REQUEST_MS
+app.config["PROFILING"] = os.environ.get("PROFILING", "") not in ("", "0")
+app.config["PROFILE_SAMPLE_RATE"] = float(os.environ.get("PROFILE_SAMPLE_RATE", 0))
+app.config["PROFILE_SLOW_REQUEST_MS"] = int(
+    os.environ.get("PROFILE_SLOW_REQUEST_MS", 500)
+)
+app.config["PROFILE_DIR"] = os.environ.get("PROFILE_DIR", "profiles")
+
+# Session settings, sessions live on the server ("database" for a table shared by every worker,
+# "memory" for a single process) and the cookie only carries their id. Sessions nobody used for
+# SESSION_IDLE_TIMEOUT seconds expire, and expired ones get swept out every SESSION_SWEEP_INTERVAL
+app.config["SESSION_STORE"] = os.environ.get("SESSION_STORE", "database")
+app.config["SESSION_IDLE_TIMEOUT"] = int(
+    os.environ.get("SESSION_IDLE_TIMEOUT", 7 * 24 * 3600)
+)
+app.config["SESSION_REFRESH_INTERVAL"] = (
+    300  # How often reading a session pushes its expiry
+)
+app.config["SESSION_SWEEP_INTERVAL"] = 600
+app.config["SESSION_MEMORY_MAX_ENTRIES"] = 100000
+
+# Archive settings, `flask compact-weeks` moves weeks older than ARCHIVE_AFTER_WEEKS into the
+# archive table, ARCHIVE_BATCH_SIZE weeks per transaction
+app.config["ARCHIVE_AFTER_WEEKS"] = int(os.environ.get("ARCHIVE_AFTER_WEEKS", 52))
+app.config["ARCHIVE_BATCH_SIZE"] = 200
+
+# Live sync settings, open planner pages pick up the cells saved in other tabs and on other devices.
+# LIVE_SYNC picks how: "poll" (the default) has each page ask for what changed every
+# LIVE_SYNC_POLL_INTERVAL seconds, which works with any number of workers and ties up nothing in
+# between. "stream" pushes the changes over a server-sent events stream that each page keeps open,
+# for async workers (gunicorn.conf.py switches to gevent for it), and "off" turns it off. Streams
+# get fanned out through LIVE_SYNC_BACKEND, "memory" for a single worker or "redis" (REDIS_URL) to
+# reach the pages on every worker. Each worker takes up to LIVE_SYNC_MAX_CONNECTIONS streams and
+# the pages past that poll instead. An idle stream sends a keep-alive every LIVE_SYNC_HEARTBEAT
+# seconds and gets closed (and reopened by the browser) after LIVE_SYNC_MAX_DURATION seconds
+app.config["LIVE_SYNC"] = os.environ.get("LIVE_SYNC", "poll")
+app.config["LIVE_SYNC_POLL_INTERVAL"] = float(
+    os.environ.get("LIVE_SYNC_POLL_INTERVAL", 5)
+)
+app.config["LIVE_SYNC_BACKEND"] = os.environ.get("LIVE_SYNC_BACKEND", "memory")
+app.config["LIVE_SYNC_MAX_CONNECTIONS"] = int(
+    os.environ.get("LIVE_SYNC_MAX_CONNECTIONS", 1000)
+)
+app.config["LIVE_SYNC_HEARTBEAT"] = 15
+app.config["LIVE_SYNC_MAX_DURATION"] = 600
+app.config["LIVE_SYNC_QUEUE_SIZE"] = 64  # Messages held for a page that falls behind
+
+# Redis-compatible server the backends shared between workers talk to, only used once one of them
+# is picked
+app.config["REDIS_URL"] = os.environ.get("REDIS_URL", "redis://localhost:6379/0")
+
+# Autosave settings, typed cells get queued and written every AUTOSAVE_FLUSH_INTERVAL seconds (or
+# as soon as AUTOSAVE_MAX_PENDING cells are waiting). AUTOSAVE_MAX_QUEUE caps the cells a worker
+# holds before it asks the page to try again
+app.config["AUTOSAVE_FLUSH_INTERVAL"] = float(
+    os.environ.get("AUTOSAVE_FLUSH_INTERVAL", 1.0)
+)
+app.config["AUTOSAVE_MAX_PENDING"] = 500
+app.config["AUTOSAVE_MAX_QUEUE"] = int(os.environ.get("AUTOSAVE_MAX_QUEUE", 10000))
 
-# Database configuration
-app.config["SQLALCHEMY_DATABASE_URI"] = (
-    "sqlite:///plannerpad.db"  # Using a local SQLite database
+# Rate limits per user (or per IP address before logging in) and route, as (requests, seconds): a
+# client can send that many requests in a burst and then gets them back at that pace. Only requests
+# that write something or check a password count, page loads don't. RATE_LIMITING=0 turns it off.
+# The buckets are kept in each worker ("memory"), so every worker allows the whole budget, unless
+# RATE_LIMIT_BACKEND is "redis" (REDIS_URL) and the workers share them
+app.config["RATE_LIMITING"] = os.environ.get("RATE_LIMITING", "1") not in ("", "0")
+app.config["RATE_LIMIT_BACKEND"] = os.environ.get("RATE_LIMIT_BACKEND", "memory")
+app.config["RATE_LIMITS"] = {
+    "signup": (10, 600),
+    "login": (10, 60),
+    "update_categories_and_tasks": (30, 60),
+    "assign_task_to_day": (30, 60),
+    "schedule_task_time_slot": (30, 60),
+    "patch_week_cells": (120, 60),
+    "autosave_week_cells": (300, 60),
+    "recurring_tasks": (30, 60),
+    "delete_recurring_task": (30, 60),
+    "import_planner": (5, 600),
+}
+app.config["RATE_LIMIT_MAX_CLIENTS"] = 100000  # Buckets kept per worker, in memory
+
+# Write admission, at most WRITE_MAX_CONCURRENCY write transactions run at once. With
+# WRITE_ADMISSION=file (the default) that's across all the workers on the machine, which share the
+# slots through lock files in WRITE_SLOTS_DIR, and with "memory" it's per worker. A write that
+# can't start within WRITE_QUEUE_TIMEOUT seconds gets turned away (503) instead of waiting on the
+# database lock along with everyone else
+app.config["WRITE_ADMISSION"] = os.environ.get("WRITE_ADMISSION", "file")
+app.config["WRITE_MAX_CONCURRENCY"] = int(os.environ.get("WRITE_MAX_CONCURRENCY", 4))
+database_key = hashlib.sha256(app.config["SQLALCHEMY_DATABASE_URI"].encode())
+app.config["WRITE_SLOTS_DIR"] = os.environ.get(
+    "WRITE_SLOTS_DIR",
+    # One set of slots per database
+    os.path.join(
+        tempfile.gettempdir(), f"schedulify-write-slots-{database_key.hexdigest()[:12]}"
+    ),
 )
-db = SQLAlchemy(app)
-migrate = Migrate(app, db)
+app.config["WRITE_QUEUE_TIMEOUT"] = float(os.environ.get("WRITE_QUEUE_TIMEOUT", 0.25))
+
+
+# Tuning every new SQLite connection, WAL lets the page reads go on while a POST is writing and
+# the busy timeout makes concurrent writers wait for the lock instead of failing right away
+@event.listens_for(Engine, "connect")
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"PRAGMA journal_mode={app.config['SQLITE_JOURNAL_MODE']}")
+        cursor.execute(f"PRAGMA synchronous={app.config['SQLITE_SYNCHRONOUS']}")
+        cursor.execute(f"PRAGMA busy_timeout={app.config['SQLITE_BUSY_TIMEOUT']}")
+        cursor.close()
+
+
+# The database gets connected to the app by set_up_app()
+db = SQLAlchemy()
+
+
+# The `flask db` migration commands. Flask-Migrate brings Alembic along, which takes a while to
+# import, so it only gets loaded when one of these commands runs
+class MigrationCommands(click.Group):
+    def make_context(self, info_name, args, parent=None, **extra):
+        from flask_migrate import Migrate
+        from flask_migrate.cli import db as commands
+
+        if "migrate" not in app.extensions:
+            Migrate(app, db)
+        return commands.make_context(info_name, args, parent, **extra)
+
+
+app.cli.add_command(MigrationCommands("db", help="Perform database migrations."))
 
 
 # User database model to store user credentials and their relationships
@@ -25,6 +256,9 @@ class User(db.Model):
         db.String(80), unique=True, nullable=False
     )  # Requiring it to be a unique username
     password = db.Column(db.String(120), nullable=False)  # Using a hashed password
+    recurring_version = db.Column(
+        db.Integer, nullable=False, default=0, server_default="0"
+    )  # Bumped whenever the user's recurring tasks change, they show up in every week
 
     # Creating a relationship to categories and calendars
     categories = db.relationship("Category", backref="user", lazy=True)
@@ -40,10 +274,21 @@ class Calendar(db.Model):
     date = db.Column(
         db.Date, nullable=False
     )  # Start date of the week, Monday in our case
+    version = db.Column(
+        db.Integer, nullable=False, default=0, server_default="0"
+    )  # Bumped on every write to the week, used for the page's ETag
+    schedule_grid = db.Column(
+        db.LargeBinary, nullable=True
+    )  # Packed hour grid when the week uses the "grid" schedule storage
 
     # Relationship to categories within the calendar
     categories = db.relationship("Category", backref="calendar", lazy=True)
 
+    # Each user has one calendar per week
+    __table_args__ = (
+        db.Index("ix_calendar_user_id_date", "user_id", "date", unique=True),
+    )
+
 
 # Category database model to organize tasks
 class Category(db.Model):
@@ -59,6 +304,10 @@ class Category(db.Model):
     # Relationship to tasks within the category
     tasks = db.relationship("Task", backref="category", lazy=True)
 
+    __table_args__ = (
+        db.Index("ix_category_user_id_calendar_id", "user_id", "calendar_id"),
+    )
+
 
 # Schedule database model to assign tasks to specific days and time slots
 class Schedule(db.Model):
@@ -72,6 +321,16 @@ class Schedule(db.Model):
     day_of_week = db.Column(db.String(50), nullable=False)  # Day of the week
     time_slot = db.Column(db.String(50), nullable=False)  # Time slot of the day
 
+    __table_args__ = (
+        db.Index(
+            "ix_schedule_user_id_day_of_week_time_slot",
+            "user_id",
+            "day_of_week",
+            "time_slot",
+        ),
+        db.Index("ix_schedule_task_id", "task_id"),  # For joining schedules to tasks
+    )
+
 
 # Task model to represent individual tasks
 class Task(db.Model):
@@ -91,6 +350,24 @@ class Task(db.Model):
     )  # Time slot the task is assigned to
     slot_number = db.Column(db.Integer, nullable=True)  # Position in the list
 
+    # One task per cell of the category and day grids
+    __table_args__ = (
+        db.Index(
+            "ix_task_calendar_id_category_id_slot_number",
+            "calendar_id",
+            "category_id",
+            "slot_number",
+            unique=True,
+        ),
+        db.Index(
+            "ix_task_calendar_id_assigned_day_slot_number",
+            "calendar_id",
+            "assigned_day",
+            "slot_number",
+            unique=True,
+        ),
+    )
+
     def __init__(
         self,
         task_name,
@@ -108,126 +385,3270 @@ class Task(db.Model):
         self.calendar_id = calendar_id
 
 
-# Create tables if they don't exist
-with app.app_context():
+# Server-side session model, the cookie only holds the session id
+class StoredSession(db.Model):
+    session_id = db.Column(db.String(64), primary_key=True)
+    data = db.Column(db.Text, nullable=False)  # The session serialized like Flask does
+    expires_at = db.Column(
+        db.Float, nullable=False
+    )  # Unix time it expires at unless it gets used again
+
+    __table_args__ = (db.Index("ix_stored_session_expires_at", "expires_at"),)
+
+
+# Recurring task model, a task that shows up on the given days of every week (or every few
+# weeks) without being stored in each of them. It fills either a day list slot or an hour slot
+class RecurringTask(db.Model):
+    recurring_task_id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(
+        db.Integer, db.ForeignKey("user.user_id"), nullable=False
+    )  # Link to User
+    task_name = db.Column(db.String(255), nullable=False)  # Name of the task
+    days = db.Column(
+        db.Integer, nullable=False
+    )  # Days it repeats on, bit 0 is Monday and bit 6 is Sunday
+    time_slot = db.Column(
+        db.String(50), nullable=True
+    )  # Hour slot it fills, for the time schedule
+    slot_number = db.Column(
+        db.Integer, nullable=True
+    )  # Position it fills in the day's list, for the day tasks
+    start_date = db.Column(db.Date, nullable=False)  # Monday of the first week
+    end_date = db.Column(db.Date, nullable=True)  # Monday of the last week, if it ends
+    interval_weeks = db.Column(
+        db.Integer, nullable=False, default=1, server_default="1"
+    )  # 1 for every week, 2 for every other week and so on
+
+    __table_args__ = (db.Index("ix_recurring_task_user_id", "user_id"),)
+
+
+# A single occurrence of a recurring task that was skipped (no task name) or renamed
+class RecurringException(db.Model):
+    recurring_exception_id = db.Column(db.Integer, primary_key=True)
+    recurring_task_id = db.Column(
+        db.Integer, db.ForeignKey("recurring_task.recurring_task_id"), nullable=False
+    )  # Link to RecurringTask
+    date = db.Column(db.Date, nullable=False)  # Day of the occurrence
+    task_name = db.Column(db.String(255), nullable=True)  # New name, empty if skipped
+
+    __table_args__ = (
+        db.Index(
+            "ix_recurring_exception_recurring_task_id_date",
+            "recurring_task_id",
+            "date",
+            unique=True,
+        ),
+    )
+
+
+# A week moved out of the planner tables by `flask compact-weeks`, kept as one compressed blob
+# holding all of its rows. Archived weeks can be looked at but not changed
+class ArchivedWeek(db.Model):
+    archived_week_id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(
+        db.Integer, db.ForeignKey("user.user_id"), nullable=False
+    )  # Link to User
+    date = db.Column(db.Date, nullable=False)  # Start date of the week
+    data = db.Column(
+        db.LargeBinary, nullable=False
+    )  # zlib compressed JSON, see pack_week()
+
+    __table_args__ = (
+        db.Index("ix_archived_week_user_id_date", "user_id", "date", unique=True),
+    )
+
+
+# Create tables if they don't exist, `flask init-db` runs it before `flask db upgrade`
+def init_db():
     db.create_all()
 
 
-# Index route to display the main planner page
-@app.route("/index", defaults={"calendar_date": None})
-@app.route("/index/<calendar_date>")
-def index(calendar_date):
-    user_id = session.get("user_id")
-    if not user_id:
-        flash("Please login to be able to use your planner!", "danger")
-        return redirect(url_for("login"))
+# Days of the week and time slots, we can change these if we decided to
+DAYS_OF_WEEK = [
+    "Monday",
+    "Tuesday",
+    "Wednesday",
+    "Thursday",
+    "Friday",
+    "Saturday",
+    "Sunday",
+]
+TIME_SLOTS = [
+    "7 AM",
+    "8 AM",
+    "9 AM",
+    "10 AM",
+    "11 AM",
+    "12 PM",
+    "1 PM",
+    "2 PM",
+    "3 PM",
+    "4 PM",
+    "5 PM",
+    "6 PM",
+    "7 PM",
+    "8 PM",
+    "9 PM",
+]
+# How many categories a week starts out with, and how many task slots each category and day has
+CATEGORIES_PER_WEEK = 7
+TASKS_PER_CATEGORY = 8
+TASKS_PER_DAY = 7
 
-    # Determine the calendar to load based on the date
-    if calendar_date is None:
-        current_date = datetime.date.today()
-    else:
-        current_date = datetime.datetime.strptime(calendar_date, "%Y-%m-%d").date()
 
-    # Calculate the week start date (Monday of the current week)
-    week_start_date = current_date - datetime.timedelta(days=current_date.weekday())
+# The client of the shared backends, made from REDIS_URL. The redis package is only needed when one
+# of them gets picked
+@functools.lru_cache(maxsize=None)
+def redis_client():
+    import redis
 
-    # Ensure the calendar for the week exists
-    calendar = Calendar.query.filter_by(user_id=user_id, date=week_start_date).first()
-    if not calendar:
-        # Create a new calendar for the week if it doesn't exist
-        calendar = Calendar(user_id=user_id, date=week_start_date)
-        db.session.add(calendar)
-        db.session.commit()
+    return redis.Redis.from_url(app.config["REDIS_URL"])
 
-    # Storing calendar details in the session
-    session["calendar_id"] = calendar.calendar_id
-    session["calendar_date"] = week_start_date.strftime("%Y-%m-%d")
 
-    # Fetch categories for the current user and calendar
-    categories = Category.query.filter_by(
-        user_id=user_id, calendar_id=calendar.calendar_id
-    ).all()
+# In-process cache backend, keeps the most recently used entries and drops them after a TTL
+class InProcessCacheBackend:
+    def __init__(self, max_entries=1024, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
 
-    # If there are no categories, this where create default ones (Good find Corey <3)
-    if not categories:
-        categories = [
-            Category(
-                user_id=user_id,
-                calendar_id=calendar.calendar_id,
-                category_name=f"Category {i}",
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def delete_prefix(self, prefix):
+        with self.lock:
+            for key in [key for key in self.entries if key.startswith(prefix)]:
+                del self.entries[key]
+
+    def sweep(self):
+        with self.lock:
+            now = time.monotonic()
+            for key in [key for key, entry in self.entries.items() if entry[0] < now]:
+                del self.entries[key]
+
+
+# Cache backend shared between workers, works with any Redis-compatible client. It uses get,
+# setex and delete for the entries and scan_iter(match=...) to find a user's entries
+class SharedCacheBackend:
+    def __init__(self, client, ttl=300):
+        self.client = client
+        self.ttl = ttl
+
+    def get(self, key):
+        value = self.client.get(key)
+        return None if value is None else pickle.loads(value)
+
+    def set(self, key, value):
+        self.client.setex(key, self.ttl, pickle.dumps(value))
+
+    def delete(self, key):
+        self.client.delete(key)
+
+    def delete_prefix(self, prefix):
+        for key in self.client.scan_iter(match=f"{prefix}*"):
+            self.client.delete(key)
+
+    def sweep(self):
+        pass  # The server expires keys by itself
+
+
+# Cache for the built week view models, keyed by user and week start date. The write routes
+# invalidate a week when they commit so the next page view rebuilds it. Every entry carries the
+# stamp of the rows it was built from (see week_stamp) and only gets served while that still
+# matches, so a week saved through another worker is never shown stale
+class WeekCache:
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(user_id, week_start_date):
+        return f"week:{user_id}:{week_start_date}"
+
+    def get(self, user_id, week_start_date, stamp):
+        week = self.backend.get(self.key(user_id, week_start_date))
+        if week is None or week["stamp"] != stamp:
+            week = None
+            self.misses += 1
+        else:
+            self.hits += 1
+        return week
+
+    def set(self, user_id, week_start_date, week):
+        self.backend.set(self.key(user_id, week_start_date), week)
+
+    def invalidate(self, user_id, week_start_date):
+        self.backend.delete(self.key(user_id, week_start_date))
+
+    # For changes that show up in every week of a user, like their recurring tasks
+    def invalidate_user(self, user_id):
+        self.backend.delete_prefix(f"week:{user_id}:")
+
+
+week_cache = WeekCache(
+    SharedCacheBackend(redis_client(), app.config["WEEK_CACHE_TTL"])
+    if app.config["WEEK_CACHE_BACKEND"] == "redis"
+    else InProcessCacheBackend(
+        app.config["WEEK_CACHE_MAX_ENTRIES"], app.config["WEEK_CACHE_TTL"]
+    )
+)
+
+
+# In-process pub/sub backend, hands every message straight to this worker's subscribers
+class InProcessPubSubBackend:
+    shared = False
+
+    def deliver(self, channel, message):
+        pass  # Nobody is listening before the first page subscribes
+
+    def start(self, deliver):
+        self.deliver = deliver
+
+    def publish(self, channel, message):
+        self.deliver(channel, message)
+
+
+# Pub/sub backend shared between workers, works with any Redis-compatible client (publish/pubsub).
+# Each worker listens to every week's channel on one thread and hands out what it gets
+class SharedPubSubBackend:
+    shared = True
+
+    def __init__(self, client, prefix="week-events:"):
+        self.client = client
+        self.prefix = prefix
+
+    def start(self, deliver):
+        def listen():
+            pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+            pubsub.psubscribe(f"{self.prefix}*")
+            for item in pubsub.listen():
+                channel = item["channel"]
+                if isinstance(channel, bytes):
+                    channel = channel.decode()
+                deliver(channel, json.loads(item["data"]))
+
+        threading.Thread(target=listen, daemon=True).start()
+
+    def publish(self, channel, message):
+        self.client.publish(channel, json.dumps(message))
+
+
+# One open planner page listening for changes to its week. Messages that don't fit in the queue
+# get dropped and the page gets sent the whole week instead
+class WeekSubscription:
+    def __init__(self, channel, queue_size):
+        self.channel = channel
+        self.messages = queue.Queue(queue_size)
+        self.missed = False
+
+
+# Fans the cells saved to a week out to every page that has the week open, through the backend so
+# pages open on other workers hear about them too. An idle page only costs its queue. The backend
+# gets started with the first page, in the worker itself rather than a preloading parent
+class WeekEvents:
+    def __init__(self, backend, max_subscribers=10000, queue_size=64):
+        self.backend = backend
+        self.max_subscribers = max_subscribers
+        self.queue_size = queue_size
+        self.subscriptions = {}
+        self.count = 0
+        self.started = False
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def channel(user_id, week_start_date):
+        return f"week-events:{user_id}:{week_start_date}"
+
+    # Returns None when this worker already has as many pages listening as it allows
+    def subscribe(self, user_id, week_start_date):
+        subscription = WeekSubscription(
+            self.channel(user_id, week_start_date), self.queue_size
+        )
+        with self.lock:
+            if self.count >= self.max_subscribers:
+                return None
+            if not self.started:
+                self.backend.start(self.deliver)
+                self.started = True
+            self.subscriptions.setdefault(subscription.channel, set()).add(subscription)
+            self.count += 1
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            subscriptions = self.subscriptions.get(subscription.channel, set())
+            if subscription in subscriptions:
+                subscriptions.discard(subscription)
+                self.count -= 1
+            if not subscriptions:
+                self.subscriptions.pop(subscription.channel, None)
+
+    # Whether publishing to the week can reach anyone, so saves nobody is watching skip the work
+    def listening(self, user_id, week_start_date):
+        return (
+            self.backend.shared
+            or self.channel(user_id, week_start_date) in self.subscriptions
+        )
+
+    def publish(self, user_id, week_start_date, message):
+        self.backend.publish(self.channel(user_id, week_start_date), message)
+
+    def deliver(self, channel, message):
+        with self.lock:
+            subscriptions = list(self.subscriptions.get(channel, ()))
+        for subscription in subscriptions:
+            try:
+                subscription.messages.put_nowait(message)
+            except queue.Full:
+                subscription.missed = True
+
+
+week_events = WeekEvents(
+    (
+        SharedPubSubBackend(redis_client())
+        if app.config["LIVE_SYNC_BACKEND"] == "redis"
+        else InProcessPubSubBackend()
+    ),
+    app.config["LIVE_SYNC_MAX_CONNECTIONS"],
+    app.config["LIVE_SYNC_QUEUE_SIZE"],
+)
+
+
+# Session store keeping sessions in the database, so every worker sees the same ones
+class DatabaseSessionStore:
+    def load(self, session_id):
+        row = db.session.execute(
+            select(StoredSession.data, StoredSession.expires_at).where(
+                StoredSession.session_id == session_id
+            )
+        ).first()
+        if row is None or row.expires_at < time.time():
+            return None
+        return row.data, row.expires_at
+
+    def save(self, session_id, data, expires_at):
+        # Whatever the view didn't commit gets rolled back at the end of the request anyway, and
+        # leaving it open would keep SQLite's write lock away from this write
+        db.session.rollback()
+        values = {"data": data, "expires_at": expires_at}
+        updated = db.session.execute(
+            update(StoredSession)
+            .where(StoredSession.session_id == session_id)
+            .values(**values)
+        )
+        if not updated.rowcount:
+            db.session.execute(
+                insert(StoredSession).values(session_id=session_id, **values)
             )
-            for i in range(1, 8)
-        ]
-        db.session.add_all(categories)
         db.session.commit()
 
-    # Fetch all tasks linked to the current calendar
-    tasks = Task.query.filter_by(calendar_id=calendar.calendar_id).all()
+    def delete(self, session_id):
+        db.session.rollback()
+        db.session.execute(
+            delete(StoredSession).where(StoredSession.session_id == session_id)
+        )
+        db.session.commit()
 
-    # Fetch all schedules for the current calendar
-    schedules = (
-        Schedule.query.join(Task)
-        .filter(Schedule.user_id == user_id, Task.calendar_id == calendar.calendar_id)
-        .all()
+    def sweep(self):
+        db.session.rollback()
+        swept = db.session.execute(
+            delete(StoredSession).where(StoredSession.expires_at < time.time())
+        ).rowcount
+        db.session.commit()
+        return swept
+
+
+# Session store on top of one of the cache backends, in memory for a single process or shared
+# through a Redis-compatible server with SharedCacheBackend(client, ttl=idle timeout)
+class CacheSessionStore:
+    def __init__(self, backend):
+        self.backend = backend
+
+    @staticmethod
+    def key(session_id):
+        return f"session:{session_id}"
+
+    def load(self, session_id):
+        entry = self.backend.get(self.key(session_id))
+        if entry is None or entry[1] < time.time():
+            return None
+        return entry
+
+    def save(self, session_id, data, expires_at):
+        self.backend.set(self.key(session_id), (data, expires_at))
+
+    def delete(self, session_id):
+        self.backend.delete(self.key(session_id))
+
+    def sweep(self):
+        self.backend.sweep()
+
+
+# The session as seen by the views, a dict that remembers whether it was changed
+class ServerSideSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, session_id=None, data=None, expires_at=0):
+        def on_update(self):
+            self.modified = True
+
+        super().__init__(initial, on_update)
+        self.session_id = session_id
+        self.data = data  # As it was loaded, to skip saving it when nothing changed
+        self.expires_at = expires_at
+        self.old_session_id = None
+        self.new = data is None
+        self.modified = False
+
+    # Gives the session a new id, on login and logout so an id known before can't be reused
+    def regenerate(self):
+        if not self.new:
+            self.old_session_id = self.session_id
+        self.session_id = secrets.token_urlsafe(32)
+        self.new = True
+        self.modified = True
+
+
+# Flask session interface keeping the session data on the server. The cookie is just the random
+# session id, and a session only gets written back when it changed or its expiry needs pushing
+class ServerSideSessionInterface(SessionInterface):
+    serializer = TaggedJSONSerializer()
+
+    def __init__(self, store, idle_timeout, refresh_interval, sweep_interval):
+        self.store = store
+        self.idle_timeout = idle_timeout
+        self.refresh_interval = refresh_interval
+        self.sweep_interval = sweep_interval
+        self.last_sweep = time.monotonic()
+
+    def open_session(self, app, request):
+        # Static files never use the session, no need to look it up for them
+        if request.path.startswith(f"{app.static_url_path}/"):
+            return self.make_null_session(app)
+
+        session_id = request.cookies.get(self.get_cookie_name(app))
+        if session_id:
+            stored = self.store.load(session_id)
+            if stored is not None:
+                data, expires_at = stored
+                return ServerSideSession(
+                    self.serializer.loads(data), session_id, data, expires_at
+                )
+        return ServerSideSession(session_id=secrets.token_urlsafe(32))
+
+    def save_session(self, app, session, response):
+        if not isinstance(session, ServerSideSession):
+            return
+
+        now = time.time()
+        if time.monotonic() - self.last_sweep > self.sweep_interval:
+            self.last_sweep = time.monotonic()
+            self.store.sweep()
+
+        if session.old_session_id:
+            self.store.delete(session.old_session_id)
+
+        cookie_name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if not session:
+            if not session.new:
+                self.store.delete(session.session_id)
+                response.delete_cookie(cookie_name, domain=domain, path=path)
+            return
+
+        response.vary.add("Cookie")
+        data = self.serializer.dumps(dict(session))
+        refresh_due = (
+            session.expires_at - now < self.idle_timeout - self.refresh_interval
+        )
+        if data == session.data and not refresh_due:
+            return
+        self.store.save(session.session_id, data, now + self.idle_timeout)
+
+        if session.new or session.permanent:
+            response.set_cookie(
+                cookie_name,
+                session.session_id,
+                expires=self.get_expiration_time(app, session),
+                httponly=self.get_cookie_httponly(app),
+                domain=domain,
+                path=path,
+                secure=self.get_cookie_secure(app),
+                samesite=self.get_cookie_samesite(app),
+            )
+
+
+if app.config["SESSION_STORE"] == "memory":
+    session_store = CacheSessionStore(
+        InProcessCacheBackend(
+            app.config["SESSION_MEMORY_MAX_ENTRIES"],
+            app.config["SESSION_IDLE_TIMEOUT"],
+        )
     )
+else:
+    session_store = DatabaseSessionStore()
+app.session_interface = ServerSideSessionInterface(
+    session_store,
+    app.config["SESSION_IDLE_TIMEOUT"],
+    app.config["SESSION_REFRESH_INTERVAL"],
+    app.config["SESSION_SWEEP_INTERVAL"],
+)
 
-    # Define days of the week and time slots, we can change these if we decided to
-    days_of_week = [
-        "Monday",
-        "Tuesday",
-        "Wednesday",
-        "Thursday",
-        "Friday",
-        "Saturday",
-        "Sunday",
-    ]
-    time_slots = [
-        "7 AM",
-        "8 AM",
-        "9 AM",
-        "10 AM",
-        "11 AM",
-        "12 PM",
-        "1 PM",
-        "2 PM",
-        "3 PM",
-        "4 PM",
-        "5 PM",
-        "6 PM",
-        "7 PM",
-        "8 PM",
-        "9 PM",
-    ]
 
-    # Preparing the dictionaries for easy lookup within our database
-    tasks_by_category = {}
-    for task in tasks:
-        if task.category_id:
-            tasks_by_category.setdefault(task.category_id, {})[task.slot_number] = task
+# Raised when too many password hashes are already waiting on the hashing pool
+class PasswordHasherBusy(Exception):
+    pass
 
-    tasks_by_day = {day: {} for day in days_of_week}
-    for task in tasks:
-        if task.assigned_day and task.slot_number:
-            tasks_by_day[task.assigned_day][task.slot_number] = task.task_name
 
-    time_schedule = {day: {} for day in days_of_week}
-    for schedule in schedules:
-        time_schedule[schedule.day_of_week][schedule.time_slot] = Task.query.get(
-            schedule.task_id
-        ).task_name
+# The cost settings of a hash method the way werkzeug fills them in, so "scrypt" and the
+# "scrypt:32768:8:1" it writes into the hash compare equal
+def hash_parameters(method):
+    name, *args = method.split(":")
+    if name == "scrypt":
+        return (name, *map(int, args or (2**15, 8, 1)))
+    if name == "pbkdf2" and len(args) <= 2:
+        hash_name = args[0] if args else "sha256"
+        iterations = int(args[1]) if len(args) == 2 else DEFAULT_PBKDF2_ITERATIONS
+        return (name, hash_name, iterations)
+    raise ValueError(f"Unknown password hash method {method!r}.")
+
+
+# Runs the CPU heavy password hashing in a bounded process pool, so a burst of logins can't take
+# over the request threads (and the GIL) the planner routes need. At most `workers` hashes run at
+# once, up to `max_queue` more can wait and anything past that is turned away right away
+class PasswordHasher:
+    def __init__(self, method, workers, max_queue):
+        self.method = method
+        self.parameters = hash_parameters(method)
+        self.workers = workers
+        self.slots = threading.BoundedSemaphore(max(workers, 1) + max_queue)
+        self.lock = threading.Lock()
+        self.executor = None
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+
+    def run(self, function, *args):
+        if not self.slots.acquire(blocking=False):
+            with self.lock:
+                self.rejected += 1
+            raise PasswordHasherBusy()
+
+        with self.lock:
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            # The pool gets started on first use so importing the app stays cheap
+            if self.workers and self.executor is None:
+                self.executor = ProcessPoolExecutor(max_workers=self.workers)
+        try:
+            if not self.workers:
+                return function(*args)  # No pool configured, hash on the request thread
+            return self.executor.submit(function, *args).result()
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+                self.completed += 1
+            self.slots.release()
+
+    def hash(self, password):
+        return self.run(generate_password_hash, password, self.method)
+
+    def check(self, password_hash, password):
+        return self.run(check_password_hash, password_hash, password)
+
+    # Hashes made with other cost settings get upgraded the next time the user logs in
+    def needs_rehash(self, password_hash):
+        try:
+            return hash_parameters(password_hash.split("$", 1)[0]) != self.parameters
+        except ValueError:
+            return True
+
+    def stats(self):
+        with self.lock:
+            return {
+                "workers": self.workers,
+                "in_flight": self.in_flight,
+                "queue_depth": max(self.in_flight - self.workers, 0),
+                "peak_in_flight": self.peak_in_flight,
+                "completed": self.completed,
+                "rejected": self.rejected,
+            }
+
+
+password_hasher = PasswordHasher(
+    app.config["PASSWORD_HASH_METHOD"],
+    app.config["PASSWORD_HASH_WORKERS"],
+    app.config["PASSWORD_HASH_MAX_QUEUE"],
+)
+
+
+# Short content hash of a file, used to version the page and the static assets
+@functools.lru_cache(maxsize=None)
+def file_hash(path):
+    with open(path, "rb") as file:
+        return hashlib.sha256(file.read()).hexdigest()[:12]
+
+
+# Static files get their content hash in the URL so browsers can keep them for a long time
+@app.url_defaults
+def add_static_file_hash(endpoint, values):
+    if endpoint == "static" and "filename" in values:
+        values["v"] = file_hash(os.path.join(app.static_folder, values["filename"]))
+
+
+# Short hash over all the static files, pages that link to them change whenever one of them does
+@functools.lru_cache(maxsize=None)
+def static_files_hash():
+    digest = hashlib.sha256()
+    for root, dirs, names in os.walk(app.static_folder):
+        dirs.sort()
+        for name in sorted(names):
+            path = os.path.join(root, name)
+            digest.update(os.path.relpath(path, app.static_folder).encode())
+            digest.update(file_hash(path).encode())
+    return digest.hexdigest()[:12]
+
+
+# Only a URL with the file's current hash can be kept for good, any other version of the URL gets
+# revalidated like an unversioned one
+@app.after_request
+def cache_hashed_static_files(response):
+    if (
+        request.endpoint == "static"
+        and request.args.get("v")
+        and response.status_code in (200, 304)
+    ):
+        path = safe_join(app.static_folder, request.view_args["filename"])
+        if path and request.args["v"] == file_hash(path):
+            response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    return response
+
+
+# Histogram in the Prometheus format, one set of buckets per label value (the route)
+class Histogram:
+    def __init__(self, name, description, buckets):
+        self.name = name
+        self.description = description
+        self.buckets = buckets
+        self.series = {}  # label -> [bucket counts..., sum, count]
+        self.lock = threading.Lock()
+
+    def observe(self, label, value):
+        with self.lock:
+            series = self.series.setdefault(label, [0] * len(self.buckets) + [0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self, label_name):
+        lines = [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} histogram",
+        ]
+        with self.lock:
+            for label, series in sorted(self.series.items()):
+                for bound, count in zip(self.buckets, series):
+                    lines.append(
+                        f'{self.name}_bucket{{{label_name}="{label}",le="{bound}"}} {count}'
+                    )
+                lines.append(
+                    f'{self.name}_bucket{{{label_name}="{label}",le="+Inf"}} {series[-1]}'
+                )
+                lines.append(f'{self.name}_sum{{{label_name}="{label}"}} {series[-2]}')
+                lines.append(
+                    f'{self.name}_count{{{label_name}="{label}"}} {series[-1]}'
+                )
+        return lines
+
+
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+# Per route histograms of where each request's time went, kept per worker process
+request_histograms = {
+    "wall_time": Histogram(
+        "schedulify_request_duration_seconds",
+        "Time spent handling the request.",
+        SECONDS_BUCKETS,
+    ),
+    "sql_count": Histogram(
+        "schedulify_request_sql_statements",
+        "SQL statements run by the request.",
+        (0, 1, 2, 4, 8, 16, 32, 64, 128),
+    ),
+    "sql_time": Histogram(
+        "schedulify_request_sql_duration_seconds",
+        "Time the request spent running SQL statements.",
+        SECONDS_BUCKETS,
+    ),
+    "render_time": Histogram(
+        "schedulify_request_template_duration_seconds",
+        "Time the request spent rendering templates.",
+        SECONDS_BUCKETS,
+    ),
+    "response_size": Histogram(
+        "schedulify_response_size_bytes",
+        "Size of the response body.",
+        (256, 1024, 4096, 16384, 65536, 262144, 1048576),
+    ),
+}
+
+# Only one request can be under cProfile at a time, the profiler hooks into the whole interpreter
+profiler_lock = threading.Lock()
+
+# The profile of the request the current thread is working on, if it's being profiled
+current_profile = contextvars.ContextVar("current_profile", default=None)
+
+
+# Everything recorded about one request while it runs
+class RequestProfile:
+    def __init__(self, environ):
+        self.method = environ.get("REQUEST_METHOD")
+        self.path = environ.get("PATH_INFO")
+        self.endpoint = "unmatched"
+        self.started_at = time.perf_counter()
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.render_time = 0.0
+        self.render_started_at = 0.0
+        self.size = 0
+        self.finished = False
+        self.profiler = None
+        self.profiling = False
+
+        sampled = random.random() < app.config["PROFILE_SAMPLE_RATE"]
+        if sampled and profiler_lock.acquire(blocking=False):
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+                self.profiler = profiler
+                self.profiling = True
+            except ValueError:
+                # Some other profiler (a debugger or coverage) is already hooked in
+                profiler_lock.release()
+
+    # The profiler only covers the view itself, so a body that never gets sent can't hold on to it
+    def stop_profiler(self):
+        if self.profiling:
+            self.profiling = False
+            self.profiler.disable()
+            profiler_lock.release()
+
+    def finish(self):
+        if self.finished:
+            return
+        self.finished = True
+        wall_time = time.perf_counter() - self.started_at
+        self.stop_profiler()
+
+        request_histograms["wall_time"].observe(self.endpoint, wall_time)
+        request_histograms["sql_count"].observe(self.endpoint, self.sql_count)
+        request_histograms["sql_time"].observe(self.endpoint, self.sql_time)
+        request_histograms["render_time"].observe(self.endpoint, self.render_time)
+        request_histograms["response_size"].observe(self.endpoint, self.size)
+
+        if wall_time * 1000 < app.config["PROFILE_SLOW_REQUEST_MS"]:
+            return
+        app.logger.warning(
+            "Slow request %s %s: %.1f ms, %d SQL statements in %.1f ms, templates %.1f ms",
+            self.method,
+            self.path,
+            wall_time * 1000,
+            self.sql_count,
+            self.sql_time * 1000,
+            self.render_time * 1000,
+        )
+        if self.profiler is not None:
+            os.makedirs(app.config["PROFILE_DIR"], exist_ok=True)
+            self.profiler.dump_stats(
+                os.path.join(
+                    app.config["PROFILE_DIR"],
+                    f"{self.endpoint}-{time.time_ns() // 1000}-{os.getpid()}.prof",
+                )
+            )
+
+
+# Response body of a profiled request, streamed bodies keep counting until they're sent
+class ProfiledBody:
+    def __init__(self, body, profile):
+        self.body = body
+        self.profile = profile
+
+    def __iter__(self):
+        chunks = iter(self.body)
+        while True:
+            token = current_profile.set(self.profile)
+            try:
+                chunk = next(chunks)
+            except StopIteration:
+                self.profile.finish()
+                return
+            finally:
+                current_profile.reset(token)
+            self.profile.size += len(chunk)
+            yield chunk
+
+    def close(self):
+        token = current_profile.set(self.profile)
+        try:
+            if hasattr(self.body, "close"):
+                self.body.close()
+        finally:
+            current_profile.reset(token)
+            self.profile.finish()
+
+
+# Request profiling middleware, off unless PROFILING is set. It wraps the whole request (session
+# loading and saving and streamed bodies included) and records its wall time, SQL statements,
+# template time and response size in the histograms above. A sample of the requests also runs
+# under cProfile so the slow ones can be dumped for a closer look
+class ProfilingMiddleware:
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        if not app.config["PROFILING"]:
+            return self.wsgi_app(environ, start_response)
+
+        profile = RequestProfile(environ)
+        token = current_profile.set(profile)
+        try:
+            body = self.wsgi_app(environ, start_response)
+        except BaseException:
+            profile.finish()
+            raise
+        finally:
+            profile.stop_profiler()
+            current_profile.reset(token)
+        return ProfiledBody(body, profile)
+
+
+app.wsgi_app = ProfilingMiddleware(app.wsgi_app)
+
+
+# Tagging the profile with the route that handled it
+@app.before_request
+def tag_request_profile():
+    profile = current_profile.get()
+    if profile is not None:
+        profile.endpoint = request.endpoint or "unmatched"
+
+
+# Timing every SQL statement run for a profiled request
+@event.listens_for(Engine, "before_cursor_execute")
+def start_statement_timer(conn, cursor, statement, parameters, context, executemany):
+    if current_profile.get() is not None:
+        conn.info.setdefault("statement_started_at", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def record_statement_time(conn, cursor, statement, parameters, context, executemany):
+    profile = current_profile.get()
+    started_at = conn.info.get("statement_started_at")
+    if profile is not None and started_at:
+        profile.sql_count += 1
+        profile.sql_time += time.perf_counter() - started_at.pop()
+
+
+# Timing the template rendering of a profiled request
+@before_render_template.connect_via(app)
+def start_render_timer(sender, template, context, **extra):
+    profile = current_profile.get()
+    if profile is not None:
+        profile.render_started_at = time.perf_counter()
+
+
+@template_rendered.connect_via(app)
+def record_render_time(sender, template, context, **extra):
+    profile = current_profile.get()
+    if profile is not None:
+        profile.render_time += time.perf_counter() - profile.render_started_at
+
+
+# Token buckets kept in the worker, the least recently seen clients get dropped past max_clients
+# (their buckets would have been full again by then anyway)
+class InProcessRateLimitBackend:
+    def __init__(self, max_clients=100000):
+        self.max_clients = max_clients
+        self.buckets = OrderedDict()  # key -> (tokens, updated_at)
+        self.lock = threading.Lock()
+
+    # Takes a token from the bucket, returns 0 if there was one or else the seconds until there is
+    def take(self, key, capacity, refill_rate):
+        now = time.monotonic()
+        with self.lock:
+            tokens, updated_at = self.buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated_at) * refill_rate)
+            if tokens >= 1:
+                tokens -= 1
+                retry_after = 0
+            else:
+                retry_after = (1 - tokens) / refill_rate
+            self.buckets[key] = (tokens, now)
+            self.buckets.move_to_end(key)
+            while len(self.buckets) > self.max_clients:
+                self.buckets.popitem(last=False)
+        return retry_after
+
+
+# Token buckets shared between workers, works with any Redis-compatible client (eval). The bucket
+# gets updated by a script on the server so concurrent workers can't both take the last token,
+# and the server's clock is used so the workers' clocks don't have to agree
+class SharedRateLimitBackend:
+    SCRIPT = """
+        local capacity = tonumber(ARGV[1])
+        local refill_rate = tonumber(ARGV[2])
+        local time = redis.call("TIME")
+        local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+        local bucket = redis.call("HMGET", KEYS[1], "tokens", "updated_at")
+        local tokens = tonumber(bucket[1]) or capacity
+        local updated_at = tonumber(bucket[2]) or now
+        tokens = math.min(capacity, tokens + math.max(now - updated_at, 0) * refill_rate)
+        local retry_after = 0
+        if tokens >= 1 then
+            tokens = tokens - 1
+        else
+            retry_after = (1 - tokens) / refill_rate
+        end
+        redis.call("HSET", KEYS[1], "tokens", tokens, "updated_at", now)
+        redis.call("EXPIRE", KEYS[1], math.ceil(capacity / refill_rate) + 1)
+        return tostring(retry_after)
+    """
+
+    def __init__(self, client, prefix="rate-limit:"):
+        self.client = client
+        self.prefix = prefix
+
+    def take(self, key, capacity, refill_rate):
+        # Numbers come back from scripts as integers, so the wait comes back as a string
+        return float(
+            self.client.eval(self.SCRIPT, 1, self.prefix + key, capacity, refill_rate)
+        )
+
+
+# Per client and route token bucket limiter, counts what it let through and what it turned away
+class RateLimiter:
+    def __init__(self, backend):
+        self.backend = backend
+        self.lock = threading.Lock()
+        self.allowed = 0
+        self.limited = {}  # endpoint -> requests turned away
+
+    # Returns 0 if the request can go ahead or else the seconds until it could
+    def check(self, endpoint, client, requests, seconds):
+        retry_after = self.backend.take(
+            f"{endpoint}:{client}", requests, requests / seconds
+        )
+        with self.lock:
+            if retry_after:
+                self.limited[endpoint] = self.limited.get(endpoint, 0) + 1
+            else:
+                self.allowed += 1
+        return retry_after
+
+    def stats(self):
+        with self.lock:
+            return {"allowed": self.allowed, "limited": dict(self.limited)}
+
+
+rate_limiter = RateLimiter(
+    SharedRateLimitBackend(redis_client())
+    if app.config["RATE_LIMIT_BACKEND"] == "redis"
+    else InProcessRateLimitBackend(app.config["RATE_LIMIT_MAX_CLIENTS"])
+)
+
+
+# Write slots counted in the worker, so the cap holds per worker process
+class InProcessWriteSlots:
+    def __init__(self, max_concurrency):
+        self.slots = threading.BoundedSemaphore(max_concurrency)
+
+    # Takes a slot, waiting up to timeout seconds (None waits for good). Returns it, or None
+    def acquire(self, timeout):
+        return True if self.slots.acquire(timeout=timeout) else None
+
+    def release(self, slot):
+        self.slots.release()
+
+
+# Write slots shared by every worker on the machine, one lock file per slot. Holding a slot is
+# holding the lock on its file, which goes away with the worker if it dies holding it. A file
+# locked in this process doesn't stop it locking the file again, so it remembers its own slots
+class FileLockWriteSlots:
+    def __init__(self, directory, max_concurrency, poll_interval=0.005):
+        self.directory = directory
+        self.max_concurrency = max_concurrency
+        self.poll_interval = poll_interval
+        self.lock = threading.Lock()
+        self.files = {}  # slot -> lock file
+        self.held = set()
+        self.pid = None
+
+    def try_acquire(self):
+        with self.lock:
+            # Files opened before a fork would share their locks with the parent
+            if self.pid != os.getpid():
+                self.files, self.held, self.pid = {}, set(), os.getpid()
+            for slot in range(self.max_concurrency):
+                if slot in self.held:
+                    continue
+                if slot not in self.files:
+                    os.makedirs(self.directory, exist_ok=True)
+                    self.files[slot] = open(
+                        os.path.join(self.directory, f"slot-{slot}"), "a"
+                    )
+                try:
+                    fcntl.flock(self.files[slot], fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue
+                self.held.add(slot)
+                return slot
+        return None
+
+    def acquire(self, timeout):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            slot = self.try_acquire()
+            if slot is not None or deadline is not None and time.monotonic() > deadline:
+                return slot
+            time.sleep(self.poll_interval)
+
+    def release(self, slot):
+        with self.lock:
+            fcntl.flock(self.files[slot], fcntl.LOCK_UN)
+            self.held.discard(slot)
+
+
+# Caps the write transactions running at once, through one of the write slot backends above.
+# SQLite only lets one write through at a time, so a pile of writers just waits on the lock until
+# they time out. Turning the extra ones away right away keeps the wait of the admitted ones short
+class WriteAdmission:
+    def __init__(self, slots, queue_timeout):
+        self.slots = slots
+        self.queue_timeout = queue_timeout
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.admitted = 0
+        self.rejected = 0
+
+    # Waits for a slot, for up to the queue timeout unless wait is set. Returns the slot to release
+    # afterwards, or None if it got none
+    def acquire(self, wait=False):
+        slot = self.slots.acquire(None if wait else self.queue_timeout)
+        with self.lock:
+            if slot is None:
+                self.rejected += 1
+                return None
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            self.admitted += 1
+        return slot
+
+    def release(self, slot):
+        with self.lock:
+            self.in_flight -= 1
+        self.slots.release(slot)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "in_flight": self.in_flight,
+                "peak_in_flight": self.peak_in_flight,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+            }
+
+
+write_admission = WriteAdmission(
+    (
+        FileLockWriteSlots(
+            app.config["WRITE_SLOTS_DIR"], app.config["WRITE_MAX_CONCURRENCY"]
+        )
+        if app.config["WRITE_ADMISSION"] == "file" and fcntl is not None
+        else InProcessWriteSlots(app.config["WRITE_MAX_CONCURRENCY"])
+    ),
+    app.config["WRITE_QUEUE_TIMEOUT"],
+)
+
+# Routes that run a write transaction (for the methods that aren't GET). Signup and login only
+# write a row after hashing, the hashing pool already bounds them
+WRITE_ENDPOINTS = {
+    "update_categories_and_tasks",
+    "assign_task_to_day",
+    "schedule_task_time_slot",
+    "patch_week_cells",
+    "recurring_tasks",
+    "delete_recurring_task",
+    "import_planner",
+}
+PLANNER_FORM_ENDPOINTS = {
+    "update_categories_and_tasks",
+    "assign_task_to_day",
+    "schedule_task_time_slot",
+}
+
+
+# Answers a request that was turned away. Login and signup show their page again with the
+# message, the planner forms get it as plain text and the API routes as JSON
+def refuse_request(status, message, retry_after):
+    headers = {"Retry-After": str(max(math.ceil(retry_after), 1))}
+    if request.endpoint in ("login", "signup"):
+        flash(message, "danger")
+        return render_template(f"{request.endpoint}.html"), status, headers
+    if request.endpoint in PLANNER_FORM_ENDPOINTS:
+        return message, status, headers
+    return jsonify(error=message), status, headers
+
+
+# Rate limiting and write admission, before the route does any work
+@app.before_request
+def admit_request():
+    if request.method in ("GET", "HEAD", "OPTIONS"):
+        return None
+
+    budget = app.config["RATE_LIMITS"].get(request.endpoint)
+    if budget and app.config["RATE_LIMITING"]:
+        user_id = session.get("user_id")
+        client = f"user:{user_id}" if user_id else f"ip:{request.remote_addr}"
+        retry_after = rate_limiter.check(request.endpoint, client, *budget)
+        if retry_after:
+            return refuse_request(
+                429, "Too many requests. Please slow down a little.", retry_after
+            )
+
+    if request.endpoint in WRITE_ENDPOINTS:
+        g.write_slot = write_admission.acquire()
+        if g.write_slot is None:
+            return refuse_request(
+                503, "We're a little busy right now. Please try again.", 1
+            )
+    return None
+
+
+@app.teardown_request
+def release_write_slot(exception):
+    slot = g.pop("write_slot", None)
+    if slot is not None:
+        write_admission.release(slot)
+
+
+# Prometheus endpoint with the request histograms and the counters of the caches, the password
+# pool, the rate limits and the write admission, only there while profiling is on. Every worker process reports its own numbers
+@app.route("/metrics")
+def metrics():
+    if not app.config["PROFILING"]:
+        return "Not found", 404
+
+    lines = []
+    for histogram in request_histograms.values():
+        lines.extend(histogram.render("endpoint"))
+
+    counters = {
+        "schedulify_week_cache_hits_total": ("Week page cache hits.", week_cache.hits),
+        "schedulify_week_cache_misses_total": (
+            "Week page cache misses.",
+            week_cache.misses,
+        ),
+    }
+    autosave = autosave_queue.stats()
+    counters["schedulify_autosave_cells_received_total"] = (
+        "Autosaved cell edits received.",
+        autosave["received"],
+    )
+    counters["schedulify_autosave_cells_written_total"] = (
+        "Autosaved cells written after coalescing.",
+        autosave["written"],
+    )
+    counters["schedulify_autosave_flushes_total"] = (
+        "Autosave queue flushes.",
+        autosave["flushes"],
+    )
+    counters["schedulify_autosave_retries_total"] = (
+        "Autosaved weeks put back in the queue to try again.",
+        autosave["retries"],
+    )
+    counters["schedulify_autosave_failures_total"] = (
+        "Autosaved weeks dropped because they can't be written.",
+        autosave["failures"],
+    )
+    stats = password_hasher.stats()
+    counters["schedulify_password_hashes_total"] = (
+        "Password hashes and checks done.",
+        stats["completed"],
+    )
+    counters["schedulify_password_hashes_rejected_total"] = (
+        "Password hashes turned away because the pool was full.",
+        stats["rejected"],
+    )
+    writes = write_admission.stats()
+    counters["schedulify_writes_admitted_total"] = (
+        "Write requests let through.",
+        writes["admitted"],
+    )
+    counters["schedulify_writes_rejected_total"] = (
+        "Write requests turned away because too many writes were running.",
+        writes["rejected"],
+    )
+    for name, (description, value) in counters.items():
+        lines += [
+            f"# HELP {name} {description}",
+            f"# TYPE {name} counter",
+            f"{name} {value}",
+        ]
+
+    # Requests turned away by the rate limits, per route
+    limits = rate_limiter.stats()
+    lines += [
+        "# HELP schedulify_rate_limited_total Requests turned away by the rate limits.",
+        "# TYPE schedulify_rate_limited_total counter",
+    ]
+    lines += [
+        f'schedulify_rate_limited_total{{endpoint="{endpoint}"}} {count}'
+        for endpoint, count in sorted(limits["limited"].items())
+    ]
+
+    gauges = {
+        "schedulify_autosave_queue_depth": (
+            "Autosaved cells waiting to be written.",
+            autosave["depth"],
+        ),
+        "schedulify_autosave_coalescing_ratio": (
+            "Autosaved cell edits received per cell written.",
+            autosave["coalescing_ratio"],
+        ),
+        "schedulify_password_hash_in_flight": (
+            "Password hashes running or waiting.",
+            stats["in_flight"],
+        ),
+        "schedulify_password_hash_queue_depth": (
+            "Password hashes waiting for a worker.",
+            stats["queue_depth"],
+        ),
+        "schedulify_writes_in_flight": (
+            "Write requests running in this worker.",
+            writes["in_flight"],
+        ),
+    }
+    for name, (description, value) in gauges.items():
+        lines += [
+            f"# HELP {name} {description}",
+            f"# TYPE {name} gauge",
+            f"{name} {value}",
+        ]
+
+    return Response("\n".join(lines) + "\n", mimetype="text/plain; version=0.0.4")
+
+
+# The week page's ETag, changes whenever the week gets written to, the page template changes or
+# the static files it links to (with their hashes in the URLs) do
+def week_etag(user_id, week_start_date, version):
+    page_version = file_hash(
+        os.path.join(app.root_path, app.template_folder, "index.html")
+    )
+    return f"{page_version}.{static_files_hash()}-{user_id}-{week_start_date}-{version}"
+
+
+# Bumps the week's version so browsers holding the old page fetch it again
+def bump_week_version(calendar):
+    calendar.version = Calendar.version + 1
+
+
+# The hour grid of a week can be stored as one Schedule row per filled cell ("rows") or packed
+# into the calendar itself ("grid"): one little-endian uint32 task id per day x time slot, with 0
+# for an empty cell. New writes use the configured format and `flask convert-schedules` moves
+# the existing weeks over
+SCHEDULE_GRID_FORMAT = f"<{len(DAYS_OF_WEEK) * len(TIME_SLOTS)}I"
+
+# A stored cell of the packed grid, looks like the rows the Schedule queries return
+StoredCell = namedtuple("StoredCell", ["task_id", "task_name"])
+
+
+def encode_schedule_grid(grid):
+    task_ids = [0] * (len(DAYS_OF_WEEK) * len(TIME_SLOTS))
+    for (day, time_slot), task_id in grid.items():
+        task_ids[
+            DAYS_OF_WEEK.index(day) * len(TIME_SLOTS) + TIME_SLOTS.index(time_slot)
+        ] = task_id
+    return struct.pack(SCHEDULE_GRID_FORMAT, *task_ids)
+
+
+def decode_schedule_grid(blob):
+    task_ids = struct.unpack(SCHEDULE_GRID_FORMAT, blob)
+    return {
+        (day, time_slot): task_ids[d * len(TIME_SLOTS) + t]
+        for d, day in enumerate(DAYS_OF_WEEK)
+        for t, time_slot in enumerate(TIME_SLOTS)
+        if task_ids[d * len(TIME_SLOTS) + t]
+    }
+
+
+# Moves a calendar's hour grid to the given storage format (the configured one by default)
+def convert_schedule_storage(calendar, storage=None):
+    storage = storage or app.config["SCHEDULE_STORAGE"]
+    if storage == "grid" and calendar.schedule_grid is None:
+        rows = (
+            db.session.query(
+                Schedule.schedule_id,
+                Schedule.day_of_week,
+                Schedule.time_slot,
+                Schedule.task_id,
+            )
+            .join(Task, Schedule.task_id == Task.task_id)
+            .filter(
+                Schedule.user_id == calendar.user_id,
+                Task.calendar_id == calendar.calendar_id,
+            )
+            .all()
+        )
+        if rows:
+            db.session.execute(
+                delete(Schedule).where(
+                    Schedule.schedule_id.in_([row.schedule_id for row in rows])
+                )
+            )
+        calendar.schedule_grid = encode_schedule_grid(
+            {(row.day_of_week, row.time_slot): row.task_id for row in rows}
+        )
+    elif storage == "rows" and calendar.schedule_grid is not None:
+        grid = decode_schedule_grid(calendar.schedule_grid)
+        if grid:
+            db.session.execute(
+                insert(Schedule),
+                [
+                    {
+                        "user_id": calendar.user_id,
+                        "task_id": task_id,
+                        "day_of_week": day,
+                        "time_slot": time_slot,
+                    }
+                    for (day, time_slot), task_id in grid.items()
+                ],
+            )
+        calendar.schedule_grid = None
+
+
+# The categories every week starts out with
+def default_categories(user_id, calendar_id=None):
+    return [
+        Category(
+            user_id=user_id,
+            calendar_id=calendar_id,
+            category_name=f"Category {i}",
+        )
+        for i in range(1, CATEGORIES_PER_WEEK + 1)
+    ]
+
+
+# What the planner page shows for a week that was never edited, built without touching the database
+def empty_week(user_id):
+    return {
+        "calendar_id": None,
+        "version": 0,
+        "categories": [
+            {"category_id": None, "category_name": category.category_name}
+            for category in default_categories(user_id)
+        ],
+        "tasks_by_category": {},
+        "tasks_by_day": {day: {} for day in DAYS_OF_WEEK},
+        "time_schedule": {day: {} for day in DAYS_OF_WEEK},
+        "recurring": [],
+        "archived": False,
+    }
+
+
+# Raised when saving to a week that was moved into the archive
+class WeekArchived(Exception):
+    pass
+
+
+# Gets the calendar for the week, new weeks only get saved here on their first real write. It's
+# always looked up by user and week (one lookup on their unique index), a calendar id kept from an
+# earlier request could belong to a week that got pruned since, and its id to someone else's week
+def get_or_create_calendar(user_id, week_start_date):
+    calendar = Calendar.query.filter_by(user_id=user_id, date=week_start_date).first()
+    if not calendar:
+        # Archived weeks are read-only
+        if db.session.scalar(
+            select(ArchivedWeek.archived_week_id).where(
+                ArchivedWeek.user_id == user_id, ArchivedWeek.date == week_start_date
+            )
+        ):
+            raise WeekArchived()
+        # Two first saves of the week can get here at once (two tabs, an autosave and a form),
+        # the second insert does nothing and both go on with the same week
+        db.session.execute(
+            sqlite_insert(Calendar)
+            .values(user_id=user_id, date=week_start_date)
+            .on_conflict_do_nothing(index_elements=["user_id", "date"])
+        )
+        calendar = Calendar.query.filter_by(user_id=user_id, date=week_start_date).one()
+    return calendar
+
+
+# Fetch the categories of a calendar that is about to be edited
+def load_categories(user_id, calendar):
+    categories = (
+        Category.query.filter_by(user_id=user_id, calendar_id=calendar.calendar_id)
+        .order_by(Category.category_id)
+        .all()
+    )
+
+    # If there are no categories, this where create default ones (Good find Corey <3)
+    if not categories:
+        categories = default_categories(user_id, calendar.calendar_id)
+        db.session.add_all(categories)
+        db.session.flush()
+    return categories
+
+
+# Builds the planner page's view model for one calendar week out of its rows, schedules are
+# (day_of_week, time_slot, task_name) and only needed for weeks stored as Schedule rows. The
+# result is plain data so it can be cached between requests
+def build_week(calendar, categories, tasks, schedules=()):
+    # Weeks saved before the categories were, show the defaults until the first edit saves them
+    if not categories:
+        categories = default_categories(calendar.user_id, calendar.calendar_id)
+
+    if calendar.schedule_grid is not None:
+        # Packed weeks already have everything, the names come from the week's tasks
+        task_names = {task.task_id: task.task_name for task in tasks}
+        schedules = [
+            (day_of_week, time_slot, task_names[task_id])
+            for (day_of_week, time_slot), task_id in decode_schedule_grid(
+                calendar.schedule_grid
+            ).items()
+            if task_id in task_names
+        ]
+
+    # Preparing the dictionaries for easy lookup within our database
+    tasks_by_category = {}
+    for task in tasks:
+        if task.category_id:
+            tasks_by_category.setdefault(task.category_id, {})[task.slot_number] = {
+                "task_id": task.task_id,
+                "task_name": task.task_name,
+            }
+
+    tasks_by_day = {day: {} for day in DAYS_OF_WEEK}
+    for task in tasks:
+        if task.assigned_day and task.slot_number:
+            tasks_by_day[task.assigned_day][task.slot_number] = task.task_name
+
+    time_schedule = {day: {} for day in DAYS_OF_WEEK}
+    for day_of_week, time_slot, task_name in schedules:
+        time_schedule[day_of_week][time_slot] = task_name
+
+    return {
+        "calendar_id": calendar.calendar_id,
+        "version": calendar.version,
+        "categories": [
+            {
+                "category_id": category.category_id,
+                "category_name": category.category_name,
+            }
+            for category in categories
+        ],
+        "tasks_by_category": tasks_by_category,
+        "tasks_by_day": tasks_by_day,
+        "time_schedule": time_schedule,
+        "recurring": [],
+        "archived": False,
+    }
+
+
+# Packs the rows of a week for the archive: the calendar, its categories, its tasks and its hour
+# cells as (day_of_week, time_slot, task_id). The rows are kept as they were so exports stay complete
+def pack_week(calendar, categories, tasks, schedules):
+    return zlib.compress(
+        json.dumps(
+            {
+                "calendar": [calendar.calendar_id, calendar.version],
+                "categories": [
+                    [category.category_id, category.category_name]
+                    for category in categories
+                ],
+                "tasks": [
+                    [
+                        task.task_id,
+                        task.category_id,
+                        task.task_name,
+                        task.assigned_day,
+                        task.time_slot,
+                        task.slot_number,
+                    ]
+                    for task in tasks
+                ],
+                "schedules": [list(schedule) for schedule in schedules],
+            }
+        ).encode()
+    )
+
+
+# Unpacks an archived week back into (calendar, categories, tasks, schedules), the rows look
+# like the models as far as build_week() and the exports are concerned
+def unpack_week(archived_week):
+    packed = json.loads(zlib.decompress(archived_week.data))
+    calendar_id, version = packed["calendar"]
+    calendar = SimpleNamespace(
+        calendar_id=calendar_id,
+        user_id=archived_week.user_id,
+        date=archived_week.date,
+        version=version,
+        schedule_grid=None,
+    )
+    categories = [
+        SimpleNamespace(
+            category_id=category_id,
+            calendar_id=calendar_id,
+            category_name=category_name,
+        )
+        for category_id, category_name in packed["categories"]
+    ]
+    tasks = [
+        SimpleNamespace(
+            task_id=task_id,
+            calendar_id=calendar_id,
+            category_id=category_id,
+            task_name=task_name,
+            assigned_day=assigned_day,
+            time_slot=time_slot,
+            slot_number=slot_number,
+        )
+        for task_id, category_id, task_name, assigned_day, time_slot, slot_number in packed[
+            "tasks"
+        ]
+    ]
+    schedules = [tuple(schedule) for schedule in packed["schedules"]]
+    return calendar, categories, tasks, schedules
+
+
+# Builds the view model of an archived week. It has no calendar to save to, the page shows it read-only
+def build_archived_week(archived_week):
+    calendar, categories, tasks, schedules = unpack_week(archived_week)
+    task_names = {task.task_id: task.task_name for task in tasks}
+    week = build_week(
+        calendar,
+        categories,
+        tasks,
+        [
+            (day_of_week, time_slot, task_names[task_id])
+            for day_of_week, time_slot, task_id in schedules
+            if task_id in task_names
+        ],
+    )
+    week["calendar_id"] = None
+    week["archived"] = True
+    return week
+
+
+# Loads everything the planner page needs for one calendar week in a fixed number of queries
+# (categories, tasks and schedules), no matter how full the grid is
+def load_week(user_id, calendar):
+    categories = (
+        Category.query.filter_by(user_id=user_id, calendar_id=calendar.calendar_id)
+        .order_by(Category.category_id)
+        .all()
+    )
+
+    # Fetch all tasks linked to the calendar in one go
+    tasks = Task.query.filter_by(calendar_id=calendar.calendar_id).all()
+
+    # Fetch the schedules together with their task names in a single joined query
+    schedules = []
+    if calendar.schedule_grid is None:
+        schedules = (
+            db.session.query(Schedule.day_of_week, Schedule.time_slot, Task.task_name)
+            .join(Task, Schedule.task_id == Task.task_id)
+            .filter(
+                Schedule.user_id == user_id, Task.calendar_id == calendar.calendar_id
+            )
+            .all()
+        )
+
+    return build_week(calendar, categories, tasks, schedules)
+
+
+# One occurrence of a recurring task in a week
+RecurringInstance = namedtuple(
+    "RecurringInstance", ["recurring_task_id", "date", "task_name"]
+)
+
+
+# Loads the user's recurring tasks that can show up between two Mondays, along with their
+# exceptions in that range as {(recurring_task_id, date): task_name or None}
+def load_recurring(user_id, from_date, to_date):
+    rules = RecurringTask.query.filter(
+        RecurringTask.user_id == user_id,
+        RecurringTask.start_date <= to_date,
+        or_(RecurringTask.end_date.is_(None), RecurringTask.end_date >= from_date),
+    ).all()
+    exceptions = {}
+    if rules:
+        exceptions = {
+            (row.recurring_task_id, row.date): row.task_name
+            for row in db.session.query(
+                RecurringException.recurring_task_id,
+                RecurringException.date,
+                RecurringException.task_name,
+            ).filter(
+                RecurringException.recurring_task_id.in_(
+                    [rule.recurring_task_id for rule in rules]
+                ),
+                RecurringException.date >= from_date,
+                RecurringException.date <= to_date + datetime.timedelta(days=6),
+            )
+        }
+    return rules, exceptions
+
+
+# Works out which cells the recurring tasks fill in one week, nothing gets stored for them. Returns
+# the day task cells {(day, slot_number): instance} and hour cells {(day, time_slot): instance}
+def expand_recurring(rules, exceptions, week_start_date):
+    day_tasks, schedule = {}, {}
+    for rule in rules:
+        weeks = (week_start_date - rule.start_date).days // 7
+        # Rules imported before imports were checked can have an interval of 0
+        if weeks < 0 or rule.interval_weeks < 1 or weeks % rule.interval_weeks:
+            continue
+        if rule.end_date is not None and week_start_date > rule.end_date:
+            continue
+        for i, day in enumerate(DAYS_OF_WEEK):
+            if not rule.days & (1 << i):
+                continue
+            date = week_start_date + datetime.timedelta(days=i)
+            task_name = exceptions.get((rule.recurring_task_id, date), rule.task_name)
+            if not task_name:
+                continue  # This occurrence was skipped
+            instance = RecurringInstance(rule.recurring_task_id, date, task_name)
+            if rule.time_slot:
+                schedule.setdefault((day, rule.time_slot), instance)
+            else:
+                day_tasks.setdefault((day, rule.slot_number), instance)
+    return day_tasks, schedule
+
+
+# Fills the recurring tasks into a week's view model. Cells the user typed something into for
+# that week win, and the recurring ones get listed by input name so the page can mark them
+def apply_recurring(week, rules, exceptions, week_start_date):
+    day_tasks, schedule = expand_recurring(rules, exceptions, week_start_date)
+    recurring = []
+    # Cells that aren't on the page (from rules imported before imports were checked) get skipped
+    for (day, slot_number), instance in day_tasks.items():
+        name = DAY_TASK_NAMES.get((day, slot_number))
+        if name and slot_number not in week["tasks_by_day"][day]:
+            week["tasks_by_day"][day][slot_number] = instance.task_name
+            recurring.append(name)
+    for (day, time_slot), instance in schedule.items():
+        name = SCHEDULE_NAMES.get((day, time_slot))
+        if name and time_slot not in week["time_schedule"][day]:
+            week["time_schedule"][day][time_slot] = instance.task_name
+            recurring.append(name)
+    week["recurring"] = recurring
+    return week
+
+
+# Hands out the rows of a query one calendar at a time, the query has to be ordered the same way
+# as the calendars it gets matched up with
+class CalendarGroups:
+    def __init__(self, rows, key):
+        self.groups = groupby(rows, key=key)
+        self.current = next(self.groups, None)
+
+    def take(self, calendar_id):
+        if self.current is None or self.current[0] != calendar_id:
+            return []
+        rows = list(self.current[1])
+        self.current = next(self.groups, None)
+        return rows
+
+
+# Yields (week_start_date, view model) for every week between two Mondays, archived weeks
+# included. Everything comes from a fixed number of queries for the whole range, streamed in date
+# order so memory stays flat for long ranges
+def iter_weeks(user_id, from_date, to_date):
+    in_range = (
+        Calendar.user_id == user_id,
+        Calendar.date >= from_date,
+        Calendar.date <= to_date,
+    )
+    batch_size = app.config["RANGE_BATCH_SIZE"]
+
+    calendars = iter(
+        db.session.scalars(
+            select(Calendar)
+            .where(*in_range)
+            .order_by(Calendar.date)
+            .execution_options(yield_per=batch_size)
+        )
+    )
+    categories = CalendarGroups(
+        db.session.scalars(
+            select(Category)
+            .join(Calendar, Category.calendar_id == Calendar.calendar_id)
+            .where(*in_range)
+            .order_by(Calendar.date, Category.category_id)
+            .execution_options(yield_per=batch_size)
+        ),
+        key=lambda category: category.calendar_id,
+    )
+    tasks = CalendarGroups(
+        db.session.scalars(
+            select(Task)
+            .join(Calendar, Task.calendar_id == Calendar.calendar_id)
+            .where(*in_range)
+            .order_by(Calendar.date, Task.task_id)
+            .execution_options(yield_per=batch_size)
+        ),
+        key=lambda task: task.calendar_id,
+    )
+    schedules = CalendarGroups(
+        db.session.execute(
+            select(
+                Task.calendar_id,
+                Schedule.day_of_week,
+                Schedule.time_slot,
+                Task.task_name,
+            )
+            .join(Task, Schedule.task_id == Task.task_id)
+            .join(Calendar, Task.calendar_id == Calendar.calendar_id)
+            .where(*in_range, Schedule.user_id == user_id)
+            .order_by(Calendar.date)
+            .execution_options(yield_per=batch_size)
+        ),
+        key=lambda row: row.calendar_id,
+    )
+
+    archived_weeks = iter(
+        db.session.scalars(
+            select(ArchivedWeek)
+            .where(
+                ArchivedWeek.user_id == user_id,
+                ArchivedWeek.date >= from_date,
+                ArchivedWeek.date <= to_date,
+            )
+            .order_by(ArchivedWeek.date)
+            .execution_options(yield_per=batch_size)
+        )
+    )
+
+    # Recurring tasks are few, so they're loaded for the whole range up front
+    rules, exceptions = load_recurring(user_id, from_date, to_date)
+
+    calendar = next(calendars, None)
+    archived_week = next(archived_weeks, None)
+    week_start_date = from_date
+    while week_start_date <= to_date:
+        if calendar is not None and calendar.date == week_start_date:
+            week = build_week(
+                calendar,
+                categories.take(calendar.calendar_id),
+                tasks.take(calendar.calendar_id),
+                [row[1:] for row in schedules.take(calendar.calendar_id)],
+            )
+            calendar = next(calendars, None)
+        elif archived_week is not None and archived_week.date == week_start_date:
+            week = build_archived_week(archived_week)
+            archived_week = next(archived_weeks, None)
+        else:
+            # Weeks that were never edited get the defaults, same as on the planner page
+            week = empty_week(user_id)
+        yield week_start_date, apply_recurring(week, rules, exceptions, week_start_date)
+        week_start_date += datetime.timedelta(weeks=1)
+
+
+# Reads the from/to query parameters of the range routes and snaps them to their Mondays
+def parse_week_range(args, default_weeks=4):
+    today = datetime.date.today()
+    from_date = datetime.datetime.strptime(
+        args.get("from", today.strftime("%Y-%m-%d")), "%Y-%m-%d"
+    ).date()
+    from_date -= datetime.timedelta(days=from_date.weekday())
+    if "to" in args:
+        to_date = datetime.datetime.strptime(args["to"], "%Y-%m-%d").date()
+        to_date -= datetime.timedelta(days=to_date.weekday())
+    else:
+        to_date = from_date + datetime.timedelta(weeks=default_weeks - 1)
+
+    if to_date < from_date:
+        raise ValueError("The range ends before it starts.")
+    if (to_date - from_date).days // 7 + 1 > app.config["RANGE_MAX_WEEKS"]:
+        raise ValueError(
+            f"Ranges can be at most {app.config['RANGE_MAX_WEEKS']} weeks long."
+        )
+    return from_date, to_date
+
+
+# Input names used on the planner page for the day and hour grids, mapped to the cell they edit
+DAY_TASK_INPUTS = {
+    f"{day.lower()}_task{i}": (day, i)
+    for day in DAYS_OF_WEEK
+    for i in range(1, TASKS_PER_DAY + 1)
+}
+SCHEDULE_INPUTS = {
+    f'schedule_{time_slot.replace(" ", "").lower()}_{day.lower()}': (day, time_slot)
+    for day in DAYS_OF_WEEK
+    for time_slot in TIME_SLOTS
+}
+DAY_TASK_NAMES = {cell: name for name, cell in DAY_TASK_INPUTS.items()}
+SCHEDULE_NAMES = {cell: name for name, cell in SCHEDULE_INPUTS.items()}
+
+
+# Same thing for the category grid, which depends on the calendar's categories
+def category_task_inputs(categories):
+    return {
+        f"action{j}_category{index}": (category.category_id, j)
+        for index, category in enumerate(categories, start=1)
+        for j in range(1, TASKS_PER_CATEGORY + 1)
+    }
+
+
+# Compares the cells currently stored for a grid against the submitted ones, existing maps
+# cell -> stored row (task_id, task_name and maybe schedule_id) and submitted maps cell -> task name
+def diff_cells(existing, submitted):
+    inserts, updates, deletes = [], [], []
+    for cell, task_name in submitted.items():
+        current = existing.get(cell)
+        if task_name:
+            if current is None:
+                inserts.append((cell, task_name))
+            elif current.task_name != task_name:
+                updates.append((cell, task_name, current))
+        elif current is not None:
+            deletes.append((cell, current))
+    return inserts, updates, deletes
+
+
+# Shared engine for the planner grids, only the changed cells get written and everything goes
+# out as bulk INSERT/UPDATE/DELETE statements in the current transaction. Returns the changed
+# cells mapped to their new task name ("" when the cell got cleared). link_tasks gets the
+# (cell, task_id) pairs of the new tasks when they need to be linked to something else
+def save_cells(existing, submitted, new_task, link_tasks=None):
+    inserts, updates, deletes = diff_cells(existing, submitted)
+
+    if updates:
+        db.session.execute(
+            update(Task),
+            [
+                {"task_id": row.task_id, "task_name": task_name}
+                for _, task_name, row in updates
+            ],
+        )
+
+    if deletes:
+        schedule_ids = [
+            row.schedule_id for _, row in deletes if getattr(row, "schedule_id", None)
+        ]
+        if schedule_ids:
+            db.session.execute(
+                delete(Schedule).where(Schedule.schedule_id.in_(schedule_ids))
+            )
+        db.session.execute(
+            delete(Task).where(Task.task_id.in_([row.task_id for _, row in deletes]))
+        )
+
+    if inserts:
+        task_rows = [new_task(cell, task_name) for cell, task_name in inserts]
+        if link_tasks is None:
+            db.session.execute(insert(Task), task_rows)
+        else:
+            # We need the new task ids back (matched up by their day and time slot) to link them
+            new_tasks = db.session.execute(
+                insert(Task).returning(Task.task_id, Task.assigned_day, Task.time_slot),
+                task_rows,
+            ).all()
+            link_tasks(
+                [((row.assigned_day, row.time_slot), row.task_id) for row in new_tasks]
+            )
+
+    changed = {cell: task_name for cell, task_name in inserts}
+    changed.update((cell, task_name) for cell, task_name, _ in updates)
+    changed.update((cell, "") for cell, _ in deletes)
+    return changed
+
+
+# Edits to cells that only show a recurring task get saved as exceptions to it instead of as rows
+# of their own: clearing the cell skips that one occurrence and typing over it renames just that
+# one. Cells with a row of their own in the week are left to the grid. Returns the submitted cells
+# that still need saving and the recurring cells that changed
+def save_recurring_edits(instances, existing, submitted):
+    remaining, changed, exceptions = {}, {}, []
+    for cell, task_name in submitted.items():
+        instance = instances.get(cell)
+        if instance is None or cell in existing:
+            remaining[cell] = task_name
+        elif (task_name or "") != instance.task_name:
+            exceptions.append(
+                {
+                    "recurring_task_id": instance.recurring_task_id,
+                    "date": instance.date,
+                    "task_name": task_name or None,
+                }
+            )
+            changed[cell] = task_name or ""
+
+    if exceptions:
+        # Replaces any earlier exception for the same occurrences
+        db.session.execute(
+            delete(RecurringException).where(
+                or_(
+                    *(
+                        (
+                            RecurringException.recurring_task_id
+                            == row["recurring_task_id"]
+                        )
+                        & (RecurringException.date == row["date"])
+                        for row in exceptions
+                    )
+                )
+            )
+        )
+        db.session.execute(insert(RecurringException), exceptions)
+    return remaining, changed
+
+
+# Saves the submitted category tasks, cells are (category_id, slot_number)
+def save_category_tasks(calendar, submitted):
+    existing = {
+        (row.category_id, row.slot_number): row
+        for row in db.session.query(
+            Task.category_id, Task.slot_number, Task.task_id, Task.task_name
+        ).filter(Task.calendar_id == calendar.calendar_id, Task.category_id.isnot(None))
+    }
+    return save_cells(
+        existing,
+        submitted,
+        lambda cell, task_name: {
+            "task_name": task_name,
+            "category_id": cell[0],
+            "calendar_id": calendar.calendar_id,
+            "slot_number": cell[1],
+        },
+    )
+
+
+# Saves the submitted day tasks, cells are (day, slot_number)
+def save_day_tasks(calendar, submitted):
+    existing = {
+        (row.assigned_day, row.slot_number): row
+        for row in db.session.query(
+            Task.assigned_day, Task.slot_number, Task.task_id, Task.task_name
+        ).filter(
+            Task.calendar_id == calendar.calendar_id,
+            Task.assigned_day.isnot(None),
+            Task.slot_number.isnot(None),
+        )
+    }
+    day_tasks, _ = expand_recurring(
+        *load_recurring(calendar.user_id, calendar.date, calendar.date), calendar.date
+    )
+    submitted, changed = save_recurring_edits(day_tasks, existing, submitted)
+    changed.update(
+        save_cells(
+            existing,
+            submitted,
+            lambda cell, task_name: {
+                "task_name": task_name,
+                "calendar_id": calendar.calendar_id,
+                "assigned_day": cell[0],
+                "slot_number": cell[1],
+            },
+        )
+    )
+    return changed
+
+
+# Saves the submitted hour schedule, cells are (day, time_slot)
+def save_schedule_tasks(user_id, calendar, submitted):
+    def new_task(cell, task_name):
+        return {
+            "task_name": task_name,
+            "calendar_id": calendar.calendar_id,
+            "assigned_day": cell[0],
+            "time_slot": cell[1],
+        }
+
+    convert_schedule_storage(calendar)
+
+    _, recurring = expand_recurring(
+        *load_recurring(user_id, calendar.date, calendar.date), calendar.date
+    )
+
+    if calendar.schedule_grid is not None:
+        grid = decode_schedule_grid(calendar.schedule_grid)
+        task_names = dict(
+            db.session.query(Task.task_id, Task.task_name).filter(
+                Task.task_id.in_(grid.values())
+            )
+        )
+        existing = {
+            cell: StoredCell(task_id, task_names[task_id])
+            for cell, task_id in grid.items()
+            if task_id in task_names
+        }
+        grid = {cell: stored.task_id for cell, stored in existing.items()}
+        submitted, changed = save_recurring_edits(recurring, existing, submitted)
+        saved = save_cells(existing, submitted, new_task, grid.update)
+        for cell, task_name in saved.items():
+            if not task_name:
+                del grid[cell]
+        calendar.schedule_grid = encode_schedule_grid(grid)
+        changed.update(saved)
+        return changed
+
+    existing = {
+        (row.day_of_week, row.time_slot): row
+        for row in db.session.query(
+            Schedule.day_of_week,
+            Schedule.time_slot,
+            Schedule.schedule_id,
+            Task.task_id,
+            Task.task_name,
+        )
+        .join(Task, Schedule.task_id == Task.task_id)
+        .filter(Schedule.user_id == user_id, Task.calendar_id == calendar.calendar_id)
+    }
+    submitted, changed = save_recurring_edits(recurring, existing, submitted)
+    changed.update(
+        save_cells(
+            existing,
+            submitted,
+            new_task,
+            lambda linked: db.session.execute(
+                insert(Schedule),
+                [
+                    {
+                        "user_id": user_id,
+                        "task_id": task_id,
+                        "day_of_week": cell[0],
+                        "time_slot": cell[1],
+                    }
+                    for cell, task_id in linked
+                ],
+            ),
+        )
+    )
+    return changed
+
+
+# The inputs of a submitted form that get saved. A form rendered from an older version of the week
+# than the stored one only saves the inputs its page marked as edited, so it doesn't put back the
+# cells another tab or device saved in the meantime. Forms sent without the list (no JavaScript)
+# save everything like before
+def form_inputs_to_save(calendar, inputs):
+    version = request.form.get("version", type=int)
+    edited = request.form.get("edited")
+    if version is None or edited is None or version >= calendar.version:
+        return inputs
+    edited = set(edited.split(","))
+    return {name: cell for name, cell in inputs.items() if name in edited}
+
+
+# Maps the cells a save changed back to the planner page's input names
+def changed_inputs(inputs, changed):
+    return {name: changed[cell] for name, cell in inputs.items() if cell in changed}
+
+
+# Pushes the cells a committed save changed to every page that has the week open, tagged with the
+# week's new version
+def publish_week_changes(user_id, week_start_date, calendar, changed):
+    if not changed or not week_events.listening(user_id, week_start_date):
+        return
+    version = db.session.scalar(
+        select(Calendar.version).where(Calendar.calendar_id == calendar.calendar_id)
+    )
+    week_events.publish(
+        user_id,
+        week_start_date,
+        {
+            "version": version,
+            "cells": {name: value or "" for name, value in changed.items()},
+        },
+    )
+
+
+# Every input name the planner page can have, whichever categories the week has
+PAGE_INPUT_NAMES = {
+    *(f"category{i}" for i in range(1, CATEGORIES_PER_WEEK + 1)),
+    *(
+        f"action{j}_category{i}"
+        for i in range(1, CATEGORIES_PER_WEEK + 1)
+        for j in range(1, TASKS_PER_CATEGORY + 1)
+    ),
+    *DAY_TASK_INPUTS,
+    *SCHEDULE_INPUTS,
+}
+
+
+# Raised when the autosave queue already holds as many cells as it's allowed to
+class AutosaveQueueFull(Exception):
+    pass
+
+
+# Write-behind buffer for the cells autosaved while the user types. Edits are acknowledged as soon
+# as they're queued and only the latest value of each (week, cell) is kept. A background thread
+# writes everything queued every flush_interval seconds, or sooner once max_pending cells are
+# waiting, all in one transaction. A week that can't be saved right now (the database is locked,
+# say) goes back in the queue for the next flush, only weeks that can never be saved get dropped.
+# Whatever is still queued gets written when the process exits
+class AutosaveQueue:
+    def __init__(self, flush_interval=1.0, max_pending=500, max_queue=10000):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.max_queue = max_queue
+        self.pending = {}  # (user_id, week_start_date) -> {input name: value}
+        self.depth = 0  # Cells queued
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.thread = None
+        self.closed = False
+        self.received = 0
+        self.written = 0
+        self.flushes = 0
+        self.retries = 0
+        self.failures = 0
+
+    def enqueue(self, user_id, week_start_date, cells):
+        with self.lock:
+            week = self.pending.get((user_id, week_start_date), {})
+            added = sum(1 for name in cells if name not in week)
+            if self.closed or self.depth + added > self.max_queue:
+                raise AutosaveQueueFull()
+            self.pending[(user_id, week_start_date)] = {**week, **cells}
+            self.depth += added
+            self.received += len(cells)
+            # The writer gets started on first use so importing the app stays cheap
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+        if self.depth >= self.max_pending:
+            self.wake.set()
+
+    # Puts the cells of a week that couldn't be saved back, under whatever got typed since
+    def requeue(self, week, cells):
+        with self.lock:
+            newer = self.pending.get(week, {})
+            self.pending[week] = {**cells, **newer}
+            self.depth += sum(1 for name in cells if name not in newer)
+            self.retries += 1
+
+    def run(self):
+        while not self.closed:
+            self.wake.wait(self.flush_interval)
+            self.wake.clear()
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            batch, self.pending, self.depth = self.pending, {}, 0
+        if not batch:
+            return
+
+        # The writer takes a write slot like the write routes do, but waits for it
+        slot = write_admission.acquire(wait=True)
+        try:
+            with app.app_context():
+                try:
+                    saved = {
+                        week: save_week_cells(*week, cells)
+                        for week, cells in batch.items()
+                    }
+                    db.session.commit()
+                except Exception:
+                    # Some week couldn't be saved, so save them one at a time to keep the others
+                    db.session.rollback()
+                    saved = {}
+                    for week, cells in batch.items():
+                        try:
+                            saved[week] = save_week_cells(*week, cells)
+                            db.session.commit()
+                        except (WeekArchived, UnknownCells) as e:
+                            # Trying again wouldn't save these either
+                            print("Error autosaving cells, dropping them:", e)
+                            db.session.rollback()
+                            with self.lock:
+                                self.failures += 1
+                        except Exception as e:
+                            print("Error autosaving cells, trying again:", e)
+                            db.session.rollback()
+                            self.requeue(week, cells)
+
+                for (user_id, week_start_date), (calendar, changed) in saved.items():
+                    week_cache.invalidate(user_id, week_start_date)
+                    publish_week_changes(user_id, week_start_date, calendar, changed)
+        finally:
+            write_admission.release(slot)
+
+        with self.lock:
+            self.flushes += 1
+            self.written += sum(len(batch[week]) for week in saved)
+
+    # Stops the writer and writes whatever is left, new edits get turned away from here on
+    def close(self):
+        with self.lock:
+            self.closed = True
+        self.wake.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.flush()
+
+    def stats(self):
+        with self.lock:
+            return {
+                "depth": self.depth,
+                "received": self.received,
+                "written": self.written,
+                "flushes": self.flushes,
+                "retries": self.retries,
+                "failures": self.failures,
+                # Edits received per cell written, how much typing the queue soaked up
+                "coalescing_ratio": self.received / self.written if self.written else 0,
+            }
+
+
+autosave_queue = AutosaveQueue(
+    app.config["AUTOSAVE_FLUSH_INTERVAL"],
+    app.config["AUTOSAVE_MAX_PENDING"],
+    app.config["AUTOSAVE_MAX_QUEUE"],
+)
+atexit.register(autosave_queue.close)
+
+
+# Streams the unpacked rows of a user's archived weeks, (calendar, categories, tasks, schedules)
+def iter_archived_weeks(user_id):
+    for archived_week in db.session.scalars(
+        select(ArchivedWeek)
+        .where(ArchivedWeek.user_id == user_id)
+        .order_by(ArchivedWeek.date)
+        .execution_options(yield_per=app.config["EXPORT_BATCH_SIZE"])
+    ):
+        yield unpack_week(archived_week)
+
+
+# Ids of archived rows in exports get an "a" in front, so they can't clash with the ids of the
+# planner tables (the archived rows were deleted from them and their ids may get reused)
+def archived_id(row_id):
+    return f"a{row_id}" if row_id is not None else None
+
+
+# Streams every row of a user's planner history as JSON lines: calendars first, then categories,
+# tasks, schedules and recurring tasks, so an import can link them up in one pass. Archived weeks
+# come after the planner tables' rows of each type. Each query is read with yield_per so memory
+# stays flat no matter how long the history is
+def export_jsonl(user_id):
+    batch_size = app.config["EXPORT_BATCH_SIZE"]
+    for calendar in db.session.scalars(
+        select(Calendar)
+        .where(Calendar.user_id == user_id)
+        .order_by(Calendar.calendar_id)
+        .execution_options(yield_per=batch_size)
+    ):
+        yield {
+            "type": "calendar",
+            "calendar_id": calendar.calendar_id,
+            "date": calendar.date.strftime("%Y-%m-%d"),
+        }
+    for calendar, _, _, _ in iter_archived_weeks(user_id):
+        yield {
+            "type": "calendar",
+            "calendar_id": archived_id(calendar.calendar_id),
+            "date": calendar.date.strftime("%Y-%m-%d"),
+        }
+
+    for category in db.session.scalars(
+        select(Category)
+        .where(Category.user_id == user_id)
+        .order_by(Category.category_id)
+        .execution_options(yield_per=batch_size)
+    ):
+        yield {
+            "type": "category",
+            "category_id": category.category_id,
+            "calendar_id": category.calendar_id,
+            "category_name": category.category_name,
+        }
+    for _, categories, _, _ in iter_archived_weeks(user_id):
+        for category in categories:
+            yield {
+                "type": "category",
+                "category_id": archived_id(category.category_id),
+                "calendar_id": archived_id(category.calendar_id),
+                "category_name": category.category_name,
+            }
+
+    for task in db.session.scalars(
+        select(Task)
+        .join(Calendar, Task.calendar_id == Calendar.calendar_id)
+        .where(Calendar.user_id == user_id)
+        .order_by(Task.task_id)
+        .execution_options(yield_per=batch_size)
+    ):
+        yield {
+            "type": "task",
+            "task_id": task.task_id,
+            "calendar_id": task.calendar_id,
+            "category_id": task.category_id,
+            "task_name": task.task_name,
+            "assigned_day": task.assigned_day,
+            "time_slot": task.time_slot,
+            "slot_number": task.slot_number,
+        }
+    for _, _, tasks, _ in iter_archived_weeks(user_id):
+        for task in tasks:
+            yield {
+                "type": "task",
+                "task_id": archived_id(task.task_id),
+                "calendar_id": archived_id(task.calendar_id),
+                "category_id": archived_id(task.category_id),
+                "task_name": task.task_name,
+                "assigned_day": task.assigned_day,
+                "time_slot": task.time_slot,
+                "slot_number": task.slot_number,
+            }
+
+    for day_of_week, time_slot, task_id in iter_schedules(user_id):
+        yield {
+            "type": "schedule",
+            "task_id": task_id,
+            "day_of_week": day_of_week,
+            "time_slot": time_slot,
+        }
+    for _, _, _, schedules in iter_archived_weeks(user_id):
+        for day_of_week, time_slot, task_id in schedules:
+            yield {
+                "type": "schedule",
+                "task_id": archived_id(task_id),
+                "day_of_week": day_of_week,
+                "time_slot": time_slot,
+            }
+
+    for rule in db.session.scalars(
+        select(RecurringTask)
+        .where(RecurringTask.user_id == user_id)
+        .order_by(RecurringTask.recurring_task_id)
+        .execution_options(yield_per=batch_size)
+    ):
+        yield {"type": "recurring_task", **recurring_task_json(rule)}
+
+    for exception in db.session.scalars(
+        select(RecurringException)
+        .join(
+            RecurringTask,
+            RecurringException.recurring_task_id == RecurringTask.recurring_task_id,
+        )
+        .where(RecurringTask.user_id == user_id)
+        .order_by(RecurringException.recurring_exception_id)
+        .execution_options(yield_per=batch_size)
+    ):
+        yield {
+            "type": "recurring_exception",
+            "recurring_task_id": exception.recurring_task_id,
+            "date": exception.date.strftime("%Y-%m-%d"),
+            "task_name": exception.task_name,
+        }
+
+
+# Streams (day_of_week, time_slot, task_id) for every filled hour cell of a user, whichever
+# storage format each week uses
+def iter_schedules(user_id):
+    batch_size = app.config["EXPORT_BATCH_SIZE"]
+    yield from db.session.execute(
+        select(Schedule.day_of_week, Schedule.time_slot, Schedule.task_id)
+        .where(Schedule.user_id == user_id)
+        .order_by(Schedule.schedule_id)
+        .execution_options(yield_per=batch_size)
+    )
+    for schedule_grid in db.session.scalars(
+        select(Calendar.schedule_grid)
+        .where(Calendar.user_id == user_id, Calendar.schedule_grid.isnot(None))
+        .order_by(Calendar.calendar_id)
+        .execution_options(yield_per=batch_size)
+    ):
+        for (day_of_week, time_slot), task_id in decode_schedule_grid(
+            schedule_grid
+        ).items():
+            yield day_of_week, time_slot, task_id
+
+
+# Escapes and folds one iCalendar content line (lines can be at most 75 octets long)
+def ics_line(name, value):
+    value = (
+        value.replace("\\", "\\\\")
+        .replace(";", "\\;")
+        .replace(",", "\\,")
+        .replace("\n", "\\n")
+    )
+    line = f"{name}:{value}"
+    folded = []
+    while len(line.encode()) > 75:
+        cut = 75
+        while len(line[:cut].encode()) > 75:
+            cut -= 1
+        folded.append(line[:cut])
+        line = " " + line[cut:]
+    folded.append(line)
+    return "\r\n".join(folded) + "\r\n"
+
+
+# Streams a user's hour schedule (one hour events) and day tasks (all day events) as iCalendar
+def export_ics(user_id):
+    batch_size = app.config["EXPORT_BATCH_SIZE"]
+    stamp = datetime.datetime.now(datetime.timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    yield "BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:-//Schedulify//Planner//EN\r\n"
+
+    def event(uid, summary, start, end, all_day=False):
+        value = "DATE" if all_day else "DATE-TIME"
+        fmt = "%Y%m%d" if all_day else "%Y%m%dT%H%M%S"
+        return (
+            "BEGIN:VEVENT\r\n"
+            + ics_line("UID", f"{uid}@schedulify")
+            + ics_line("DTSTAMP", stamp)
+            + ics_line(f"DTSTART;VALUE={value}", start.strftime(fmt))
+            + ics_line(f"DTEND;VALUE={value}", end.strftime(fmt))
+            + ics_line("SUMMARY", summary)
+            + "END:VEVENT\r\n"
+        )
+
+    def day_of(week_start_date, day_of_week):
+        return week_start_date + datetime.timedelta(
+            days=DAYS_OF_WEEK.index(day_of_week)
+        )
+
+    # Every hour cell holds one task, so the cell itself makes a stable UID
+    def hour_event(week_start_date, day_of_week, time_slot, task_name):
+        start = datetime.datetime.combine(
+            day_of(week_start_date, day_of_week),
+            datetime.datetime.strptime(time_slot, "%I %p").time(),
+        )
+        return event(
+            f"{user_id}-{week_start_date}-{day_of_week}-{time_slot}".replace(" ", ""),
+            task_name,
+            start,
+            start + datetime.timedelta(hours=1),
+        )
+
+    def day_event(task_id, week_start_date, day_of_week, task_name):
+        day = day_of(week_start_date, day_of_week)
+        return event(
+            f"{user_id}-task-{task_id}",
+            task_name,
+            day,
+            day + datetime.timedelta(days=1),
+            True,
+        )
+
+    # Hour schedule stored as rows
+    for week_start_date, day_of_week, time_slot, task_name in db.session.execute(
+        select(
+            Calendar.date,
+            Schedule.day_of_week,
+            Schedule.time_slot,
+            Task.task_name,
+        )
+        .join(Task, Schedule.task_id == Task.task_id)
+        .join(Calendar, Task.calendar_id == Calendar.calendar_id)
+        .where(Schedule.user_id == user_id)
+        .order_by(Schedule.schedule_id)
+        .execution_options(yield_per=batch_size)
+    ):
+        yield hour_event(week_start_date, day_of_week, time_slot, task_name)
+
+    # Hour schedule of the packed weeks, their task names come from the week's tasks
+    packed_tasks = CalendarGroups(
+        db.session.execute(
+            select(Task.calendar_id, Task.task_id, Task.task_name)
+            .join(Calendar, Task.calendar_id == Calendar.calendar_id)
+            .where(Calendar.user_id == user_id, Calendar.schedule_grid.isnot(None))
+            .order_by(Calendar.calendar_id)
+            .execution_options(yield_per=batch_size)
+        ),
+        key=lambda row: row.calendar_id,
+    )
+    for calendar_id, week_start_date, schedule_grid in db.session.execute(
+        select(Calendar.calendar_id, Calendar.date, Calendar.schedule_grid)
+        .where(Calendar.user_id == user_id, Calendar.schedule_grid.isnot(None))
+        .order_by(Calendar.calendar_id)
+        .execution_options(yield_per=batch_size)
+    ):
+        task_names = {
+            row.task_id: row.task_name for row in packed_tasks.take(calendar_id)
+        }
+        for (day_of_week, time_slot), task_id in decode_schedule_grid(
+            schedule_grid
+        ).items():
+            if task_id in task_names:
+                yield hour_event(
+                    week_start_date, day_of_week, time_slot, task_names[task_id]
+                )
+
+    # Tasks assigned to a day
+    for task_id, week_start_date, day_of_week, task_name in db.session.execute(
+        select(Task.task_id, Calendar.date, Task.assigned_day, Task.task_name)
+        .join(Calendar, Task.calendar_id == Calendar.calendar_id)
+        .where(
+            Calendar.user_id == user_id,
+            Task.assigned_day.isnot(None),
+            Task.slot_number.isnot(None),
+        )
+        .order_by(Task.task_id)
+        .execution_options(yield_per=batch_size)
+    ):
+        yield day_event(task_id, week_start_date, day_of_week, task_name)
+
+    # Archived weeks keep their task ids, so their events keep their UIDs too
+    for calendar, _, tasks, schedules in iter_archived_weeks(user_id):
+        task_names = {task.task_id: task.task_name for task in tasks}
+        for day_of_week, time_slot, task_id in schedules:
+            if task_id in task_names:
+                yield hour_event(
+                    calendar.date, day_of_week, time_slot, task_names[task_id]
+                )
+        for task in tasks:
+            if task.assigned_day is not None and task.slot_number is not None:
+                yield day_event(
+                    task.task_id, calendar.date, task.assigned_day, task.task_name
+                )
+
+    yield "END:VCALENDAR\r\n"
+
+
+# Inserts a batch of rows in bulk and returns their new ids in the same order, so the rows that
+# point at them can be inserted in bulk too. A plain table insert, the ORM's bulk insert is a lot
+# slower once it has to return the ids
+def insert_with_new_ids(model, id_column, rows):
+    if not rows:
+        return []
+    return list(
+        db.session.scalars(
+            insert(model.__table__).returning(id_column, sort_by_parameter_order=True),
+            rows,
+        )
+    )
+
+
+def import_date(value):
+    if not isinstance(value, str):
+        raise ValueError(f"Invalid date: {value!r}")
+    return datetime.datetime.strptime(value, "%Y-%m-%d").date()
+
+
+# Ids only link the records of an export together, they're numbers or "a"-prefixed strings
+def import_id(record, key, optional=False):
+    value = record[key]
+    if not (type(value) in (int, str) and value != "" or optional and value is None):
+        raise ValueError(f"Invalid {key}: {value!r}")
+
+
+def import_text(record, key, optional=False):
+    value = record[key]
+    if not (isinstance(value, str) and value or optional and value is None):
+        raise ValueError(f"Invalid {key}: {value!r}")
+    return value
+
+
+# Checks a record of an import before anything gets written, so a file the planner page couldn't
+# show never makes it in. Raises ValueError (or KeyError for a missing field)
+def check_import_record(record):
+    if not isinstance(record, dict):
+        raise ValueError("Every line has to be a JSON object.")
+    record_type = record.get("type")
+    if record_type == "calendar":
+        import_id(record, "calendar_id")
+        if import_date(record["date"]).weekday():
+            raise ValueError(f"A week starts on a Monday: {record['date']!r}")
+    elif record_type == "category":
+        import_id(record, "category_id")
+        import_id(record, "calendar_id")
+        import_text(record, "category_name")
+    elif record_type == "task":
+        import_id(record, "task_id")
+        import_id(record, "calendar_id")
+        import_id(record, "category_id", optional=True)
+        import_text(record, "task_name")
+        if record["assigned_day"] not in (None, *DAYS_OF_WEEK):
+            raise ValueError(f"Invalid day: {record['assigned_day']!r}")
+        if record["time_slot"] not in (None, *TIME_SLOTS):
+            raise ValueError(f"Invalid time slot: {record['time_slot']!r}")
+        slot_number = record["slot_number"]
+        if slot_number is not None:
+            slots = TASKS_PER_DAY if record["assigned_day"] else TASKS_PER_CATEGORY
+            if type(slot_number) is not int or not 1 <= slot_number <= slots:
+                raise ValueError(f"Invalid slot number: {slot_number!r}")
+    elif record_type == "schedule":
+        import_id(record, "task_id")
+        if record["day_of_week"] not in DAYS_OF_WEEK:
+            raise ValueError(f"Invalid day: {record['day_of_week']!r}")
+        if record["time_slot"] not in TIME_SLOTS:
+            raise ValueError(f"Invalid time slot: {record['time_slot']!r}")
+    elif record_type == "recurring_task":
+        import_id(record, "recurring_task_id")
+        import_date(record["start_date"])
+        recurring_task_from_json(record, None)
+    elif record_type == "recurring_exception":
+        import_id(record, "recurring_task_id")
+        import_date(record["date"])
+        import_text(record, "task_name", optional=True)
+    else:
+        raise ValueError(f"Unknown record type: {record_type!r}")
+
+
+# What a checked record of an import holds that no other record of the file can: its id, its week,
+# the cell it fills. Two of the same would break the links between the records or the unique
+# indexes of the planner tables
+def import_record_keys(record):
+    record_type = record["type"]
+    if record_type == "calendar":
+        return [
+            f"calendar_id {record['calendar_id']!r}",
+            f"week {import_date(record['date'])}",
+        ]
+    if record_type == "category":
+        return [f"category_id {record['category_id']!r}"]
+    if record_type == "task":
+        keys = [f"task_id {record['task_id']!r}"]
+        calendar_id, slot_number = record["calendar_id"], record["slot_number"]
+        if slot_number is not None and record["category_id"] is not None:
+            keys.append(
+                f"slot {slot_number} of category {record['category_id']!r}"
+                f" in calendar {calendar_id!r}"
+            )
+        if slot_number is not None and record["assigned_day"] is not None:
+            keys.append(
+                f"{record['assigned_day']} slot {slot_number} in calendar {calendar_id!r}"
+            )
+        return keys
+    if record_type == "recurring_task":
+        return [f"recurring_task_id {record['recurring_task_id']!r}"]
+    if record_type == "recurring_exception":
+        return [
+            f"recurring task {record['recurring_task_id']!r} on"
+            f" {import_date(record['date'])}"
+        ]
+    return []
+
+
+# Takes the rows of an import that failed halfway back out again, by the ids of the weeks and
+# recurring tasks it added
+def remove_imported(calendar_ids, recurring_task_ids):
+    batch_size = app.config["IMPORT_BATCH_SIZE"]
+    calendar_ids, recurring_task_ids = list(calendar_ids), list(recurring_task_ids)
+    for i in range(0, len(calendar_ids), batch_size):
+        chunk = calendar_ids[i : i + batch_size]
+        week_tasks = select(Task.task_id).where(Task.calendar_id.in_(chunk))
+        db.session.execute(delete(Schedule).where(Schedule.task_id.in_(week_tasks)))
+        db.session.execute(delete(Task).where(Task.calendar_id.in_(chunk)))
+        db.session.execute(delete(Category).where(Category.calendar_id.in_(chunk)))
+        db.session.execute(delete(Calendar).where(Calendar.calendar_id.in_(chunk)))
+        db.session.commit()
+    for i in range(0, len(recurring_task_ids), batch_size):
+        chunk = recurring_task_ids[i : i + batch_size]
+        db.session.execute(
+            delete(RecurringException).where(
+                RecurringException.recurring_task_id.in_(chunk)
+            )
+        )
+        db.session.execute(
+            delete(RecurringTask).where(RecurringTask.recurring_task_id.in_(chunk))
+        )
+        db.session.commit()
+
+
+# Bulk loads an export made by export_jsonl() into a user's planner. The whole file gets checked
+# before anything is written, so a bad line turns it away as a whole. Then it goes in one batch of
+# rows per transaction, leaving SQLite's write lock to everyone else in between, and if a batch
+# fails anyway the ones before it get taken back out. Weeks the user already has (archived ones
+# too) are skipped along with everything in them. Returns how many rows of each type were imported
+# and how many weeks were skipped
+def import_jsonl(user_id, file):
+    batch_size = app.config["IMPORT_BATCH_SIZE"]
+    calendar_ids, category_ids, task_ids, recurring_task_ids = {}, {}, {}, {}
+    imported = {
+        "calendar": 0,
+        "category": 0,
+        "task": 0,
+        "schedule": 0,
+        "recurring_task": 0,
+        "recurring_exception": 0,
+    }
+    skipped_weeks = 0
+    imported_dates = []
+
+    def flush(record_type, records):
+        nonlocal skipped_weeks
+        if record_type == "calendar":
+            dates = {
+                datetime.datetime.strptime(record["date"], "%Y-%m-%d").date(): record
+                for record in records
+            }
+            existing = set(
+                db.session.scalars(
+                    select(Calendar.date).where(
+                        Calendar.user_id == user_id, Calendar.date.in_(dates)
+                    )
+                )
+            ) | set(
+                db.session.scalars(
+                    select(ArchivedWeek.date).where(
+                        ArchivedWeek.user_id == user_id, ArchivedWeek.date.in_(dates)
+                    )
+                )
+            )
+            skipped_weeks += len(existing)
+            new = [
+                (date, record) for date, record in dates.items() if date not in existing
+            ]
+            new_ids = insert_with_new_ids(
+                Calendar,
+                Calendar.calendar_id,
+                # Version 1 so pages cached for the empty week don't match anymore
+                [{"user_id": user_id, "date": date, "version": 1} for date, _ in new],
+            )
+            for (date, record), new_id in zip(new, new_ids):
+                calendar_ids[record["calendar_id"]] = new_id
+                imported_dates.append(date)
+            imported["calendar"] += len(new)
+        elif record_type == "category":
+            records = [r for r in records if r["calendar_id"] in calendar_ids]
+            new_ids = insert_with_new_ids(
+                Category,
+                Category.category_id,
+                [
+                    {
+                        "user_id": user_id,
+                        "calendar_id": calendar_ids[record["calendar_id"]],
+                        "category_name": record["category_name"],
+                    }
+                    for record in records
+                ],
+            )
+            category_ids.update(
+                (record["category_id"], new_id)
+                for record, new_id in zip(records, new_ids)
+            )
+        elif record_type == "task":
+            records = [r for r in records if r["calendar_id"] in calendar_ids]
+            new_ids = insert_with_new_ids(
+                Task,
+                Task.task_id,
+                [
+                    {
+                        "calendar_id": calendar_ids[record["calendar_id"]],
+                        "category_id": category_ids.get(record["category_id"]),
+                        "task_name": record["task_name"],
+                        "assigned_day": record["assigned_day"],
+                        "time_slot": record["time_slot"],
+                        "slot_number": record["slot_number"],
+                    }
+                    for record in records
+                ],
+            )
+            task_ids.update(
+                (record["task_id"], new_id) for record, new_id in zip(records, new_ids)
+            )
+        elif record_type == "schedule":
+            records = [r for r in records if r["task_id"] in task_ids]
+            if records:
+                db.session.execute(
+                    insert(Schedule),
+                    [
+                        {
+                            "user_id": user_id,
+                            "task_id": task_ids[record["task_id"]],
+                            "day_of_week": record["day_of_week"],
+                            "time_slot": record["time_slot"],
+                        }
+                        for record in records
+                    ],
+                )
+        elif record_type == "recurring_task":
+            # Recurring tasks aren't tied to a week, so the ones the user already has get skipped
+            def rule_key(rule):
+                return (
+                    rule["task_name"],
+                    frozenset(rule["days"]),
+                    rule["time_slot"],
+                    rule["slot_number"],
+                    rule["start_date"],
+                    rule["end_date"],
+                    rule["interval_weeks"],
+                )
+
+            existing = {
+                rule_key(recurring_task_json(rule))
+                for rule in RecurringTask.query.filter_by(user_id=user_id)
+            }
+            rules = [
+                (record, recurring_task_from_json(record, user_id))
+                for record in records
+            ]
+            rules = [
+                (record, rule)
+                for record, rule in rules
+                if rule_key(recurring_task_json(rule)) not in existing
+            ]
+            records = [record for record, _ in rules]
+            new_ids = insert_with_new_ids(
+                RecurringTask,
+                RecurringTask.recurring_task_id,
+                [
+                    {
+                        "user_id": user_id,
+                        "task_name": rule.task_name,
+                        "days": rule.days,
+                        "time_slot": rule.time_slot,
+                        "slot_number": rule.slot_number,
+                        "start_date": rule.start_date,
+                        "end_date": rule.end_date,
+                        "interval_weeks": rule.interval_weeks,
+                    }
+                    for _, rule in rules
+                ],
+            )
+            recurring_task_ids.update(
+                (record["recurring_task_id"], new_id)
+                for record, new_id in zip(records, new_ids)
+            )
+        elif record_type == "recurring_exception":
+            records = [
+                r for r in records if r["recurring_task_id"] in recurring_task_ids
+            ]
+            if records:
+                db.session.execute(
+                    insert(RecurringException),
+                    [
+                        {
+                            "recurring_task_id": recurring_task_ids[
+                                record["recurring_task_id"]
+                            ],
+                            "date": datetime.datetime.strptime(
+                                record["date"], "%Y-%m-%d"
+                            ).date(),
+                            "task_name": record["task_name"],
+                        }
+                        for record in records
+                    ],
+                )
+        else:
+            raise ValueError(f"Unknown record type: {record_type}")
+        if record_type != "calendar":
+            imported[record_type] += len(records)
+
+    # The file gets read twice, so one that can't be gone back over (like stdin) gets spooled
+    if not file.seekable():
+        spooled = tempfile.TemporaryFile("w+", encoding="utf-8")
+        shutil.copyfileobj(file, spooled)
+        file = spooled
+
+    def records():
+        file.seek(0)
+        for number, line in enumerate(file, start=1):
+            if line.strip():
+                yield number, line
+
+    seen = set()
+    for number, line in records():
+        try:
+            record = json.loads(line)
+            check_import_record(record)
+            for key in import_record_keys(record):
+                if key in seen:
+                    raise ValueError(f"The file has {key} more than once.")
+                seen.add(key)
+        except ValueError as e:
+            raise ValueError(f"Line {number}: {e}") from e
+        except KeyError as e:
+            raise ValueError(f"Line {number}: {e} is missing") from e
+    del seen
+
+    try:
+        batch, batch_type = [], None
+        for _, line in records():
+            record = json.loads(line)
+            if batch and (record["type"] != batch_type or len(batch) >= batch_size):
+                flush(batch_type, batch)
+                db.session.commit()
+                batch = []
+            batch_type = record["type"]
+            batch.append(record)
+        if batch:
+            flush(batch_type, batch)
+
+        # Pages that got cached from a week while it was going in don't match it anymore
+        new_calendar_ids = list(calendar_ids.values())
+        for i in range(0, len(new_calendar_ids), batch_size):
+            db.session.execute(
+                update(Calendar)
+                .where(Calendar.calendar_id.in_(new_calendar_ids[i : i + batch_size]))
+                .values(version=Calendar.version + 1)
+            )
+        if recurring_task_ids:
+            bump_recurring_version(user_id)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        try:
+            remove_imported(calendar_ids.values(), recurring_task_ids.values())
+        except Exception as e:
+            print("Error taking a failed import back out:", e)
+            db.session.rollback()
+        raise
+
+    # The weeks only change once everything is in
+    for date in imported_dates:
+        week_cache.invalidate(user_id, date)
+    if recurring_task_ids:
+        week_cache.invalidate_user(user_id)
+
+    return {"imported": imported, "skipped_weeks": skipped_weeks}
+
+
+# Placeholders in a page skeleton, they must not show up anywhere in the template itself
+SLOT_PATTERN = re.compile(r"__slot(\d+)__")
+
+
+# A page that is the same scaffolding for everyone with a known set of values filled in. The
+# template gets rendered once (per shape, like the number of categories) with a placeholder in
+# place of every value and is split around them, after that a request only joins the static
+# chunks with its own escaped values. skeleton_context(slot, shape) builds the template context
+# out of placeholders, slot(fill) takes a function that turns the request's values into the
+# value's HTML
+class PageSkeleton:
+    def __init__(self, template_name, skeleton_context):
+        self.template_name = template_name
+        self.skeleton_context = skeleton_context
+        self.compiled = {}
+
+    def compile(self, shape):
+        fills = []
+
+        def slot(fill):
+            fills.append(fill)
+            return Markup(f"__slot{len(fills) - 1}__")
+
+        template = app.jinja_env.get_template(self.template_name)
+        parts = SLOT_PATTERN.split(
+            render_template(template, **self.skeleton_context(slot, shape))
+        )
+        # Placeholders the template never printed don't end up in here
+        compiled = (template, parts[0::2], [fills[int(i)] for i in parts[1::2]])
+        self.compiled[shape] = compiled
+        return compiled
+
+    # Needs a request context the first time around, for the template's url_for() calls
+    def render(self, values, shape):
+        compiled = self.compiled.get(shape)
+        # With template reloading on (debug mode) an edited template gets compiled again
+        if compiled is None or (
+            app.jinja_env.auto_reload and not compiled[0].is_up_to_date
+        ):
+            compiled = self.compile(shape)
+
+        started_at = time.perf_counter()
+        _, chunks, fills = compiled
+        html = [chunks[0]]
+        for fill, chunk in zip(fills, chunks[1:]):
+            html.append(fill(values))
+            html.append(chunk)
+        html = "".join(html)
+
+        profile = current_profile.get()
+        if profile is not None:
+            profile.render_time += time.perf_counter() - started_at
+        return html
+
+
+# Stands in for a date in a page skeleton, whatever the template prints of it becomes a placeholder
+class SkeletonDate:
+    def __init__(self, slot, key):
+        self.slot = slot
+        self.key = key
+
+    def strftime(self, fmt):
+        return self.slot(lambda values: escape(values[self.key].strftime(fmt)))
+
+    def __str__(self):
+        return self.slot(lambda values: escape(values[self.key]))
+
+    __html__ = __str__
+
+
+RECURRING_CELL_CLASS = Markup('class="recurring"')
+
+
+def flashed_messages_html(messages):
+    return Markup("").join(Markup("<p>%s</p>") % message for message in messages)
+
+
+# Everything the planner page shows for one request, out of the (maybe cached) week
+def index_page_values(week, week_start_date, username, messages):
+    return dict(
+        week,
+        recurring=set(week["recurring"]),
+        week_start_date=week_start_date,
+        calendar_date=week_start_date,
+        username=username,
+        messages=messages,
+    )
+
+
+# The template context for the planner page, for rendering it with Jinja the normal way
+def index_template_context(values):
+    return dict(
+        values,
+        days_of_week=DAYS_OF_WEEK,
+        time_slots=TIME_SLOTS,
+        tasks_per_category=TASKS_PER_CATEGORY,
+        tasks_per_day=TASKS_PER_DAY,
+        cell_class=lambda name: (
+            RECURRING_CELL_CLASS if name in values["recurring"] else ""
+        ),
+        flashed_messages=lambda: flashed_messages_html(values["messages"]),
+        when_archived=lambda html: Markup(html) if values["archived"] else "",
+    )
+
+
+def category_task_html(values, index, slot_number, field):
+    category_id = values["categories"][index]["category_id"]
+    task = values["tasks_by_category"].get(category_id, {}).get(slot_number)
+    return escape(task[field]) if task else ""
+
+
+# The same context made of placeholders, shape is the number of categories. The skeleton's
+# category ids are just their positions, the real ones get looked up per request
+def index_skeleton_context(slot, category_count):
+    return {
+        "categories": [
+            {
+                "category_id": index,
+                "category_name": slot(
+                    lambda values, index=index: escape(
+                        values["categories"][index]["category_name"]
+                    )
+                ),
+            }
+            for index in range(category_count)
+        ],
+        "tasks_by_category": {
+            index: {
+                i: {
+                    field: slot(
+                        functools.partial(
+                            category_task_html, index=index, slot_number=i, field=field
+                        )
+                    )
+                    for field in ("task_name", "task_id")
+                }
+                for i in range(1, TASKS_PER_CATEGORY + 1)
+            }
+            for index in range(category_count)
+        },
+        "tasks_by_day": {
+            day: {
+                i: slot(
+                    lambda values, day=day, i=i: escape(
+                        values["tasks_by_day"][day].get(i, "")
+                    )
+                )
+                for i in range(1, TASKS_PER_DAY + 1)
+            }
+            for day in DAYS_OF_WEEK
+        },
+        "time_schedule": {
+            day: {
+                time_slot: slot(
+                    lambda values, day=day, time_slot=time_slot: escape(
+                        values["time_schedule"][day].get(time_slot, "")
+                    )
+                )
+                for time_slot in TIME_SLOTS
+            }
+            for day in DAYS_OF_WEEK
+        },
+        "days_of_week": DAYS_OF_WEEK,
+        "time_slots": TIME_SLOTS,
+        "tasks_per_category": TASKS_PER_CATEGORY,
+        "tasks_per_day": TASKS_PER_DAY,
+        "week_start_date": SkeletonDate(slot, "week_start_date"),
+        "calendar_date": SkeletonDate(slot, "calendar_date"),
+        "username": slot(lambda values: escape(values["username"])),
+        "version": slot(lambda values: escape(values["version"])),
+        "cell_class": lambda name: slot(
+            lambda values: RECURRING_CELL_CLASS if name in values["recurring"] else ""
+        ),
+        "when_archived": lambda html: slot(
+            lambda values: Markup(html) if values["archived"] else ""
+        ),
+        "flashed_messages": lambda: slot(
+            lambda values: flashed_messages_html(values["messages"])
+        ),
+    }
+
+
+index_page = PageSkeleton("index.html", index_skeleton_context)
+
+
+# Looks up a week's calendar together with the user's recurring version (recurring tasks show up
+# in every week) and the week's archive, the calendar is None for weeks that were never edited
+# or got archived
+def find_week_calendar(user_id, week_start_date):
+    return db.session.execute(
+        select(User.recurring_version, Calendar, ArchivedWeek)
+        .outerjoin(
+            Calendar,
+            (Calendar.user_id == User.user_id) & (Calendar.date == week_start_date),
+        )
+        .outerjoin(
+            ArchivedWeek,
+            (ArchivedWeek.user_id == User.user_id)
+            & (ArchivedWeek.date == week_start_date),
+        )
+        .where(User.user_id == user_id)
+    ).first() or (0, None, None)
+
+
+# What a cached week gets checked against, out of the row find_week_calendar() returns. It changes
+# whenever the week gets saved, archived or pruned, or the user's recurring tasks change
+def week_stamp(recurring_version, calendar, archived_week=None):
+    if calendar:
+        return (calendar.calendar_id, calendar.version, recurring_version)
+    return (None, "archived" if archived_week else 0, recurring_version)
+
+
+# The week the planner page shows, from the cache unless it changed since it got cached
+def page_week(
+    user_id, week_start_date, recurring_version, calendar, archived_week=None
+):
+    week = week_cache.get(
+        user_id,
+        week_start_date,
+        week_stamp(recurring_version, calendar, archived_week),
+    )
+    if week is None:
+        week = build_page_week(
+            user_id, week_start_date, recurring_version, calendar, archived_week
+        )
+    return week
+
+
+# Builds the week the planner page shows and caches it. Weeks that were never edited get built
+# from the defaults, reading a week never writes anything
+def build_page_week(
+    user_id, week_start_date, recurring_version, calendar, archived_week=None
+):
+    if calendar:
+        # Load the whole week (categories, tasks and schedules) in a fixed number of queries
+        week = load_week(user_id, calendar)
+    elif archived_week:
+        week = build_archived_week(archived_week)
+    else:
+        week = empty_week(user_id)
+    if recurring_version:
+        # Users who never set up a recurring task don't need to look for any
+        apply_recurring(
+            week,
+            *load_recurring(user_id, week_start_date, week_start_date),
+            week_start_date,
+        )
+    week["recurring_version"] = recurring_version
+    week["stamp"] = week_stamp(recurring_version, calendar, archived_week)
+    week_cache.set(user_id, week_start_date, week)
+    return week
+
+
+# Every input of the planner page mapped to its value in a week
+def week_cell_values(week):
+    cells = {}
+    for index, category in enumerate(week["categories"], start=1):
+        cells[f"category{index}"] = category["category_name"]
+        tasks = week["tasks_by_category"].get(category["category_id"], {})
+        for j in range(1, TASKS_PER_CATEGORY + 1):
+            task = tasks.get(j)
+            cells[f"action{j}_category{index}"] = task["task_name"] if task else ""
+    for name, (day, slot_number) in DAY_TASK_INPUTS.items():
+        cells[name] = week["tasks_by_day"][day].get(slot_number, "")
+    for name, (day, time_slot) in SCHEDULE_INPUTS.items():
+        cells[name] = week["time_schedule"][day].get(time_slot, "")
+    return cells
+
+
+# Index route to display the main planner page
+@app.route("/index", defaults={"calendar_date": None})
+@app.route("/index/<calendar_date>")
+def index(calendar_date):
+    user_id = session.get("user_id")
+    if not user_id:
+        flash("Please login to be able to use your planner!", "danger")
+        return redirect(url_for("login"))
+
+    # Determine the calendar to load based on the date
+    if calendar_date is None:
+        current_date = datetime.date.today()
+    else:
+        current_date = datetime.datetime.strptime(calendar_date, "%Y-%m-%d").date()
+
+    # Calculate the week start date (Monday of the current week)
+    week_start_date = current_date - datetime.timedelta(days=current_date.weekday())
+
+    # One indexed lookup for the week's versions, the 304 and the cached week are checked against it
+    recurring_version, calendar, archived_week = find_week_calendar(
+        user_id, week_start_date
+    )
+    version = calendar.version if calendar else 0
+    archived = calendar is None and archived_week is not None
+
+    # Nothing changed since the browser's copy, so skip loading and rendering the week (unless
+    # there are flash messages waiting to be shown)
+    etag = week_etag(
+        user_id,
+        week_start_date,
+        # Archived weeks don't change anymore
+        (
+            f"archived.{recurring_version}"
+            if archived
+            else f"{version}.{recurring_version}"
+        ),
+    )
+    if etag in request.if_none_match and "_flashes" not in session:
+        response = make_response("", 304)
+        response.set_etag(etag)
+        return response
+
+    # Flipping back and forth between weeks is served from the cache
+    week = page_week(
+        user_id, week_start_date, recurring_version, calendar, archived_week
+    )
 
-    return render_template(
-        "index.html",
-        categories=categories,
-        tasks_by_category=tasks_by_category,
-        tasks_by_day=tasks_by_day,
-        time_schedule=time_schedule,
-        days_of_week=days_of_week,
-        time_slots=time_slots,
-        username=session.get("username"),
-        calendar_date=week_start_date,
-        week_start_date=week_start_date,
+    # Only the values get filled into the page, its scaffolding is rendered once
+    values = index_page_values(
+        week, week_start_date, session.get("username"), get_flashed_messages()
     )
+    response = make_response(index_page.render(values, len(week["categories"])))
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
 
 
 # Signup route for a new user to create a new account
@@ -244,7 +3665,11 @@ def signup():
             return redirect(url_for("signup"))
 
         # Creating a new user with a hashed password
-        hashed_password = generate_password_hash(password, method="pbkdf2:sha256")
+        try:
+            hashed_password = password_hasher.hash(password)
+        except PasswordHasherBusy:
+            flash("We're a little busy right now. Please try again.", "danger")
+            return render_template("signup.html"), 503, {"Retry-After": "1"}
         new_user = User(username=username, password=hashed_password)
 
         db.session.add(new_user)
@@ -263,8 +3688,19 @@ def login():
         username = request.form["username"]
         password = request.form["password"]
         user = User.query.filter_by(username=username).first()
-        if user and check_password_hash(user.password, password):
-            # Store user info in session upon successful login
+        try:
+            valid = user and password_hasher.check(user.password, password)
+            # Upgrading the stored hash if the hashing settings changed since it was made
+            if valid and password_hasher.needs_rehash(user.password):
+                user.password = password_hasher.hash(password)
+                db.session.commit()
+        except PasswordHasherBusy:
+            flash("We're a little busy right now. Please try again.", "danger")
+            return render_template("login.html"), 503, {"Retry-After": "1"}
+        if valid:
+            # Store user info in a fresh session upon successful login
+            session.clear()
+            session.regenerate()
             session["user_id"] = user.user_id
             session["username"] = user.username
             flash("Logged in successfully!", "success")
@@ -278,81 +3714,97 @@ def login():
 @app.route("/logout", methods=["POST"])
 def logout():
     session.clear()
+    session.regenerate()
     flash("You have been logged out.", "success")
     return redirect(url_for("login"))
 
 
+# The week a planner form was posted from, the page sends it along with the form so looking at
+# another week doesn't have to remember anything
+def posted_calendar_date():
+    try:
+        date = datetime.datetime.strptime(
+            request.form.get("calendar_date") or "", "%Y-%m-%d"
+        ).date()
+    except ValueError:
+        return None
+    return (date - datetime.timedelta(days=date.weekday())).strftime("%Y-%m-%d")
+
+
 # Route to update categories and tasks
 @app.route("/update_categories_and_tasks", methods=["POST"])
 def update_categories_and_tasks():
     user_id = session.get("user_id")
-    calendar_date = session.get("calendar_date")
+    calendar_date = posted_calendar_date()
 
     if not user_id:
         flash("Please login to perform this action", "danger")
         return redirect(url_for("login"))
 
-    # Fetch the calendar for the current week
-    calendar = Calendar.query.filter_by(user_id=user_id, date=calendar_date).first()
-    if not calendar:
+    if not calendar_date:
         flash("Error: Calendar not found.", "danger")
         return redirect(url_for("index"))
 
+    # Fetch the calendar for the current week, a new week gets saved with its first edit
+    try:
+        calendar = get_or_create_calendar(
+            user_id, datetime.datetime.strptime(calendar_date, "%Y-%m-%d").date()
+        )
+    except WeekArchived:
+        flash("This week is archived and can't be changed.", "danger")
+        return redirect(url_for("index", calendar_date=calendar_date))
+
     # Fetch categories for the current user and calendar
-    categories = Category.query.filter_by(
-        user_id=user_id, calendar_id=calendar.calendar_id
-    ).all()
+    categories = load_categories(user_id, calendar)
+    task_inputs = category_task_inputs(categories)
+    inputs = form_inputs_to_save(
+        calendar,
+        {
+            **{f"category{i}": i for i in range(1, CATEGORIES_PER_WEEK + 1)},
+            **task_inputs,
+        },
+    )
+    changed = {}
 
     # Update categories based on form input
-    for i in range(1, 8):  # Only allow up to 7 categories
+    for i in range(1, CATEGORIES_PER_WEEK + 1):  # Only allow up to 7 categories
         category_name = request.form.get(f"category{i}")
 
-        if category_name:
+        if category_name and f"category{i}" in inputs:
             if i <= len(categories):
                 # Update existing category
-                categories[i - 1].category_name = category_name
+                if categories[i - 1].category_name != category_name:
+                    categories[i - 1].category_name = category_name
+                    changed[f"category{i}"] = category_name
             else:
                 # Add new category if under the limit
-                if len(categories) < 7:
+                if len(categories) < CATEGORIES_PER_WEEK:
                     new_category = Category(
                         user_id=user_id,
                         calendar_id=calendar.calendar_id,
                         category_name=category_name,
                     )
                     db.session.add(new_category)
+                    changed[f"category{i}"] = category_name
 
-    # Update or add tasks for each category
-    for category in categories:
-        for j in range(1, 9):  # Assume up to 8 tasks per category
-            task_name = request.form.get(
-                f"action{j}_category{categories.index(category) + 1}"
-            )
-            existing_task = Task.query.filter_by(
-                category_id=category.category_id,
-                calendar_id=calendar.calendar_id,
-                slot_number=j,
-            ).first()
-
-            if task_name:
-                if existing_task:
-                    # Update existing task
-                    existing_task.task_name = task_name
-                else:
-                    # Add new task with slot_number
-                    new_task = Task(
-                        task_name=task_name,
-                        category_id=category.category_id,
-                        calendar_id=calendar.calendar_id,
-                        slot_number=j,
-                    )
-                    db.session.add(new_task)
-            else:
-                # If task is empty and exists, delete it
-                if existing_task:
-                    db.session.delete(existing_task)
+    # Only the cells that changed get written
+    saved = save_category_tasks(
+        calendar,
+        {
+            cell: request.form.get(name)
+            for name, cell in task_inputs.items()
+            if name in inputs
+        },
+    )
+    changed.update(changed_inputs(task_inputs, saved))
+
+    if changed:
+        bump_week_version(calendar)
 
     try:
         db.session.commit()
+        week_cache.invalidate(user_id, calendar_date)
+        publish_week_changes(user_id, calendar_date, calendar, changed)
         flash("Categories and tasks updated successfully!", "success")
     except Exception as e:
         print("Error saving categories and tasks:", e)
@@ -369,57 +3821,42 @@ def update_categories_and_tasks():
 @app.route("/assign_task_to_day", methods=["POST"])
 def assign_task_to_day():
     user_id = session.get("user_id")
-    calendar_date = session.get(
-        "calendar_date"
-    )  # Get the current calendar date from the session
+    calendar_date = posted_calendar_date()  # The week the form was posted from
 
     if not user_id:
         flash("You need to be logged in to perform this action", "danger")
         return redirect(url_for("login"))
 
-    # Fetch the calendar for the current date
-    calendar = Calendar.query.filter_by(user_id=user_id, date=calendar_date).first()
-    if not calendar:
+    if not calendar_date:
         flash("Error: Calendar not found.", "danger")
         return redirect(url_for("index"))
 
-    days_of_week = [
-        "Monday",
-        "Tuesday",
-        "Wednesday",
-        "Thursday",
-        "Friday",
-        "Saturday",
-        "Sunday",
-    ]
+    # Fetch the calendar for the current week, a new week gets saved with its first edit
+    try:
+        calendar = get_or_create_calendar(
+            user_id, datetime.datetime.strptime(calendar_date, "%Y-%m-%d").date()
+        )
+    except WeekArchived:
+        flash("This week is archived and can't be changed.", "danger")
+        return redirect(url_for("index", calendar_date=calendar_date))
 
-    for day in days_of_week:
-        for i in range(1, 8):
-            task_name = request.form.get(f"{day.lower()}_task{i}")
-
-            existing_task = Task.query.filter_by(
-                assigned_day=day, slot_number=i, calendar_id=calendar.calendar_id
-            ).first()
-
-            if task_name:
-                if existing_task:
-                    if existing_task.task_name != task_name:
-                        existing_task.task_name = task_name
-                else:
-                    # Create a new task and assign to the day and slot
-                    new_task = Task(
-                        task_name=task_name,
-                        calendar_id=calendar.calendar_id,
-                        assigned_day=day,
-                        slot_number=i,
-                    )
-                    db.session.add(new_task)
-            else:
-                if existing_task:
-                    db.session.delete(existing_task)
+    # Only the cells that changed get written
+    inputs = form_inputs_to_save(calendar, DAY_TASK_INPUTS)
+    changed = changed_inputs(
+        inputs,
+        save_day_tasks(
+            calendar,
+            {cell: request.form.get(name) for name, cell in inputs.items()},
+        ),
+    )
+
+    if changed:
+        bump_week_version(calendar)
 
     try:
         db.session.commit()
+        week_cache.invalidate(user_id, calendar_date)
+        publish_week_changes(user_id, calendar_date, calendar, changed)
         flash("Tasks assigned to days successfully!", "success")
     except Exception as e:
         # Handle errors during the commit
@@ -434,97 +3871,43 @@ def assign_task_to_day():
 @app.route("/schedule_task_time_slot", methods=["POST"])
 def schedule_task_time_slot():
     user_id = session.get("user_id")
-    calendar_date = session.get(
-        "calendar_date"
-    )  # Get the current calendar date from the first session
+    calendar_date = posted_calendar_date()  # The week the form was posted from
 
     if not user_id:
         flash("You need to be logged in to assign time slots", "danger")
         return redirect(url_for("login"))
 
-    # Fetching the calendar for the current date
-    calendar = Calendar.query.filter_by(user_id=user_id, date=calendar_date).first()
-    if not calendar:
+    if not calendar_date:
         flash("Error: Calendar not found.", "danger")
         return redirect(url_for("index"))
 
-    days_of_week = [
-        "Monday",
-        "Tuesday",
-        "Wednesday",
-        "Thursday",
-        "Friday",
-        "Saturday",
-        "Sunday",
-    ]
-    time_slots = [
-        "7 AM",
-        "8 AM",
-        "9 AM",
-        "10 AM",
-        "11 AM",
-        "12 PM",
-        "1 PM",
-        "2 PM",
-        "3 PM",
-        "4 PM",
-        "5 PM",
-        "6 PM",
-        "7 PM",
-        "8 PM",
-        "9 PM",
-    ]
+    # Fetch the calendar for the current week, a new week gets saved with its first edit
+    try:
+        calendar = get_or_create_calendar(
+            user_id, datetime.datetime.strptime(calendar_date, "%Y-%m-%d").date()
+        )
+    except WeekArchived:
+        flash("This week is archived and can't be changed.", "danger")
+        return redirect(url_for("index", calendar_date=calendar_date))
 
-    for day in days_of_week:
-        for time_slot in time_slots:
-            input_name = f'schedule_{time_slot.replace(" ", "").lower()}_{day.lower()}'
-            task_name = request.form.get(input_name)
-
-            # Find the existing schedule for the given day and time slot for the user
-            existing_schedule = (
-                Schedule.query.join(Task)
-                .filter(
-                    Schedule.user_id == user_id,
-                    Schedule.day_of_week == day,
-                    Schedule.time_slot == time_slot,
-                    Task.calendar_id == calendar.calendar_id,
-                )
-                .first()
-            )
-
-            if task_name:
-                if existing_schedule:
-                    # This allows the user to edit the existing task name if changed
-                    existing_task = Task.query.get(existing_schedule.task_id)
-                    if existing_task and existing_task.task_name != task_name:
-                        existing_task.task_name = task_name
-                else:
-                    # Create a new task and schedule entry
-                    new_task = Task(
-                        task_name=task_name,
-                        assigned_day=day,
-                        calendar_id=calendar.calendar_id,
-                    )
-                    db.session.add(new_task)
-                    db.session.flush()  # Get the ID of the new task without committing
+    # Only the cells that changed get written
+    inputs = form_inputs_to_save(calendar, SCHEDULE_INPUTS)
+    changed = changed_inputs(
+        inputs,
+        save_schedule_tasks(
+            user_id,
+            calendar,
+            {cell: request.form.get(name) for name, cell in inputs.items()},
+        ),
+    )
 
-                    new_schedule = Schedule(
-                        user_id=user_id,
-                        task_id=new_task.task_id,
-                        day_of_week=day,
-                        time_slot=time_slot,
-                    )
-                    db.session.add(new_schedule)
-            else:
-                # If no task name is provided, we delete existing schedule and task
-                if existing_schedule:
-                    existing_task = Task.query.get(existing_schedule.task_id)
-                    db.session.delete(existing_schedule)
-                    if existing_task:
-                        db.session.delete(existing_task)
+    if changed:
+        bump_week_version(calendar)
 
     try:
         db.session.commit()
+        week_cache.invalidate(user_id, calendar_date)
+        publish_week_changes(user_id, calendar_date, calendar, changed)
         flash("Schedule updated successfully!", "success")
     except Exception as e:
         print("Error saving schedule:", e)
@@ -534,6 +3917,515 @@ def schedule_task_time_slot():
     return redirect(url_for("index", calendar_date=calendar_date))
 
 
+# Raised when cells sent for a week aren't inputs of its planner page
+class UnknownCells(Exception):
+    def __init__(self, cells):
+        super().__init__(f"Unknown cells: {', '.join(cells)}")
+        self.cells = cells
+
+
+# Saves a set of a week's cells, {input name: value}, without committing. A week that was never
+# edited gets saved with its first cell. Returns the calendar and the cells that actually changed
+def save_week_cells(user_id, week_start_date, cells):
+    calendar = get_or_create_calendar(user_id, week_start_date)
+    categories = load_categories(user_id, calendar)
+    category_inputs = {
+        f"category{index}": category
+        for index, category in enumerate(categories, start=1)
+    }
+    category_task_cells = category_task_inputs(categories)
+
+    unknown = [
+        name
+        for name in cells
+        if name not in category_inputs
+        and name not in category_task_cells
+        and name not in DAY_TASK_INPUTS
+        and name not in SCHEDULE_INPUTS
+    ]
+    if unknown:
+        raise UnknownCells(unknown)
+
+    changed = {}
+
+    # Category names can be renamed but not cleared, same as the form
+    for name, category in category_inputs.items():
+        category_name = cells.get(name)
+        if category_name and category.category_name != category_name:
+            category.category_name = category_name
+            changed[name] = category_name
+
+    # Each grid only gets the cells that were sent, so the untouched ones stay as they are
+    def sent_cells(inputs):
+        return {cell: cells[name] for name, cell in inputs.items() if name in cells}
+
+    saved = {}
+    if sent_cells(category_task_cells):
+        saved.update(save_category_tasks(calendar, sent_cells(category_task_cells)))
+    if sent_cells(DAY_TASK_INPUTS):
+        saved.update(save_day_tasks(calendar, sent_cells(DAY_TASK_INPUTS)))
+    if sent_cells(SCHEDULE_INPUTS):
+        saved.update(
+            save_schedule_tasks(user_id, calendar, sent_cells(SCHEDULE_INPUTS))
+        )
+
+    # The grids' cells never overlap, so they can be mapped back to input names together
+    for inputs in (category_task_cells, DAY_TASK_INPUTS, SCHEDULE_INPUTS):
+        changed.update(changed_inputs(inputs, saved))
+
+    if changed:
+        bump_week_version(calendar)
+    return calendar, changed
+
+
+# Reads the {"cells": {input name: value}} body of the cell APIs, None if it isn't one
+def request_cells():
+    cells = (request.get_json(silent=True) or {}).get("cells")
+    if not isinstance(cells, dict) or not all(
+        isinstance(value, str) for value in cells.values()
+    ):
+        return None
+    return cells
+
+
+# The week the <calendar_date> of an API route falls in, any day of it stands for the week like it
+# does on the planner page. None when it isn't a date
+def api_week_start(calendar_date):
+    try:
+        date = datetime.datetime.strptime(calendar_date, "%Y-%m-%d").date()
+    except ValueError:
+        return None
+    return date - datetime.timedelta(days=date.weekday())
+
+
+# API route to save only the edited cells of a week, the page sends {"cells": {input name: value}}
+# and gets back just the cells that actually changed
+@app.route("/api/week/<calendar_date>/cells", methods=["PATCH"])
+def patch_week_cells(calendar_date):
+    user_id = session.get("user_id")
+    if not user_id:
+        return jsonify(error="Please login to perform this action"), 401
+
+    week_start_date = api_week_start(calendar_date)
+    if week_start_date is None:
+        return jsonify(error="Invalid calendar date."), 400
+
+    cells = request_cells()
+    if cells is None:
+        return jsonify(error="Expected a JSON object of cells."), 400
+
+    try:
+        calendar, changed = save_week_cells(user_id, week_start_date, cells)
+    except UnknownCells as e:
+        return jsonify(error="Unknown cells.", cells=e.cells), 400
+    except WeekArchived:
+        return jsonify(error="This week is archived and can't be changed."), 409
+
+    try:
+        db.session.commit()
+        week_cache.invalidate(user_id, week_start_date)
+        publish_week_changes(user_id, week_start_date, calendar, changed)
+    except Exception as e:
+        print("Error saving cells:", e)
+        db.session.rollback()
+        return jsonify(error="An error occurred while saving. Please try again."), 500
+
+    return jsonify(cells=changed)
+
+
+# API route for autosaving cells as they're typed, same body as the PATCH route. The cells only
+# get queued for the autosave writer and are acknowledged right away
+@app.route("/api/week/<calendar_date>/autosave", methods=["POST"])
+def autosave_week_cells(calendar_date):
+    user_id = session.get("user_id")
+    if not user_id:
+        return jsonify(error="Please login to perform this action"), 401
+
+    week_start_date = api_week_start(calendar_date)
+    if week_start_date is None:
+        return jsonify(error="Invalid calendar date."), 400
+
+    cells = request_cells()
+    if cells is None:
+        return jsonify(error="Expected a JSON object of cells."), 400
+    unknown = [name for name in cells if name not in PAGE_INPUT_NAMES]
+    if unknown:
+        return jsonify(error="Unknown cells.", cells=unknown), 400
+
+    # The writer couldn't save into an archived week either, so the page hears about it now
+    recurring_version, calendar, archived_week = find_week_calendar(
+        user_id, week_start_date
+    )
+    if calendar is None and archived_week is not None:
+        return jsonify(error="This week is archived and can't be changed."), 409
+
+    try:
+        autosave_queue.enqueue(user_id, week_start_date, cells)
+    except AutosaveQueueFull:
+        return (
+            jsonify(error="Too many unsaved changes, please try again."),
+            503,
+            {"Retry-After": "1"},
+        )
+    return jsonify(queued=len(cells)), 202
+
+
+# One server-sent event with cells of a week, its id is the week's version after them
+def week_cells_event(version, cells):
+    data = json.dumps({"version": version, "cells": cells})
+    return f"id: {version}\nevent: cells\ndata: {data}\n\n"
+
+
+# Polling route that keeps an open planner page in sync without holding anything open in between.
+# The page sends the version of the week it has, and gets nothing back (204) while that's still the
+# stored one, or else the week's cells. One indexed lookup per poll, the week comes from the cache
+@app.route("/api/week/<calendar_date>/changes")
+def week_changes(calendar_date):
+    if app.config["LIVE_SYNC"] == "off":
+        return jsonify(error="Live sync is turned off."), 404
+
+    user_id = session.get("user_id")
+    if not user_id:
+        return jsonify(error="Please login to perform this action"), 401
+
+    week_start_date = api_week_start(calendar_date)
+    if week_start_date is None:
+        return jsonify(error="Invalid calendar date."), 400
+
+    recurring_version, calendar, archived_week = find_week_calendar(
+        user_id, week_start_date
+    )
+    # Archived weeks don't change anymore
+    unchanged = request.args.get("version") == str(calendar.version if calendar else 0)
+    if unchanged or (calendar is None and archived_week is not None):
+        return "", 204
+
+    week = page_week(
+        user_id, week_start_date, recurring_version, calendar, archived_week
+    )
+    return jsonify(version=week["version"], cells=week_cell_values(week))
+
+
+# Server-sent events route that keeps an open planner page in sync, it streams the cells saved to
+# the week from any other tab or device. A page that opened (or reconnects with) an older version
+# of the week than the stored one gets the whole week first. Waiting for events holds no database
+# connection, so idle pages are cheap on async workers
+@app.route("/api/week/<calendar_date>/events")
+def week_event_stream(calendar_date):
+    if app.config["LIVE_SYNC"] != "stream":
+        return jsonify(error="Live sync doesn't stream here."), 404
+
+    user_id = session.get("user_id")
+    if not user_id:
+        return jsonify(error="Please login to perform this action"), 401
+
+    week_start_date = api_week_start(calendar_date)
+    if week_start_date is None:
+        return jsonify(error="Invalid calendar date."), 400
+
+    # Subscribing before the week gets read, so nothing saved in between goes missing
+    subscription = week_events.subscribe(user_id, week_start_date)
+    if subscription is None:
+        # Browsers don't reopen a stream that got turned away, the page polls instead
+        return (
+            jsonify(error="Too many open pages, please poll for changes instead."),
+            503,
+            {"Retry-After": "30"},
+        )
+
+    def week_cells():
+        week = page_week(
+            user_id, week_start_date, *find_week_calendar(user_id, week_start_date)
+        )
+        return week["version"], week_cell_values(week)
+
+    # Browsers send back the id of the last event they got when they reconnect
+    page_version = request.headers.get("Last-Event-ID") or request.args.get("version")
+    version, cells = week_cells()
+    first = "" if page_version == str(version) else week_cells_event(version, cells)
+    db.session.close()
+
+    heartbeat = app.config["LIVE_SYNC_HEARTBEAT"]
+    closes_at = time.monotonic() + app.config["LIVE_SYNC_MAX_DURATION"]
+
+    def generate():
+        yield first + ": connected\n\n"
+        while time.monotonic() < closes_at:
+            if subscription.missed:
+                # The page fell too far behind, so it gets the whole week again
+                subscription.missed = False
+                while not subscription.messages.empty():
+                    subscription.messages.get_nowait()
+                with app.app_context():
+                    event = week_cells_event(*week_cells())
+                yield event
+                continue
+            try:
+                message = subscription.messages.get(timeout=heartbeat)
+            except queue.Empty:
+                yield ": keep-alive\n\n"
+                continue
+            yield week_cells_event(message["version"], message["cells"])
+
+    response = Response(
+        generate(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+    response.call_on_close(lambda: week_events.unsubscribe(subscription))
+    return response
+
+
+# Recurring tasks as JSON for the API, with the days spelled out
+def recurring_task_json(rule):
+    return {
+        "recurring_task_id": rule.recurring_task_id,
+        "task_name": rule.task_name,
+        "days": [day for i, day in enumerate(DAYS_OF_WEEK) if rule.days & (1 << i)],
+        "time_slot": rule.time_slot,
+        "slot_number": rule.slot_number,
+        "start_date": rule.start_date.strftime("%Y-%m-%d"),
+        "end_date": rule.end_date.strftime("%Y-%m-%d") if rule.end_date else None,
+        "interval_weeks": rule.interval_weeks,
+    }
+
+
+# Recurring tasks show up in every week, so changing them has to refresh all of the user's weeks
+def bump_recurring_version(user_id):
+    db.session.execute(
+        update(User)
+        .where(User.user_id == user_id)
+        .values(recurring_version=User.recurring_version + 1)
+    )
+
+
+# Reads a recurring task out of the JSON sent to the API. The cell is the input name of a day task
+# or hour slot, and the task repeats on that cell's day unless other days are given
+def parse_recurring_task(data, user_id):
+    cell = data.get("cell")
+    if cell in DAY_TASK_INPUTS:
+        day, slot_number = DAY_TASK_INPUTS[cell]
+        time_slot = None
+    elif cell in SCHEDULE_INPUTS:
+        day, time_slot = SCHEDULE_INPUTS[cell]
+        slot_number = None
+    else:
+        raise ValueError("Recurring tasks can only go in the day or hour grids.")
+
+    task_name = data.get("task_name")
+    if not isinstance(task_name, str) or not task_name.strip():
+        raise ValueError("Recurring tasks need a name.")
+
+    days = data.get("days", [day])
+    if (
+        not isinstance(days, list)
+        or not days
+        or not all(day in DAYS_OF_WEEK for day in days)
+    ):
+        raise ValueError(f"Days have to be some of {', '.join(DAYS_OF_WEEK)}.")
+
+    def monday(value):
+        if not isinstance(value, str):
+            raise ValueError("Dates have to look like 2024-01-31.")
+        date = datetime.datetime.strptime(value, "%Y-%m-%d").date()
+        return date - datetime.timedelta(days=date.weekday())
+
+    start_date = monday(
+        data.get("start_date") or datetime.date.today().strftime("%Y-%m-%d")
+    )
+    end_date = monday(data["end_date"]) if data.get("end_date") else None
+    if end_date is not None and end_date < start_date:
+        raise ValueError("The task stops repeating before it starts.")
+
+    interval_weeks = data.get("interval_weeks", 1)
+    if type(interval_weeks) is not int or interval_weeks < 1:
+        raise ValueError("The interval has to be a whole number of weeks.")
+
+    return RecurringTask(
+        user_id=user_id,
+        task_name=task_name,
+        days=sum(1 << DAYS_OF_WEEK.index(day) for day in set(days)),
+        time_slot=time_slot,
+        slot_number=slot_number,
+        start_date=start_date,
+        end_date=end_date,
+        interval_weeks=interval_weeks,
+    )
+
+
+# A recurring task the way recurring_task_json() (and so the exports) writes it, checked just like
+# one coming in through the API. Its cell is the one it has on its first day
+def recurring_task_from_json(record, user_id):
+    days = record.get("days")
+    day = days[0] if isinstance(days, list) and days else None
+    if record.get("time_slot") is not None:
+        cell = SCHEDULE_NAMES.get((day, record["time_slot"]))
+    else:
+        cell = DAY_TASK_NAMES.get((day, record.get("slot_number")))
+    return parse_recurring_task({**record, "cell": cell}, user_id)
+
+
+# API routes for the recurring tasks, they get filled into the weeks as they're viewed instead of
+# being copied into every week
+@app.route("/api/recurring", methods=["GET", "POST"])
+def recurring_tasks():
+    user_id = session.get("user_id")
+    if not user_id:
+        return jsonify(error="Please login to perform this action"), 401
+
+    if request.method == "GET":
+        rules = (
+            RecurringTask.query.filter_by(user_id=user_id)
+            .order_by(RecurringTask.recurring_task_id)
+            .all()
+        )
+        return jsonify(recurring=[recurring_task_json(rule) for rule in rules])
+
+    try:
+        rule = parse_recurring_task(request.get_json(silent=True) or {}, user_id)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+
+    db.session.add(rule)
+    bump_recurring_version(user_id)
+    try:
+        db.session.commit()
+        week_cache.invalidate_user(user_id)
+    except Exception as e:
+        print("Error saving recurring task:", e)
+        db.session.rollback()
+        return jsonify(error="An error occurred while saving. Please try again."), 500
+
+    return jsonify(recurring_task_json(rule)), 201
+
+
+@app.route("/api/recurring/<int:recurring_task_id>", methods=["DELETE"])
+def delete_recurring_task(recurring_task_id):
+    user_id = session.get("user_id")
+    if not user_id:
+        return jsonify(error="Please login to perform this action"), 401
+
+    rule = RecurringTask.query.filter_by(
+        user_id=user_id, recurring_task_id=recurring_task_id
+    ).first()
+    if rule is None:
+        return jsonify(error="Recurring task not found."), 404
+
+    db.session.execute(
+        delete(RecurringException).where(
+            RecurringException.recurring_task_id == recurring_task_id
+        )
+    )
+    db.session.delete(rule)
+    bump_recurring_version(user_id)
+    try:
+        db.session.commit()
+        week_cache.invalidate_user(user_id)
+    except Exception as e:
+        print("Error deleting recurring task:", e)
+        db.session.rollback()
+        return jsonify(error="An error occurred while deleting. Please try again."), 500
+
+    return "", 204
+
+
+# API route returning every week between two dates as JSON lines, one week per line, so a month or
+# a whole term loads with one request instead of stepping through the weeks
+@app.route("/api/range")
+def week_range():
+    user_id = session.get("user_id")
+    if not user_id:
+        return jsonify(error="Please login to perform this action"), 401
+
+    try:
+        from_date, to_date = parse_week_range(request.args)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+
+    def generate():
+        for week_start_date, week in iter_weeks(user_id, from_date, to_date):
+            week["week_start_date"] = week_start_date.strftime("%Y-%m-%d")
+            yield json.dumps(week) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+
+# Route for the month/term view, the page itself loads the weeks from the range API
+@app.route("/range")
+def range_view():
+    user_id = session.get("user_id")
+    if not user_id:
+        flash("Please login to be able to use your planner!", "danger")
+        return redirect(url_for("login"))
+
+    try:
+        from_date, to_date = parse_week_range(request.args)
+    except ValueError as e:
+        flash(str(e), "danger")
+        return redirect(url_for("index"))
+
+    return render_template(
+        "range.html",
+        from_date=from_date,
+        last_day=to_date + datetime.timedelta(days=6),
+        range_url=url_for(
+            "week_range",
+            **{
+                "from": from_date.strftime("%Y-%m-%d"),
+                "to": to_date.strftime("%Y-%m-%d"),
+            },
+        ),
+        days_of_week=DAYS_OF_WEEK,
+        time_slots=TIME_SLOTS,
+        username=session.get("username"),
+    )
+
+
+# Route for downloading a user's whole planner history, as JSON lines (for backups and moving
+# between installs) or as an iCalendar file for other calendar apps. Streamed as it's read
+@app.route("/export")
+def export_planner():
+    user_id = session.get("user_id")
+    if not user_id:
+        return jsonify(error="Please login to perform this action"), 401
+
+    export_format = request.args.get("format", "jsonl")
+    if export_format == "jsonl":
+        body = (json.dumps(record) + "\n" for record in export_jsonl(user_id))
+        mimetype = "application/x-ndjson"
+    elif export_format == "ics":
+        body = export_ics(user_id)
+        mimetype = "text/calendar"
+    else:
+        return jsonify(error="The format has to be jsonl or ics."), 400
+
+    response = Response(stream_with_context(body), mimetype=mimetype)
+    response.headers["Content-Disposition"] = (
+        f"attachment; filename=schedulify.{export_format}"
+    )
+    return response
+
+
+# Route for loading a JSON lines export back in, the file is read line by line as it's uploaded
+@app.route("/import", methods=["POST"])
+def import_planner():
+    user_id = session.get("user_id")
+    if not user_id:
+        return jsonify(error="Please login to perform this action"), 401
+    if "file" not in request.files:
+        return jsonify(error="Please upload an exported .jsonl file."), 400
+
+    try:
+        summary = import_jsonl(
+            user_id, io.TextIOWrapper(request.files["file"].stream, encoding="utf-8")
+        )
+    except (ValueError, KeyError, UnicodeDecodeError, IntegrityError) as e:
+        print("Error importing planner:", e)
+        return jsonify(error=f"The file isn't a valid planner export. {e}"), 400
+
+    return jsonify(summary)
+
+
 # Route for the user to navigate to the previous week's calendar, everything should be saved from when they used it
 @app.route("/previous_calendar/<calendar_date>")
 def previous_calendar(calendar_date):
@@ -564,5 +4456,319 @@ def next_calendar(calendar_date):
     return redirect(url_for("index", calendar_date=next_week_date.strftime("%Y-%m-%d")))
 
 
+# CLI command to move every week's hour grid to the configured storage format, e.g.
+#   SCHEDULE_STORAGE=grid flask convert-schedules
+@app.cli.command("convert-schedules")
+@click.option("--to", "storage", type=click.Choice(["rows", "grid"]), default=None)
+@click.option("--batch-size", default=500, help="Calendars converted per transaction")
+def convert_schedules(storage, batch_size):
+    storage = storage or app.config["SCHEDULE_STORAGE"]
+    converted = 0
+    last_calendar_id = 0
+    while True:
+        calendars = (
+            Calendar.query.filter(Calendar.calendar_id > last_calendar_id)
+            .order_by(Calendar.calendar_id)
+            .limit(batch_size)
+            .all()
+        )
+        if not calendars:
+            break
+        last_calendar_id = calendars[-1].calendar_id
+        for calendar in calendars:
+            convert_schedule_storage(calendar, storage)
+        db.session.commit()
+        converted += len(calendars)
+    click.echo(f"Converted {converted} calendars to {storage} schedule storage.")
+
+
+# CLI command to create the tables of a new database (and the ones added since for an old one),
+# run it before `flask db upgrade` when installing or updating
+@app.cli.command("init-db")
+def init_db_command():
+    init_db()
+    click.echo("Created the missing tables.")
+
+
+# CLI command to drop the expired sessions right away, the app also does it every few minutes
+@app.cli.command("sweep-sessions")
+def sweep_sessions():
+    swept = session_store.sweep()
+    if swept is not None:
+        click.echo(f"Swept {swept} expired sessions.")
+    else:
+        click.echo("Swept the expired sessions.")
+
+
+# Yields batches of (calendar_id, user_id, date) for the saved weeks before a date that have
+# nothing in them: no tasks and the default categories. Older versions saved a week as soon as it
+# was opened, and these look exactly like the weeks that were never saved
+def find_empty_weeks(before, batch_size):
+    default_names = [category.category_name for category in default_categories(None)]
+    last_calendar_id = 0
+    while True:
+        calendars = db.session.execute(
+            select(Calendar.calendar_id, Calendar.user_id, Calendar.date)
+            .where(
+                Calendar.calendar_id > last_calendar_id,
+                Calendar.date < before,
+                ~select(Task.task_id)
+                .where(Task.calendar_id == Calendar.calendar_id)
+                .exists(),
+            )
+            .order_by(Calendar.calendar_id)
+            .limit(batch_size)
+        ).all()
+        if not calendars:
+            return
+        last_calendar_id = calendars[-1].calendar_id
+
+        category_names = {}
+        for calendar_id, category_name in db.session.execute(
+            select(Category.calendar_id, Category.category_name)
+            .where(Category.calendar_id.in_([row.calendar_id for row in calendars]))
+            .order_by(Category.category_id)
+        ):
+            category_names.setdefault(calendar_id, []).append(category_name)
+        yield [
+            row
+            for row in calendars
+            if category_names.get(row.calendar_id, default_names) == default_names
+        ]
+
+
+# Deletes the empty weeks before a date, returns how many there were
+def prune_empty_weeks(before, batch_size):
+    pruned = 0
+    for calendars in find_empty_weeks(before, batch_size):
+        calendar_ids = [row.calendar_id for row in calendars]
+        db.session.execute(
+            delete(Category).where(Category.calendar_id.in_(calendar_ids))
+        )
+        db.session.execute(
+            delete(Calendar).where(Calendar.calendar_id.in_(calendar_ids))
+        )
+        db.session.commit()
+        for row in calendars:
+            week_cache.invalidate(row.user_id, row.date)
+        pruned += len(calendars)
+    return pruned
+
+
+# Moves the weeks before a date out of the planner tables into the archive, batch_size weeks per
+# transaction. Returns how many weeks were archived
+def archive_weeks(before, batch_size):
+    archived = 0
+    while True:
+        calendars = (
+            Calendar.query.filter(Calendar.date < before)
+            .order_by(Calendar.calendar_id)
+            .limit(batch_size)
+            .all()
+        )
+        if not calendars:
+            return archived
+        calendar_ids = [calendar.calendar_id for calendar in calendars]
+
+        categories = {}
+        for category in Category.query.filter(
+            Category.calendar_id.in_(calendar_ids)
+        ).order_by(Category.category_id):
+            categories.setdefault(category.calendar_id, []).append(category)
+        tasks = {}
+        for task in Task.query.filter(Task.calendar_id.in_(calendar_ids)).order_by(
+            Task.task_id
+        ):
+            tasks.setdefault(task.calendar_id, []).append(task)
+        schedules = {}
+        for calendar_id, day_of_week, time_slot, task_id in db.session.execute(
+            select(
+                Task.calendar_id,
+                Schedule.day_of_week,
+                Schedule.time_slot,
+                Schedule.task_id,
+            )
+            .join(Task, Schedule.task_id == Task.task_id)
+            .where(Task.calendar_id.in_(calendar_ids))
+            .order_by(Schedule.schedule_id)
+        ):
+            schedules.setdefault(calendar_id, []).append(
+                (day_of_week, time_slot, task_id)
+            )
+        for calendar in calendars:
+            if calendar.schedule_grid is not None:
+                schedules.setdefault(calendar.calendar_id, []).extend(
+                    (day_of_week, time_slot, task_id)
+                    for (day_of_week, time_slot), task_id in decode_schedule_grid(
+                        calendar.schedule_grid
+                    ).items()
+                )
+
+        db.session.execute(
+            insert(ArchivedWeek),
+            [
+                {
+                    "user_id": calendar.user_id,
+                    "date": calendar.date,
+                    "data": pack_week(
+                        calendar,
+                        categories.get(calendar.calendar_id, []),
+                        tasks.get(calendar.calendar_id, []),
+                        schedules.get(calendar.calendar_id, []),
+                    ),
+                }
+                for calendar in calendars
+            ],
+        )
+        week_tasks = select(Task.task_id).where(Task.calendar_id.in_(calendar_ids))
+        db.session.execute(delete(Schedule).where(Schedule.task_id.in_(week_tasks)))
+        db.session.execute(delete(Task).where(Task.calendar_id.in_(calendar_ids)))
+        db.session.execute(
+            delete(Category).where(Category.calendar_id.in_(calendar_ids))
+        )
+        db.session.execute(
+            delete(Calendar).where(Calendar.calendar_id.in_(calendar_ids))
+        )
+        db.session.commit()
+        for calendar in calendars:
+            week_cache.invalidate(calendar.user_id, calendar.date)
+        archived += len(calendars)
+
+
+# CLI command to keep the planner tables small, run it every now and then (e.g. from cron):
+#   flask compact-weeks --older-than-weeks 26 --vacuum
+# Empty weeks before the current one get deleted, they show up the same without their rows, and
+# the weeks older than the horizon get moved into the archive, where they stay readable
+@app.cli.command("compact-weeks")
+@click.option(
+    "--older-than-weeks",
+    type=click.IntRange(min=1),
+    default=None,
+    help="Archive the weeks older than this (ARCHIVE_AFTER_WEEKS by default)",
+)
+@click.option("--dry-run", is_flag=True, help="Only count what would be done")
+@click.option("--vacuum", is_flag=True, help="Give the freed space back (SQLite)")
+def compact_weeks(older_than_weeks, dry_run, vacuum):
+    older_than_weeks = older_than_weeks or app.config["ARCHIVE_AFTER_WEEKS"]
+    batch_size = app.config["ARCHIVE_BATCH_SIZE"]
+    today = datetime.date.today()
+    current_week = today - datetime.timedelta(days=today.weekday())
+    horizon = current_week - datetime.timedelta(weeks=older_than_weeks)
+
+    if dry_run:
+        empty_weeks = [
+            row
+            for calendars in find_empty_weeks(current_week, batch_size)
+            for row in calendars
+        ]
+        old_weeks = db.session.scalar(
+            select(func.count()).select_from(Calendar).where(Calendar.date < horizon)
+        )
+        click.echo(
+            f"Would prune {len(empty_weeks)} empty weeks and archive "
+            f"{old_weeks - sum(row.date < horizon for row in empty_weeks)} weeks "
+            f"from before {horizon}."
+        )
+        return
+
+    pruned = prune_empty_weeks(current_week, batch_size)
+    archived = archive_weeks(horizon, batch_size)
+    click.echo(
+        f"Pruned {pruned} empty weeks and archived {archived} weeks from before {horizon}."
+    )
+
+    if vacuum and db.engine.dialect.name == "sqlite":
+        # VACUUM can't run inside a transaction
+        with db.engine.connect().execution_options(
+            isolation_level="AUTOCOMMIT"
+        ) as connection:
+            connection.exec_driver_sql("VACUUM")
+        click.echo("Vacuumed the database.")
+
+
+# CLI commands to export a user's planner to a file (or stdout) and to import one, e.g.
+#   flask export-planner corey --format ics --output corey.ics
+#   flask import-planner corey corey.jsonl
+@app.cli.command("export-planner")
+@click.argument("username")
+@click.option(
+    "--format", "export_format", type=click.Choice(["jsonl", "ics"]), default="jsonl"
+)
+@click.option("--output", type=click.File("w", encoding="utf-8"), default="-")
+def export_planner_command(username, export_format, output):
+    user = User.query.filter_by(username=username).first()
+    if user is None:
+        raise click.ClickException(f"No user called {username}.")
+    if export_format == "jsonl":
+        for record in export_jsonl(user.user_id):
+            output.write(json.dumps(record) + "\n")
+    else:
+        output.writelines(export_ics(user.user_id))
+
+
+@app.cli.command("import-planner")
+@click.argument("username")
+@click.argument("file", type=click.File("r", encoding="utf-8"))
+def import_planner_command(username, file):
+    user = User.query.filter_by(username=username).first()
+    if user is None:
+        raise click.ClickException(f"No user called {username}.")
+    try:
+        summary = import_jsonl(user.user_id, file)
+    except (ValueError, IntegrityError) as e:
+        raise click.ClickException(f"Nothing was imported. {e}")
+    imported = ", ".join(
+        f"{count} {kind} rows" for kind, count in summary["imported"].items()
+    )
+    click.echo(
+        f"Imported {imported}, skipped {summary['skipped_weeks']} weeks that already existed."
+    )
+
+
+# One-time setup of the app, the only one there is in the process. Its settings are read from the
+# environment when app.py gets imported and the caches, pools and limits above are built from them
+# right then, so change those through the environment. Importing app.py doesn't touch the
+# database though, it only gets connected here, so tests and scripts can still point
+# SQLALCHEMY_DATABASE_URI (or settings read per request, like RATE_LIMITING) somewhere else
+# before the first call. Later calls do nothing. Anything that pushes an app context first (CLI
+# commands, the test client) calls it too
+def set_up_app():
+    with app_setup_lock:
+        if "sqlalchemy" not in app.extensions:
+            db.init_app(app)
+            os.register_at_fork(after_in_child=after_fork)
+
+
+app_setup_lock = threading.Lock()
+
+
+@appcontext_pushed.connect_via(app)
+def set_up_on_first_use(sender, **extra):
+    if "sqlalchemy" not in app.extensions:
+        set_up_app()
+
+
+# Does the work every worker would otherwise do on its first requests: loading the templates,
+# compiling the planner page, the URL map and the model mappings. With a preforking server
+# (gunicorn --preload) it runs once in the parent and the workers start out warm
+def warm_up():
+    set_up_app()
+    configure_mappers()
+    for template_name in ("login.html", "signup.html", "range.html"):
+        app.jinja_env.get_template(template_name)
+    with app.test_request_context("/index"):
+        index_page.compile(CATEGORIES_PER_WEEK)
+
+
+# Forked workers drop the connections and the hashing pool they inherited, a connection or a
+# pool shared between processes would mix up their work
+def after_fork():
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+    password_hasher.executor = None
+
+
 if __name__ == "__main__":
+    set_up_app()
     app.run(debug=True)
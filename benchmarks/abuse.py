@@ -0,0 +1,180 @@
+# Load test for the rate limits and the write admission: a few regular users open weeks and
+# post the planner forms at a human pace, while abusive clients post the forms and wrong logins as
+# fast as they can, against a real multi-threaded server. Runs the regular users alone, then
+# with the abusers and nothing in the way, then with the abusers and the limits on, and reports
+# the regular users' latency and the abusers' refused requests for each.
+#
+#   python -m benchmarks.abuse --users 8 --abusers 8 --seconds 15
+import argparse
+import logging
+import os
+import random
+import threading
+import time
+
+from werkzeug.serving import make_server
+
+from benchmarks.routes import (
+    DB_PATH,
+    FIRST_WEEK,
+    PASSWORD,
+    HTTPDriver,
+    app,
+    init_db,
+    percentile,
+    random_form,
+    seed,
+)
+
+# After benchmarks.routes, which points the app at a throwaway database
+import app as planner  # noqa: E402  isort: skip
+
+FORMS = ["update_categories_and_tasks", "assign_task_to_day", "schedule_task_time_slot"]
+
+
+# Someone using the planner: opens a week, edits one of the grids, and takes a moment in between
+def regular_user(driver, rng, args, stop, record):
+    while not stop.is_set():
+        week = FIRST_WEEK + planner.datetime.timedelta(weeks=rng.randrange(args.weeks))
+        form = rng.choice(FORMS)
+        for path, data in [
+            (f"/index/{week}", None),
+            (f"/{form}", random_form(form, 0.5, rng, week)),
+        ]:
+            start = time.perf_counter()
+            status = driver.get(path) if data is None else driver.post(path, data)
+            record((time.perf_counter() - start) * 1000, status)
+            time.sleep(args.think_time)
+
+
+# A logged in client posting full forms back to back
+def form_abuser(driver, rng, args, stop, record):
+    while not stop.is_set():
+        form = rng.choice(FORMS)
+        week = FIRST_WEEK + planner.datetime.timedelta(weeks=rng.randrange(args.weeks))
+        start = time.perf_counter()
+        status = driver.post(f"/{form}", random_form(form, 1.0, rng, week))
+        record((time.perf_counter() - start) * 1000, status)
+
+
+# A client guessing passwords back to back, every try costs a password hash
+def login_abuser(driver, rng, args, stop, record):
+    while not stop.is_set():
+        start = time.perf_counter()
+        status = driver.post(
+            "/login", {"username": "user1", "password": f"guess{rng.random()}"}
+        )
+        record((time.perf_counter() - start) * 1000, status)
+
+
+def run_phase(base_url, args, abusers, protected):
+    app.config["RATE_LIMITING"] = protected
+    planner.write_admission = (
+        planner.WriteAdmission(
+            planner.InProcessWriteSlots(app.config["WRITE_MAX_CONCURRENCY"]),
+            app.config["WRITE_QUEUE_TIMEOUT"],
+        )
+        if protected
+        # Room for every thread, so nothing gets turned away
+        else planner.WriteAdmission(planner.InProcessWriteSlots(1000), None)
+    )
+
+    results = {"regular": [], "abuser": []}
+    lock = threading.Lock()
+    stop = threading.Event()
+
+    def start(kind, behavior, user, index):
+        driver = HTTPDriver(base_url)
+        # Logging in doesn't count against the limits under test
+        limiting = app.config["RATE_LIMITING"]
+        app.config["RATE_LIMITING"] = False
+        driver.post("/login", {"username": f"user{user}", "password": PASSWORD})
+        app.config["RATE_LIMITING"] = limiting
+        rng = random.Random(f"{kind}-{index}")
+
+        def record(latency, status):
+            with lock:
+                results[kind].append((latency, status))
+
+        return threading.Thread(
+            target=behavior, args=(driver, rng, args, stop, record), daemon=True
+        )
+
+    threads = [
+        start("regular", regular_user, user, user) for user in range(1, args.users + 1)
+    ]
+    if abusers:
+        threads += [
+            start(
+                "abuser",
+                login_abuser if index % 4 == 3 else form_abuser,
+                args.users + index + 1,
+                index,
+            )
+            for index in range(args.abusers)
+        ]
+    for thread in threads:
+        thread.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def summarize(label, results):
+    regular = sorted(latency for latency, _ in results["regular"])
+    failed = sum(1 for _, status in results["regular"] if status >= 400)
+    statuses = [status for _, status in results["abuser"]]
+    print(
+        f"{label:>20} {len(regular):6d} {failed:5d}"
+        f" {percentile(regular, 0.50):8.1f} {percentile(regular, 0.95):8.1f}"
+        f" {percentile(regular, 0.99):8.1f} {max(regular):8.1f}"
+        f" {len(statuses):8d} {statuses.count(429):6d} {statuses.count(503):6d}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Regular users' latency while abusive clients flood the write routes"
+    )
+    parser.add_argument("--users", type=int, default=8, help="regular users")
+    parser.add_argument("--abusers", type=int, default=8)
+    parser.add_argument("--weeks", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=15, help="per phase")
+    parser.add_argument(
+        "--think-time", type=float, default=0.5, help="regular users' pause"
+    )
+    args = parser.parse_args()
+
+    with app.app_context():
+        init_db()
+        seed(args.users + args.abusers, args.weeks, 0.5, random.Random(42))
+
+    # Thousands of refused requests would bury the results in the request log
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+
+    print(
+        f"{'':>20} {'------ regular users (ms) ------':>45}"
+        f" {'------- abusers -------':>22}"
+    )
+    print(
+        f"{'phase':>20} {'reqs':>6} {'err':>5} {'p50':>8} {'p95':>8} {'p99':>8}"
+        f" {'max':>8} {'reqs':>8} {'429':>6} {'503':>6}"
+    )
+    for label, abusers, protected in [
+        ("no abuse", False, True),
+        ("abuse, unprotected", True, False),
+        ("abuse, protected", True, True),
+    ]:
+        summarize(label, run_phase(base_url, args, abusers, protected))
+
+    server.shutdown()
+    os.remove(DB_PATH)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+# Benchmark for the planner export and import: writes a synthetic export with a long, fully
+# filled in history, imports it into a throwaway database and then exports it back out in both
+# formats, reporting the rows and megabytes per second of each step.
+#
+#   python -m benchmarks.export_import --weeks 480
+import argparse
+import datetime
+import json
+import os
+import resource
+import tempfile
+import time
+
+# Point the app at a throwaway database before it gets imported
+DB_PATH = os.path.join(tempfile.mkdtemp(), "benchmark.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_PATH}"
+
+from app import (  # noqa: E402
+    DAYS_OF_WEEK,
+    TIME_SLOTS,
+    User,
+    app,
+    db,
+    export_ics,
+    export_jsonl,
+    import_jsonl,
+    init_db,
+)
+
+FIRST_WEEK = datetime.date(2016, 1, 4)  # A Monday
+
+
+# Every week gets 7 categories with 8 tasks each, 7 tasks per day and every hour filled in
+def write_export(path, weeks):
+    ids = {"calendar": 0, "category": 0, "task": 0}
+
+    def next_id(kind):
+        ids[kind] += 1
+        return ids[kind]
+
+    with open(path, "w", encoding="utf-8") as file:
+        write = lambda record: file.write(json.dumps(record) + "\n")  # noqa: E731
+        for w in range(weeks):
+            write(
+                {
+                    "type": "calendar",
+                    "calendar_id": w + 1,
+                    "date": str(FIRST_WEEK + datetime.timedelta(weeks=w)),
+                }
+            )
+        ids["calendar"] = weeks
+        for w in range(weeks):
+            for i in range(1, 8):
+                write(
+                    {
+                        "type": "category",
+                        "category_id": next_id("category"),
+                        "calendar_id": w + 1,
+                        "category_name": f"Category {i}",
+                    }
+                )
+        schedules = []
+        for w in range(weeks):
+            task = {"type": "task", "calendar_id": w + 1, "category_id": None}
+            task.update(assigned_day=None, time_slot=None, slot_number=None)
+            for c in range(7):
+                for slot in range(1, 9):
+                    write(
+                        dict(
+                            task,
+                            task_id=next_id("task"),
+                            category_id=w * 7 + c + 1,
+                            task_name=f"task {slot}",
+                            slot_number=slot,
+                        )
+                    )
+            for day in DAYS_OF_WEEK:
+                for slot in range(1, 8):
+                    write(
+                        dict(
+                            task,
+                            task_id=next_id("task"),
+                            task_name=f"{day} {slot}",
+                            assigned_day=day,
+                            slot_number=slot,
+                        )
+                    )
+                for time_slot in TIME_SLOTS:
+                    task_id = next_id("task")
+                    write(
+                        dict(
+                            task,
+                            task_id=task_id,
+                            task_name=f"{day} {time_slot}",
+                            assigned_day=day,
+                            time_slot=time_slot,
+                        )
+                    )
+                    schedules.append((task_id, day, time_slot))
+        for task_id, day, time_slot in schedules:
+            write(
+                {
+                    "type": "schedule",
+                    "task_id": task_id,
+                    "day_of_week": day,
+                    "time_slot": time_slot,
+                }
+            )
+    return ids["task"]
+
+
+def report(label, seconds, records, size):
+    print(
+        f"{label:>12}: {seconds:7.2f} s  {records / seconds:10.0f} rows/s"
+        f"  {size / seconds / 1e6:7.2f} MB/s"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Time importing and exporting a long planner history"
+    )
+    parser.add_argument("--weeks", type=int, default=480)
+    args = parser.parse_args()
+
+    export_path = os.path.join(os.path.dirname(DB_PATH), "export.jsonl")
+    tasks = write_export(export_path, args.weeks)
+    size = os.path.getsize(export_path)
+    print(f"Wrote {tasks} tasks over {args.weeks} weeks ({size / 1e6:.1f} MB)")
+
+    with app.app_context():
+        init_db()
+        db.session.add(User(username="benchmark", password="x"))
+        db.session.commit()
+        user_id = User.query.filter_by(username="benchmark").one().user_id
+
+        start = time.perf_counter()
+        with open(export_path, encoding="utf-8") as file:
+            summary = import_jsonl(user_id, file)
+        imported = sum(summary["imported"].values())
+        report("import", time.perf_counter() - start, imported, size)
+        assert summary["imported"]["task"] == tasks, summary
+
+        for label, records in [
+            ("export jsonl", (json.dumps(r) + "\n" for r in export_jsonl(user_id))),
+            ("export ics", export_ics(user_id)),
+        ]:
+            start = time.perf_counter()
+            count = written = 0
+            with open(os.devnull, "w", encoding="utf-8") as devnull:
+                for chunk in records:
+                    devnull.write(chunk)
+                    count += 1
+                    written += len(chunk.encode())
+            report(label, time.perf_counter() - start, count, written)
+
+    # ru_maxrss is in kilobytes on Linux
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"Peak RSS: {peak:.0f} MB")
+
+    os.remove(export_path)
+    os.remove(DB_PATH)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+# Benchmark for the planner indexes: seeds a throwaway database with lots of users and weeks and
+# times the index route without and then with the hot-path indexes.
+#
+#   python -m benchmarks.index_latency --users 10000 --weeks 52
+import argparse
+import datetime
+import os
+import random
+import statistics
+import tempfile
+import time
+
+# Point the app at a throwaway database before it gets imported
+DB_PATH = os.path.join(tempfile.mkdtemp(), "benchmark.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_PATH}"
+
+from sqlalchemy import insert, text  # noqa: E402
+
+from app import (  # noqa: E402
+    DAYS_OF_WEEK,
+    TIME_SLOTS,
+    Calendar,
+    Category,
+    Schedule,
+    Task,
+    User,
+    app,
+    db,
+    init_db,
+)
+
+FIRST_WEEK = datetime.date(2024, 1, 1)  # A Monday
+BATCH_SIZE = 5000
+
+# The indexes added for the planner lookups, dropped for the "before" run
+PLANNER_INDEXES = [
+    ("ix_calendar_user_id_date", "calendar", "user_id, date", True),
+    ("ix_category_user_id_calendar_id", "category", "user_id, calendar_id", False),
+    (
+        "ix_task_calendar_id_category_id_slot_number",
+        "task",
+        "calendar_id, category_id, slot_number",
+        True,
+    ),
+    (
+        "ix_task_calendar_id_assigned_day_slot_number",
+        "task",
+        "calendar_id, assigned_day, slot_number",
+        True,
+    ),
+    (
+        "ix_schedule_user_id_day_of_week_time_slot",
+        "schedule",
+        "user_id, day_of_week, time_slot",
+        False,
+    ),
+    ("ix_schedule_task_id", "schedule", "task_id", False),
+]
+
+
+# Inserts rows in batches so seeding stays quick and memory stays flat
+def insert_batched(model, rows):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH_SIZE:
+            db.session.execute(insert(model), batch)
+            batch = []
+    if batch:
+        db.session.execute(insert(model), batch)
+
+
+# Every user gets the given number of weeks with 7 categories, a few tasks and a few time slots
+def seed(users, weeks, tasks_per_week):
+    insert_batched(
+        User,
+        (
+            {"user_id": u, "username": f"user{u}", "password": "x"}
+            for u in range(1, users + 1)
+        ),
+    )
+    insert_batched(
+        Calendar,
+        (
+            {
+                "calendar_id": (u - 1) * weeks + w + 1,
+                "user_id": u,
+                "date": FIRST_WEEK + datetime.timedelta(weeks=w),
+            }
+            for u in range(1, users + 1)
+            for w in range(weeks)
+        ),
+    )
+    calendars = users * weeks
+    insert_batched(
+        Category,
+        (
+            {
+                "category_id": (c - 1) * 7 + i,
+                "user_id": (c - 1) // weeks + 1,
+                "calendar_id": c,
+                "category_name": f"Category {i}",
+            }
+            for c in range(1, calendars + 1)
+            for i in range(1, 8)
+        ),
+    )
+    insert_batched(
+        Task,
+        (
+            {
+                "task_id": (c - 1) * tasks_per_week * 2 + i + 1,
+                "calendar_id": c,
+                "category_id": (c - 1) * 7 + i % 7 + 1,
+                "slot_number": i // 7 + 1,
+                "task_name": f"task {i}",
+            }
+            for c in range(1, calendars + 1)
+            for i in range(tasks_per_week)
+        ),
+    )
+    insert_batched(
+        Task,
+        (
+            {
+                "task_id": (c - 1) * tasks_per_week * 2 + tasks_per_week + i + 1,
+                "calendar_id": c,
+                "assigned_day": DAYS_OF_WEEK[i % 7],
+                "time_slot": TIME_SLOTS[i // 7 % len(TIME_SLOTS)],
+                "task_name": f"slot {i}",
+            }
+            for c in range(1, calendars + 1)
+            for i in range(tasks_per_week)
+        ),
+    )
+    insert_batched(
+        Schedule,
+        (
+            {
+                "user_id": (c - 1) // weeks + 1,
+                "task_id": (c - 1) * tasks_per_week * 2 + tasks_per_week + i + 1,
+                "day_of_week": DAYS_OF_WEEK[i % 7],
+                "time_slot": TIME_SLOTS[i // 7 % len(TIME_SLOTS)],
+            }
+            for c in range(1, calendars + 1)
+            for i in range(tasks_per_week)
+        ),
+    )
+    db.session.commit()
+
+
+# Times GET /index/<date> for random users and weeks, returns latencies in milliseconds
+def time_index(users, weeks, requests):
+    client = app.test_client()
+    rng = random.Random(42)
+    latencies = []
+    for _ in range(requests):
+        with client.session_transaction() as session:
+            session["user_id"] = rng.randint(1, users)
+        week = FIRST_WEEK + datetime.timedelta(weeks=rng.randrange(weeks))
+        start = time.perf_counter()
+        response = client.get(f"/index/{week}")
+        latencies.append((time.perf_counter() - start) * 1000)
+        assert response.status_code == 200, response.status_code
+    return latencies
+
+
+def report(label, latencies):
+    latencies = sorted(latencies)
+    print(
+        f"{label:>7}: mean {statistics.mean(latencies):8.2f} ms"
+        f"  p50 {latencies[len(latencies) // 2]:8.2f} ms"
+        f"  p95 {latencies[int(len(latencies) * 0.95)]:8.2f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Time the index route before and after the planner indexes"
+    )
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--weeks", type=int, default=52)
+    parser.add_argument("--tasks-per-week", type=int, default=10)
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+
+    with app.app_context():
+        init_db()
+        print(f"Seeding {args.users} users x {args.weeks} weeks into {DB_PATH}...")
+        start = time.perf_counter()
+        seed(args.users, args.weeks, args.tasks_per_week)
+        print(f"Seeded in {time.perf_counter() - start:.1f} s")
+
+        for name, _, _, _ in PLANNER_INDEXES:
+            db.session.execute(text(f"DROP INDEX {name}"))
+        db.session.commit()
+        report("before", time_index(args.users, args.weeks, args.requests))
+
+        for name, table, columns, unique in PLANNER_INDEXES:
+            unique = "UNIQUE " if unique else ""
+            db.session.execute(
+                text(f"CREATE {unique}INDEX {name} ON {table} ({columns})")
+            )
+        db.session.execute(text("ANALYZE"))
+        db.session.commit()
+        report("after", time_index(args.users, args.weeks, args.requests))
+
+    os.remove(DB_PATH)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+# Benchmark for rendering the planner page: times the full Jinja render of templates/index.html
+# against the precompiled skeleton that only fills in the values, for an empty and a full week,
+# after checking that both give exactly the same page.
+#
+#   python -m benchmarks.render --renders 2000
+import argparse
+import datetime
+import os
+import statistics
+import tempfile
+import time
+
+# Point the app at a throwaway database before it gets imported
+DB_PATH = os.path.join(tempfile.mkdtemp(), "benchmark.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_PATH}"
+
+from flask import render_template  # noqa: E402
+
+from app import (  # noqa: E402
+    DAY_TASK_NAMES,
+    DAYS_OF_WEEK,
+    SCHEDULE_NAMES,
+    TASKS_PER_CATEGORY,
+    TASKS_PER_DAY,
+    TIME_SLOTS,
+    app,
+    empty_week,
+    index_page,
+    index_page_values,
+    index_template_context,
+)
+
+WEEK = datetime.date(2024, 1, 1)  # A Monday
+
+
+# Every cell filled in, with some names that need escaping and a few recurring cells
+def full_week():
+    week = empty_week(1)
+    for index, category in enumerate(week["categories"], start=1):
+        category["category_id"] = index
+        week["tasks_by_category"][index] = {
+            i: {"task_id": index * 100 + i, "task_name": f"<b>task</b> {i} & more"}
+            for i in range(1, TASKS_PER_CATEGORY + 1)
+        }
+    for day in DAYS_OF_WEEK:
+        for i in range(1, TASKS_PER_DAY + 1):
+            week["tasks_by_day"][day][i] = f'{day} "task" {i}'
+        for time_slot in TIME_SLOTS:
+            week["time_schedule"][day][time_slot] = f"{day} {time_slot}"
+    week["recurring"] = [
+        DAY_TASK_NAMES[("Monday", 1)],
+        SCHEDULE_NAMES[("Friday", "9 AM")],
+    ]
+    return week
+
+
+def time_renders(render, renders):
+    timings = []
+    for _ in range(renders):
+        start = time.perf_counter()
+        render()
+        timings.append((time.perf_counter() - start) * 1e6)
+    return statistics.median(timings), statistics.mean(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Time the planner page render, full Jinja against precompiled"
+    )
+    parser.add_argument("--renders", type=int, default=2000)
+    args = parser.parse_args()
+
+    with app.test_request_context(f"/index/{WEEK}"):
+        for label, week, messages in [
+            ("empty week", empty_week(1), []),
+            ("full week", full_week(), ["Tasks saved & <assigned>"]),
+            ("archived week", dict(full_week(), archived=True), []),
+        ]:
+            values = index_page_values(week, WEEK, "benchmark <user>", messages)
+            shape = len(week["categories"])
+            jinja = render_template("index.html", **index_template_context(values))
+            compiled = index_page.render(values, shape)
+            assert compiled == jinja, f"{label}: the compiled page differs"
+
+            print(f"{label} ({len(jinja) / 1000:.0f} kB):")
+            for name, render in [
+                (
+                    "jinja",
+                    lambda: render_template(
+                        "index.html", **index_template_context(values)
+                    ),
+                ),
+                ("compiled", lambda: index_page.render(values, shape)),
+            ]:
+                median, mean = time_renders(render, args.renders)
+                print(f"{name:>12}: median {median:8.1f} us  mean {mean:8.1f} us")
+
+    # The page never touches the database, so it may not even exist
+    if os.path.exists(DB_PATH):
+        os.remove(DB_PATH)
+
+
+if __name__ == "__main__":
+    main()
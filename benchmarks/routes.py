@@ -0,0 +1,492 @@
+# Benchmark suite for the planner routes: seeds a throwaway database with users and weeks filled
+# to the given density, then drives signup/login, week navigation and the three form POSTs,
+# through the Flask test client and through a multi-threaded HTTP load generator against a real
+# server. Reports latency percentiles, requests/s and SQL statements per request, and saves
+# everything as JSON so runs from different commits can be compared.
+#
+#   python -m benchmarks.routes --users 200 --weeks 12 --density 0.5 --output before.json
+#   python -m benchmarks.routes --mode http --threads 8 --output after.json
+#   python -m benchmarks.routes --compare before.json after.json
+import argparse
+import datetime
+import http.cookiejar
+import json
+import os
+import platform
+import random
+import subprocess
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+# Point the app at a throwaway database before it gets imported
+DB_PATH = os.path.join(tempfile.mkdtemp(), "benchmark.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_PATH}"
+# Every thread sends its requests as fast as it can, which the rate limits would turn away
+os.environ.setdefault("RATE_LIMITING", "0")
+
+from sqlalchemy import event, insert  # noqa: E402
+
+from app import (  # noqa: E402
+    DAY_TASK_INPUTS,
+    SCHEDULE_INPUTS,
+    Calendar,
+    Category,
+    Schedule,
+    Task,
+    User,
+    app,
+    autosave_queue,
+    db,
+    encode_schedule_grid,
+    init_db,
+    password_hasher,
+)
+
+FIRST_WEEK = datetime.date(2024, 1, 1)  # A Monday
+PASSWORD = "benchmark"
+BATCH_SIZE = 5000
+AUTOSAVE_CELLS = ["monday_task1", "tuesday_task2", "schedule_9am_friday"]
+CATEGORY_TASK_INPUTS = [
+    (f"action{j}_category{i}", i, j) for i in range(1, 8) for j in range(1, 9)
+]
+
+# Every SQL statement the app runs, the server threads included
+statement_count = 0
+statement_lock = threading.Lock()
+
+
+def count_statement(*args):
+    global statement_count
+    with statement_lock:
+        statement_count += 1
+
+
+def insert_batched(model, rows):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH_SIZE:
+            db.session.execute(insert(model), batch)
+            batch = []
+    if batch:
+        db.session.execute(insert(model), batch)
+
+
+# Every user gets the given number of weeks, with that share of the category, day and hour cells
+# filled in. All users share one password hash so seeding doesn't wait on the hashing
+def seed(users, weeks, density, rng):
+    password = password_hasher.hash(PASSWORD)
+    insert_batched(
+        User,
+        (
+            {"user_id": u, "username": f"user{u}", "password": password}
+            for u in range(1, users + 1)
+        ),
+    )
+
+    packed = app.config["SCHEDULE_STORAGE"] == "grid"
+    calendars, categories, tasks, schedules = [], [], [], []
+    task_id = 0
+    for u in range(1, users + 1):
+        for w in range(weeks):
+            calendar_id = (u - 1) * weeks + w + 1
+            for i in range(1, 8):
+                categories.append(
+                    {
+                        "category_id": (calendar_id - 1) * 7 + i,
+                        "user_id": u,
+                        "calendar_id": calendar_id,
+                        "category_name": f"Category {i}",
+                    }
+                )
+            for _, i, j in CATEGORY_TASK_INPUTS:
+                if rng.random() < density:
+                    task_id += 1
+                    tasks.append(
+                        {
+                            "task_id": task_id,
+                            "calendar_id": calendar_id,
+                            "category_id": (calendar_id - 1) * 7 + i,
+                            "slot_number": j,
+                            "task_name": f"task {rng.randrange(100)}",
+                        }
+                    )
+            for day, slot_number in DAY_TASK_INPUTS.values():
+                if rng.random() < density:
+                    task_id += 1
+                    tasks.append(
+                        {
+                            "task_id": task_id,
+                            "calendar_id": calendar_id,
+                            "assigned_day": day,
+                            "slot_number": slot_number,
+                            "task_name": f"task {rng.randrange(100)}",
+                        }
+                    )
+            grid = {}
+            for day, time_slot in SCHEDULE_INPUTS.values():
+                if rng.random() < density:
+                    task_id += 1
+                    tasks.append(
+                        {
+                            "task_id": task_id,
+                            "calendar_id": calendar_id,
+                            "assigned_day": day,
+                            "time_slot": time_slot,
+                            "task_name": f"task {rng.randrange(100)}",
+                        }
+                    )
+                    grid[(day, time_slot)] = task_id
+                    if not packed:
+                        schedules.append(
+                            {
+                                "user_id": u,
+                                "task_id": task_id,
+                                "day_of_week": day,
+                                "time_slot": time_slot,
+                            }
+                        )
+            calendars.append(
+                {
+                    "calendar_id": calendar_id,
+                    "user_id": u,
+                    "date": FIRST_WEEK + datetime.timedelta(weeks=w),
+                    "schedule_grid": encode_schedule_grid(grid) if packed else None,
+                }
+            )
+    insert_batched(Calendar, calendars)
+    insert_batched(Category, categories)
+    insert_batched(Task, tasks)
+    insert_batched(Schedule, schedules)
+    db.session.commit()
+
+
+# A form for one of the grids of a week with the given share of cells filled, the names come from
+# a small pool so every POST changes some of the cells and leaves the rest alone
+def random_form(route, density, rng, week):
+    form = {"calendar_date": str(week)}
+    if route == "update_categories_and_tasks":
+        names = [name for name, _, _ in CATEGORY_TASK_INPUTS]
+        form.update((f"category{i}", f"Category {i}") for i in range(1, 8))
+    elif route == "assign_task_to_day":
+        names = list(DAY_TASK_INPUTS)
+    else:
+        names = list(SCHEDULE_INPUTS)
+    for name in names:
+        form[name] = f"task {rng.randrange(100)}" if rng.random() < density else ""
+    return form
+
+
+# The two ways of sending requests, they return the status code
+class TestClientDriver:
+    def __init__(self):
+        self.client = app.test_client()
+
+    def get(self, path):
+        response = self.client.get(path)
+        response.close()
+        return response.status_code
+
+    def post(self, path, form):
+        response = self.client.post(path, data=form)
+        response.close()
+        return response.status_code
+
+    def post_json(self, path, body):
+        response = self.client.post(path, json=body)
+        response.close()
+        return response.status_code
+
+
+class NoRedirects(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HTTPDriver:
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()),
+            NoRedirects(),
+        )
+
+    def request(self, path, data=None):
+        if isinstance(path, str):
+            path = self.base_url + path
+        try:
+            with self.opener.open(path, data=data) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            e.read()
+            return e.code
+
+    def get(self, path):
+        return self.request(path)
+
+    def post(self, path, form):
+        return self.request(path, urllib.parse.urlencode(form).encode())
+
+    def post_json(self, path, body):
+        return self.request(
+            urllib.request.Request(
+                self.base_url + path,
+                data=json.dumps(body).encode(),
+                headers={"Content-Type": "application/json"},
+            )
+        )
+
+
+# One step of a scenario for the given user, returns the timed request's status code. Anything
+# the step needs first (like opening the week a form gets posted to) isn't timed
+def make_step(scenario, args):
+    def step(driver, user, rng):
+        if scenario == "signup":
+            username = f"new{threading.get_ident()}-{rng.random()}"
+            return None, lambda: driver.post(
+                "/", {"username": username, "password": PASSWORD}
+            )
+        if scenario == "login":
+            return None, lambda: driver.post(
+                "/login", {"username": f"user{user}", "password": PASSWORD}
+            )
+        week = FIRST_WEEK + datetime.timedelta(weeks=rng.randrange(args.weeks))
+        if scenario == "navigate":
+            return None, lambda: driver.get(f"/index/{week}")
+        if scenario == "autosave":
+            # One keystroke in one of a few cells of the first week, like someone typing
+            name = rng.choice(AUTOSAVE_CELLS)
+            value = f"task {rng.randrange(100)}"[: rng.randrange(1, 9)]
+            return None, lambda: driver.post_json(
+                f"/api/week/{FIRST_WEEK}/autosave", {"cells": {name: value}}
+            )
+        form = random_form(scenario, args.density, rng, week)
+        return (
+            lambda: driver.get(f"/index/{week}"),
+            lambda: driver.post(f"/{scenario}", form),
+        )
+
+    return step
+
+
+def percentile(latencies, p):
+    return latencies[min(int(len(latencies) * p), len(latencies) - 1)]
+
+
+# Runs one scenario with one thread per driver, each working through its share of the requests
+def run_scenario(scenario, drivers, users, args):
+    global statement_count
+    step = make_step(scenario, args)
+    per_thread = max(args.requests // len(drivers), 1)
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+    untimed = [0]
+
+    def work(index, driver, user):
+        rng = random.Random(f"{args.seed}-{scenario}-{index}")
+        mine, failed, skipped = [], 0, 0
+        for _ in range(per_thread):
+            before, timed = step(driver, user, rng)
+            if before is not None:
+                before()
+                skipped += 1
+            start = time.perf_counter()
+            status = timed()
+            mine.append((time.perf_counter() - start) * 1000)
+            if status >= 400:
+                failed += 1
+        with lock:
+            latencies.extend(mine)
+            errors[0] += failed
+            untimed[0] += skipped
+
+    with statement_lock:
+        statement_count = 0
+    threads = [
+        threading.Thread(target=work, args=(index, driver, user))
+        for index, (driver, user) in enumerate(zip(drivers, users))
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors[0],
+        "requests_per_second": len(latencies) / elapsed,
+        "mean_ms": sum(latencies) / len(latencies),
+        "p50_ms": percentile(latencies, 0.50),
+        "p95_ms": percentile(latencies, 0.95),
+        "p99_ms": percentile(latencies, 0.99),
+        # The untimed requests before each POST are in the count too, so they get split out
+        "queries_per_request": statement_count / (len(latencies) + untimed[0]),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results):
+    print(
+        f"{'scenario':>28} {'reqs':>6} {'err':>4} {'req/s':>8} {'p50 ms':>8}"
+        f" {'p95 ms':>8} {'p99 ms':>8} {'queries':>8}"
+    )
+    for scenario, r in results.items():
+        print(
+            f"{scenario:>28} {r['requests']:6d} {r['errors']:4d}"
+            f" {r['requests_per_second']:8.1f} {r['p50_ms']:8.2f} {r['p95_ms']:8.2f}"
+            f" {r['p99_ms']:8.2f} {r['queries_per_request']:8.1f}"
+        )
+    if "coalescing_ratio" in results.get("autosave", {}):
+        ratio = results["autosave"]["coalescing_ratio"]
+        print(f"Autosave wrote one cell per {ratio:.1f} keystrokes")
+
+
+# Prints how every scenario moved between two saved runs
+def compare(before_path, after_path):
+    with open(before_path) as file:
+        before = json.load(file)
+    with open(after_path) as file:
+        after = json.load(file)
+    print(f"{before['commit']} -> {after['commit']}")
+    print(
+        f"{'scenario':>28} {'p50 ms':>18} {'p95 ms':>18} {'req/s':>18} {'queries':>12}"
+    )
+    for scenario, new in after["results"].items():
+        old = before["results"].get(scenario)
+        if old is None:
+            continue
+
+        def change(key, width):
+            delta = (new[key] - old[key]) / old[key] * 100 if old[key] else 0
+            return f"{old[key]:.1f}->{new[key]:.1f} ({delta:+.0f}%)".rjust(width)
+
+        print(
+            f"{scenario:>28} {change('p50_ms', 18)} {change('p95_ms', 18)}"
+            f" {change('requests_per_second', 18)}"
+            f" {old['queries_per_request']:5.1f}->{new['queries_per_request']:<5.1f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Latency, throughput and queries per request of the planner routes"
+    )
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--weeks", type=int, default=12)
+    parser.add_argument(
+        "--density", type=float, default=0.5, help="share of cells filled"
+    )
+    parser.add_argument("--mode", choices=["client", "http"], default="client")
+    parser.add_argument(
+        "--threads", type=int, default=8, help="load threads in http mode"
+    )
+    parser.add_argument(
+        "--requests", type=int, default=400, help="requests per scenario"
+    )
+    parser.add_argument(
+        "--login-requests", type=int, default=40, help="for signup and login"
+    )
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="where to save the results as JSON")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"))
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    with app.app_context():
+        init_db()
+        print(
+            f"Seeding {args.users} users x {args.weeks} weeks at density"
+            f" {args.density} into {DB_PATH}..."
+        )
+        seed(args.users, args.weeks, args.density, random.Random(args.seed))
+        event.listen(db.engine, "before_cursor_execute", count_statement)
+
+    server = None
+    if args.mode == "http":
+        from werkzeug.serving import make_server
+
+        server = make_server("127.0.0.1", 0, app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = f"http://127.0.0.1:{server.server_port}"
+        threads = args.threads
+    else:
+        threads = 1
+
+    def new_drivers():
+        if args.mode == "http":
+            return [HTTPDriver(base_url) for _ in range(threads)]
+        return [TestClientDriver() for _ in range(threads)]
+
+    users = random.Random(args.seed).sample(range(1, args.users + 1), threads)
+    results = {}
+    for scenario in ["signup", "login"]:
+        requests = args.requests
+        args.requests = args.login_requests
+        results[scenario] = run_scenario(scenario, new_drivers(), users, args)
+        args.requests = requests
+
+    # Everything else runs logged in, one user per thread
+    drivers = new_drivers()
+    for driver, user in zip(drivers, users):
+        driver.post("/login", {"username": f"user{user}", "password": PASSWORD})
+    for scenario in [
+        "navigate",
+        "update_categories_and_tasks",
+        "assign_task_to_day",
+        "schedule_task_time_slot",
+        "autosave",
+    ]:
+        results[scenario] = run_scenario(scenario, drivers, users, args)
+
+    # Writing out what's still queued, so the ratio covers every autosaved keystroke
+    autosave_queue.close()
+    results["autosave"]["coalescing_ratio"] = autosave_queue.stats()["coalescing_ratio"]
+
+    if server is not None:
+        server.shutdown()
+
+    print_results(results)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(
+                {
+                    "commit": git_commit(),
+                    "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+                    "python": platform.python_version(),
+                    "schedule_storage": app.config["SCHEDULE_STORAGE"],
+                    "session_store": app.config["SESSION_STORE"],
+                    "config": vars(args),
+                    "results": results,
+                },
+                file,
+                indent=2,
+            )
+        print(f"Saved the results to {args.output}")
+
+    os.remove(DB_PATH)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+# Compares the two hour grid storage formats: one Schedule row per cell ("rows") against the
+# packed grid on the calendar ("grid"). Each format gets its own database, filled through the
+# same save path the routes use, then we time reading the weeks back and check the file size.
+#
+#   python -m benchmarks.schedule_storage --users 200 --weeks 20 --fill 0.5
+import argparse
+import datetime
+import multiprocessing
+import os
+import random
+import statistics
+import tempfile
+import time
+
+FIRST_WEEK = datetime.date(2024, 1, 1)  # A Monday
+
+
+def run_format(storage, args, results):
+    db_path = os.path.join(tempfile.mkdtemp(), f"{storage}.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    os.environ["SCHEDULE_STORAGE"] = storage
+    from sqlalchemy import text
+
+    from app import (
+        DAYS_OF_WEEK,
+        TIME_SLOTS,
+        Calendar,
+        User,
+        app,
+        db,
+        get_or_create_calendar,
+        init_db,
+        load_week,
+        save_schedule_tasks,
+    )
+
+    rng = random.Random(42)
+    cells = [(day, time_slot) for day in DAYS_OF_WEEK for time_slot in TIME_SLOTS]
+    write_times, read_times = [], []
+    with app.app_context():
+        init_db()
+        users = [User(username=f"user{u}", password="x") for u in range(args.users)]
+        db.session.add_all(users)
+        db.session.commit()
+        user_ids = [user.user_id for user in users]
+
+        calendars = []
+        for user_id in user_ids:
+            for week in range(args.weeks):
+                submitted = {
+                    cell: f"task {rng.randrange(1000)}"
+                    for cell in cells
+                    if rng.random() < args.fill
+                }
+                start = time.perf_counter()
+                calendar = get_or_create_calendar(
+                    user_id, FIRST_WEEK + datetime.timedelta(weeks=week)
+                )
+                save_schedule_tasks(user_id, calendar, submitted)
+                db.session.commit()
+                write_times.append((time.perf_counter() - start) * 1000)
+                calendars.append((user_id, calendar.calendar_id))
+
+        db.session.remove()
+        for user_id, calendar_id in rng.sample(
+            calendars, min(args.reads, len(calendars))
+        ):
+            start = time.perf_counter()
+            calendar = db.session.get(Calendar, calendar_id)
+            load_week(user_id, calendar)
+            read_times.append((time.perf_counter() - start) * 1000)
+            db.session.remove()
+
+        db.session.execute(text("VACUUM"))
+        db.engine.dispose()
+
+    results.put(
+        (
+            storage,
+            statistics.mean(write_times),
+            statistics.mean(read_times),
+            os.path.getsize(db_path),
+        )
+    )
+    os.remove(db_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare the hour grid storage formats"
+    )
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--weeks", type=int, default=20)
+    parser.add_argument("--fill", type=float, default=0.5, help="share of filled cells")
+    parser.add_argument("--reads", type=int, default=1000)
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    for storage in ("rows", "grid"):
+        process = context.Process(target=run_format, args=(storage, args, results))
+        process.start()
+        storage, write_ms, read_ms, size = results.get()
+        process.join()
+        print(
+            f"{storage:>5}: write {write_ms:6.2f} ms/week  read {read_ms:6.2f} ms/week"
+            f"  db size {size / 1024 / 1024:7.2f} MB"
+        )
+
+
+if __name__ == "__main__":
+    main()
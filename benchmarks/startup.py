@@ -0,0 +1,180 @@
+# Benchmark for how fast a worker gets going: the time from importing the app to serving its first
+# request (a logged in planner page). Each cold run is a fresh Python process, like a worker
+# started on its own. Forked runs come from one parent that set the app up and warmed it up
+# first, like the workers of `gunicorn --preload`, and are timed from the fork.
+#
+#   python -m benchmarks.startup --runs 10 --forks 10
+import argparse
+import datetime
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+WEEK = datetime.date(2024, 1, 1)  # A Monday
+
+
+# Serves the planner page for the seeded user, the first request a worker would get
+def first_request(app, cookie):
+    client = app.test_client()
+    client.set_cookie(app.config["SESSION_COOKIE_NAME"], cookie)
+    response = client.get(f"/index/{WEEK}")
+    assert response.status_code == 200, response.status_code
+
+
+# A fresh process: importing the app, setting it up and serving the first request
+def cold_worker(cookie):
+    started_at = time.perf_counter()
+    import app as planner
+
+    imported_at = time.perf_counter()
+    planner.set_up_app()
+    set_up_at = time.perf_counter()
+    first_request(planner.app, cookie)
+    served_at = time.perf_counter()
+    return {
+        "import_ms": (imported_at - started_at) * 1000,
+        "setup_ms": (set_up_at - imported_at) * 1000,
+        "first_request_ms": (served_at - set_up_at) * 1000,
+        "total_ms": (served_at - started_at) * 1000,
+    }
+
+
+# One parent that sets the app up (and maybe warms it up), then forks workers one at a time
+def forked_workers(cookie, forks, warm):
+    import app as planner
+
+    planner.set_up_app()
+    if warm:
+        planner.warm_up()
+
+    timings = []
+    for _ in range(forks):
+        read_end, write_end = os.pipe()
+        forked_at = time.perf_counter()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_end)
+            first_request(planner.app, cookie)
+            os.write(write_end, str(time.perf_counter() - forked_at).encode())
+            os._exit(0)
+        os.close(write_end)
+        with os.fdopen(read_end) as pipe:
+            elapsed = float(pipe.read())
+        os.waitpid(pid, 0)
+        timings.append({"first_request_ms": elapsed * 1000, "total_ms": elapsed * 1000})
+    return timings
+
+
+# Creates the schema, a user with a filled in week and a session for them, returns the cookie
+def seed():
+    from app import Calendar, Task, User, app, db, init_db
+
+    with app.app_context():
+        init_db()
+        user = User(username="startup", password="x")
+        db.session.add(user)
+        db.session.flush()
+        calendar = Calendar(user_id=user.user_id, date=WEEK, version=1)
+        db.session.add(calendar)
+        db.session.flush()
+        db.session.add_all(
+            Task(
+                calendar_id=calendar.calendar_id,
+                task_name=f"Task {i}",
+                assigned_day="Monday",
+                slot_number=i,
+            )
+            for i in range(1, 8)
+        )
+        db.session.commit()
+        user_id = user.user_id
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["user_id"] = user_id
+        session["username"] = "startup"
+    return client.get_cookie(app.config["SESSION_COOKIE_NAME"]).value
+
+
+def run_child(args):
+    if args.child == "cold":
+        results = [cold_worker(args.cookie)]
+    else:
+        results = forked_workers(args.cookie, args.forks, args.child == "warm-fork")
+    print(json.dumps(results))
+
+
+def summarize(label, runs):
+    print(f"{label:>16} ({len(runs)} runs):", end="")
+    for key in ["import_ms", "setup_ms", "first_request_ms", "total_ms"]:
+        if key in runs[0]:
+            median = statistics.median(run[key] for run in runs)
+            print(f"  {key[:-3]} {median:7.1f} ms", end="")
+    print()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Time from importing the app to serving the first request"
+    )
+    parser.add_argument("--runs", type=int, default=10, help="cold processes")
+    parser.add_argument("--forks", type=int, default=10, help="forked workers")
+    parser.add_argument("--child", choices=["cold", "fork", "warm-fork"])
+    parser.add_argument("--cookie")
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args)
+        return
+
+    # Point every process at a throwaway database before the app gets imported
+    db_path = os.path.join(tempfile.mkdtemp(), "benchmark.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    cookie = subprocess.run(
+        [sys.executable, "-c", "from benchmarks.startup import seed; print(seed())"],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout.split()[-1]
+
+    def child(mode):
+        output = subprocess.run(
+            [
+                sys.executable,
+                "-m",
+                "benchmarks.startup",
+                "--child",
+                mode,
+                "--cookie",
+                cookie,
+                "--forks",
+                str(args.forks),
+            ],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        return json.loads(output.splitlines()[-1])
+
+    cold = []
+    for _ in range(args.runs):
+        started_at = time.perf_counter()
+        cold.extend(child("cold"))
+        cold[-1]["process_ms"] = (time.perf_counter() - started_at) * 1000
+    summarize("cold worker", cold)
+    print(
+        f"{'':>16} whole process, interpreter start and exit included:"
+        f" {statistics.median(run['process_ms'] for run in cold):.1f} ms"
+    )
+    summarize("forked", child("fork"))
+    summarize("forked, warmed", child("warm-fork"))
+
+    os.remove(db_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+# Write load test: several worker processes save cells into the same SQLite database at once
+# and we count how many writes went through and how many failed on the database lock.
+#
+#   python -m benchmarks.write_load --workers 8 --writes 200
+#   python -m benchmarks.write_load --journal-mode DELETE --busy-timeout 0   # untuned SQLite
+import argparse
+import datetime
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+
+FIRST_WEEK = datetime.date(2024, 1, 1)  # A Monday
+
+
+# Each worker is its own process with its own app and connection pool, like a WSGI worker
+def run_worker(worker, args, db_url, results):
+    os.environ["DATABASE_URL"] = db_url
+    from app import DAY_TASK_INPUTS, SCHEDULE_INPUTS, app
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["user_id"] = worker + 1
+
+    rng = random.Random(worker)
+    cells = list(DAY_TASK_INPUTS) + list(SCHEDULE_INPUTS)
+    ok = errors = 0
+    for i in range(args.writes):
+        week = FIRST_WEEK + datetime.timedelta(weeks=rng.randrange(args.weeks))
+        response = client.patch(
+            f"/api/week/{week}/cells",
+            json={"cells": {rng.choice(cells): f"task {worker}-{i}"}},
+        )
+        if response.status_code == 200:
+            ok += 1
+        else:
+            errors += 1
+    results.put((ok, errors))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Concurrent write throughput against one SQLite database"
+    )
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--writes", type=int, default=200, help="writes per worker")
+    parser.add_argument("--weeks", type=int, default=4)
+    parser.add_argument("--journal-mode", default="WAL")
+    parser.add_argument("--synchronous", default="NORMAL")
+    parser.add_argument("--busy-timeout", type=int, default=5000)
+    args = parser.parse_args()
+
+    os.environ["SQLITE_JOURNAL_MODE"] = args.journal_mode
+    os.environ["SQLITE_SYNCHRONOUS"] = args.synchronous
+    os.environ["SQLITE_BUSY_TIMEOUT"] = str(args.busy_timeout)
+    # This measures the database, not the rate limits
+    os.environ["RATE_LIMITING"] = "0"
+    db_path = os.path.join(tempfile.mkdtemp(), "load.db")
+    db_url = f"sqlite:///{db_path}"
+
+    # Create the schema and one user per worker before the workers start
+    os.environ["DATABASE_URL"] = db_url
+    from app import User, app, db, init_db
+
+    with app.app_context():
+        init_db()
+        db.session.add_all(
+            User(username=f"load{worker}", password="x")
+            for worker in range(args.workers)
+        )
+        db.session.commit()
+        db.engine.dispose()
+
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    workers = [
+        context.Process(target=run_worker, args=(worker, args, db_url, results))
+        for worker in range(args.workers)
+    ]
+    start = time.perf_counter()
+    for process in workers:
+        process.start()
+    totals = [results.get() for _ in workers]
+    elapsed = time.perf_counter() - start
+    for process in workers:
+        process.join()
+
+    ok = sum(result[0] for result in totals)
+    errors = sum(result[1] for result in totals)
+    print(
+        f"journal_mode={args.journal_mode} synchronous={args.synchronous}"
+        f" busy_timeout={args.busy_timeout}ms workers={args.workers}"
+    )
+    print(f"{ok} writes ok, {errors} failed, {ok / elapsed:.1f} writes/s")
+    os.remove(db_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,22 @@
+# gunicorn picks this up when it's started from this folder, e.g. `gunicorn wsgi:app`
+#
+# Open planner pages poll for changes by default (LIVE_SYNC=poll), so every request is short and a
+# few threads per worker go a long way. With LIVE_SYNC=stream every open page keeps a request
+# going, so the workers run on gevent instead, where an idle stream costs next to nothing
+import os
+
+workers = int(os.environ.get("GUNICORN_WORKERS", 4))
+threads = int(os.environ.get("GUNICORN_THREADS", 16))
+preload_app = True
+
+if os.environ.get("LIVE_SYNC") == "stream":
+    worker_class = "gevent"
+    worker_connections = int(os.environ.get("GUNICORN_WORKER_CONNECTIONS", 2000))
+
+    # The app gets preloaded before the workers would patch the standard library, so it's patched
+    # here first, or the locks and queues made at import would block a whole worker
+    from gevent import monkey
+
+    monkey.patch_all()
+else:
+    worker_class = "gthread"
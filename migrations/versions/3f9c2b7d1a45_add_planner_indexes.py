@@ -0,0 +1,111 @@
+"""Add indexes and unique cells for the planner lookups
+
+Revision ID: 3f9c2b7d1a45
+Revises:
+Create Date: 2026-10-18 09:00:00.000000
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "3f9c2b7d1a45"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+# (index name, table, columns, unique)
+INDEXES = [
+    ("ix_calendar_user_id_date", "calendar", ["user_id", "date"], True),
+    ("ix_category_user_id_calendar_id", "category", ["user_id", "calendar_id"], False),
+    (
+        "ix_task_calendar_id_category_id_slot_number",
+        "task",
+        ["calendar_id", "category_id", "slot_number"],
+        True,
+    ),
+    (
+        "ix_task_calendar_id_assigned_day_slot_number",
+        "task",
+        ["calendar_id", "assigned_day", "slot_number"],
+        True,
+    ),
+    (
+        "ix_schedule_user_id_day_of_week_time_slot",
+        "schedule",
+        ["user_id", "day_of_week", "time_slot"],
+        False,
+    ),
+    ("ix_schedule_task_id", "schedule", ["task_id"], False),
+]
+
+
+# Groups of rows that have the same values in all the columns, as (values, primary keys) pairs.
+# Rows with a null in any of them never clash
+def duplicate_rows(bind, table, columns):
+    key = sa.inspect(bind).get_pk_constraint(table)["constrained_columns"][0]
+    rows = sa.table(table, sa.column(key), *(sa.column(c) for c in columns))
+    values = [rows.c[c] for c in columns]
+    duplicates = (
+        sa.select(*values)
+        .where(*(value.is_not(None) for value in values))
+        .group_by(*values)
+        .having(sa.func.count() > 1)
+        .subquery()
+    )
+    groups = {}
+    for row in bind.execute(
+        sa.select(rows.c[key], *values)
+        .join(duplicates, sa.and_(*(rows.c[c] == duplicates.c[c] for c in columns)))
+        .order_by(*values, rows.c[key])
+    ):
+        groups.setdefault(tuple(row[1:]), []).append(row[0])
+    return key, list(groups.items())
+
+
+# Describes the rows that would break a unique index, so they can be fixed by hand. Which of them
+# to keep (and what to do with the categories, tasks and schedules hanging off them) isn't
+# something the upgrade can guess
+def unique_conflicts(bind, name, table, columns, shown=20):
+    key, groups = duplicate_rows(bind, table, columns)
+    if not groups:
+        return []
+    lines = [f"{name}, {table} rows with the same {', '.join(columns)}:"]
+    for values, keys in groups[:shown]:
+        cells = ", ".join(f"{c}={v!r}" for c, v in zip(columns, values))
+        lines.append(f"  {cells}: {key} {', '.join(map(str, keys))}")
+    if len(groups) > shown:
+        lines.append(f"  and {len(groups) - shown} more")
+    return lines
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    missing = [
+        (name, table, columns, unique)
+        for name, table, columns, unique in INDEXES
+        # Fresh databases get these from db.create_all() already, only older ones need them
+        if name not in {index["name"] for index in inspector.get_indexes(table)}
+    ]
+    # Check every unique index first so one run lists all the rows in the way
+    conflicts = [
+        line
+        for name, table, columns, unique in missing
+        if unique
+        for line in unique_conflicts(bind, name, table, columns)
+    ]
+    if conflicts:
+        raise RuntimeError(
+            "Can't add the unique indexes, remove all but one row of each group below "
+            "and upgrade again:\n" + "\n".join(conflicts)
+        )
+    for name, table, columns, unique in missing:
+        op.create_index(name, table, columns, unique=unique)
+
+
+def downgrade():
+    for name, table, _, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
@@ -0,0 +1,35 @@
+"""Add the packed schedule grid to calendars
+
+Revision ID: 5d7e2f1c9b38
+Revises: 8c1e4a9f6b20
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "5d7e2f1c9b38"
+down_revision = "8c1e4a9f6b20"
+branch_labels = None
+depends_on = None
+
+
+# The existing weeks stay in the row per cell format, moving them over to the packed grid is
+# done with `SCHEDULE_STORAGE=grid flask convert-schedules`. Run it with --to rows before
+# downgrading, or the packed weeks lose their hour grid
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    # Fresh databases get the column from db.create_all() already
+    if "schedule_grid" not in {
+        column["name"] for column in inspector.get_columns("calendar")
+    }:
+        op.add_column(
+            "calendar", sa.Column("schedule_grid", sa.LargeBinary(), nullable=True)
+        )
+
+
+def downgrade():
+    with op.batch_alter_table("calendar") as batch_op:
+        batch_op.drop_column("schedule_grid")
@@ -0,0 +1,33 @@
+"""Add a version to calendars for the week page ETag
+
+Revision ID: 8c1e4a9f6b20
+Revises: 3f9c2b7d1a45
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "8c1e4a9f6b20"
+down_revision = "3f9c2b7d1a45"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    # Fresh databases get the column from db.create_all() already
+    if "version" not in {
+        column["name"] for column in inspector.get_columns("calendar")
+    }:
+        op.add_column(
+            "calendar",
+            sa.Column("version", sa.Integer(), nullable=False, server_default="0"),
+        )
+
+
+def downgrade():
+    with op.batch_alter_table("calendar") as batch_op:
+        batch_op.drop_column("version")
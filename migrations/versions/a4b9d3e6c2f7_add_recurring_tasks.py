@@ -0,0 +1,76 @@
+"""Add recurring tasks and their exceptions
+
+Revision ID: a4b9d3e6c2f7
+Revises: 5d7e2f1c9b38
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "a4b9d3e6c2f7"
+down_revision = "5d7e2f1c9b38"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    # Fresh databases get all of this from db.create_all() already
+    if "recurring_version" not in {
+        column["name"] for column in inspector.get_columns("user")
+    }:
+        op.add_column(
+            "user",
+            sa.Column(
+                "recurring_version", sa.Integer(), nullable=False, server_default="0"
+            ),
+        )
+
+    tables = inspector.get_table_names()
+    if "recurring_task" not in tables:
+        op.create_table(
+            "recurring_task",
+            sa.Column("recurring_task_id", sa.Integer(), primary_key=True),
+            sa.Column(
+                "user_id", sa.Integer(), sa.ForeignKey("user.user_id"), nullable=False
+            ),
+            sa.Column("task_name", sa.String(length=255), nullable=False),
+            sa.Column("days", sa.Integer(), nullable=False),
+            sa.Column("time_slot", sa.String(length=50), nullable=True),
+            sa.Column("slot_number", sa.Integer(), nullable=True),
+            sa.Column("start_date", sa.Date(), nullable=False),
+            sa.Column("end_date", sa.Date(), nullable=True),
+            sa.Column(
+                "interval_weeks", sa.Integer(), nullable=False, server_default="1"
+            ),
+        )
+        op.create_index("ix_recurring_task_user_id", "recurring_task", ["user_id"])
+    if "recurring_exception" not in tables:
+        op.create_table(
+            "recurring_exception",
+            sa.Column("recurring_exception_id", sa.Integer(), primary_key=True),
+            sa.Column(
+                "recurring_task_id",
+                sa.Integer(),
+                sa.ForeignKey("recurring_task.recurring_task_id"),
+                nullable=False,
+            ),
+            sa.Column("date", sa.Date(), nullable=False),
+            sa.Column("task_name", sa.String(length=255), nullable=True),
+        )
+        op.create_index(
+            "ix_recurring_exception_recurring_task_id_date",
+            "recurring_exception",
+            ["recurring_task_id", "date"],
+            unique=True,
+        )
+
+
+def downgrade():
+    op.drop_table("recurring_exception")
+    op.drop_table("recurring_task")
+    with op.batch_alter_table("user") as batch_op:
+        batch_op.drop_column("recurring_version")
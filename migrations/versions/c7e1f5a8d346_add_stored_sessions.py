@@ -0,0 +1,34 @@
+"""Add the server-side session table
+
+Revision ID: c7e1f5a8d346
+Revises: a4b9d3e6c2f7
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "c7e1f5a8d346"
+down_revision = "a4b9d3e6c2f7"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Fresh databases get the table from db.create_all() already
+    if "stored_session" not in sa.inspect(op.get_bind()).get_table_names():
+        op.create_table(
+            "stored_session",
+            sa.Column("session_id", sa.String(length=64), primary_key=True),
+            sa.Column("data", sa.Text(), nullable=False),
+            sa.Column("expires_at", sa.Float(), nullable=False),
+        )
+        op.create_index(
+            "ix_stored_session_expires_at", "stored_session", ["expires_at"]
+        )
+
+
+def downgrade():
+    op.drop_table("stored_session")
@@ -0,0 +1,40 @@
+"""Add the archive table for old weeks
+
+Revision ID: e2d8a6c4b913
+Revises: c7e1f5a8d346
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "e2d8a6c4b913"
+down_revision = "c7e1f5a8d346"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Fresh databases get the table from db.create_all() already
+    if "archived_week" not in sa.inspect(op.get_bind()).get_table_names():
+        op.create_table(
+            "archived_week",
+            sa.Column("archived_week_id", sa.Integer(), primary_key=True),
+            sa.Column(
+                "user_id", sa.Integer(), sa.ForeignKey("user.user_id"), nullable=False
+            ),
+            sa.Column("date", sa.Date(), nullable=False),
+            sa.Column("data", sa.LargeBinary(), nullable=False),
+        )
+        op.create_index(
+            "ix_archived_week_user_id_date",
+            "archived_week",
+            ["user_id", "date"],
+            unique=True,
+        )
+
+
+def downgrade():
+    op.drop_table("archived_week")
@@ -0,0 +1,111 @@
+import datetime
+import os
+import tempfile
+
+import pytest
+
+# Point the app at a throwaway database before it gets imported
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'test.db')}"
+
+from app import (  # noqa: E402
+    DAYS_OF_WEEK,
+    TASKS_PER_CATEGORY,
+    TASKS_PER_DAY,
+    TIME_SLOTS,
+    Calendar,
+    Category,
+    Schedule,
+    Task,
+    User,
+    app,
+    db,
+    init_db,
+    set_up_app,
+)
+
+WEEK = datetime.date(2024, 1, 1)  # A Monday
+
+
+# The week seed_week saves
+@pytest.fixture
+def week():
+    return WEEK
+
+
+@pytest.fixture(scope="session")
+def client():
+    app.config.update(TESTING=True, RATE_LIMITING=False)
+    set_up_app()
+    with app.app_context():
+        init_db()
+    return app.test_client()
+
+
+# Saves a week for a new user, filled in up to the given fraction of its cells, and logs the test
+# client in as them. Returns the user's id
+@pytest.fixture
+def seed_week(client):
+    def seed(username, fill):
+        with app.app_context():
+            user = User(username=username, password="x")
+            db.session.add(user)
+            db.session.flush()
+            calendar = Calendar(user_id=user.user_id, date=WEEK, version=1)
+            db.session.add(calendar)
+            db.session.flush()
+
+            categories = [
+                Category(
+                    user_id=user.user_id,
+                    calendar_id=calendar.calendar_id,
+                    category_name=f"Category {i}",
+                )
+                for i in range(1, 8)
+            ]
+            db.session.add_all(categories)
+            db.session.flush()
+            for category in categories:
+                for slot_number in range(1, int(TASKS_PER_CATEGORY * fill) + 1):
+                    db.session.add(
+                        Task(
+                            f"Task {slot_number}",
+                            category_id=category.category_id,
+                            slot_number=slot_number,
+                            calendar_id=calendar.calendar_id,
+                        )
+                    )
+            for day in DAYS_OF_WEEK:
+                for slot_number in range(1, int(TASKS_PER_DAY * fill) + 1):
+                    db.session.add(
+                        Task(
+                            f"{day} {slot_number}",
+                            assigned_day=day,
+                            slot_number=slot_number,
+                            calendar_id=calendar.calendar_id,
+                        )
+                    )
+                for time_slot in TIME_SLOTS[: int(len(TIME_SLOTS) * fill)]:
+                    task = Task(
+                        f"{day} {time_slot}",
+                        time_slot=time_slot,
+                        calendar_id=calendar.calendar_id,
+                    )
+                    db.session.add(task)
+                    db.session.flush()
+                    db.session.add(
+                        Schedule(
+                            user_id=user.user_id,
+                            task_id=task.task_id,
+                            day_of_week=day,
+                            time_slot=time_slot,
+                        )
+                    )
+            db.session.commit()
+            user_id = user.user_id
+
+        with client.session_transaction() as session:
+            session["user_id"] = user_id
+            session["username"] = username
+        return user_id
+
+    return seed
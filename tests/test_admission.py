@@ -0,0 +1,63 @@
+import multiprocessing
+
+import app as planner
+from app import FileLockWriteSlots, WriteAdmission, app
+
+
+def test_over_the_budget_gets_429_with_retry_after(
+    client, seed_week, week, monkeypatch
+):
+    seed_week("rate-limited", 0)
+    monkeypatch.setitem(app.config, "RATE_LIMITING", True)
+    monkeypatch.setitem(app.config["RATE_LIMITS"], "patch_week_cells", (2, 60))
+    cells = {"cells": {"monday_task1": "Limited"}}
+    for _ in range(2):
+        assert client.patch(f"/api/week/{week}/cells", json=cells).status_code == 200
+    response = client.patch(f"/api/week/{week}/cells", json=cells)
+    assert response.status_code == 429
+    # One request comes back every 30 seconds
+    assert 1 <= int(response.headers["Retry-After"]) <= 30
+
+
+def test_write_without_a_free_slot_gets_503_with_retry_after(
+    client, seed_week, week, monkeypatch, tmp_path
+):
+    seed_week("turned-away", 0)
+    slots = FileLockWriteSlots(str(tmp_path), 1)
+    monkeypatch.setattr(planner, "write_admission", WriteAdmission(slots, 0.01))
+    held = slots.acquire(0)
+
+    cells = {"cells": {"monday_task1": "Busy"}}
+    response = client.patch(f"/api/week/{week}/cells", json=cells)
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+
+    slots.release(held)
+    assert client.patch(f"/api/week/{week}/cells", json=cells).status_code == 200
+    # The request gave its slot back
+    assert slots.acquire(0) is not None
+
+
+def hold_slot(directory, holding, done):
+    slots = FileLockWriteSlots(directory, 1)
+    slots.acquire(None)
+    holding.set()
+    done.wait(10)
+
+
+# The slots are shared with the other worker processes
+def test_write_slots_are_shared_between_processes(tmp_path):
+    context = multiprocessing.get_context("fork")
+    holding, done = context.Event(), context.Event()
+    worker = context.Process(target=hold_slot, args=(str(tmp_path), holding, done))
+    worker.start()
+    try:
+        assert holding.wait(10)
+        slots = FileLockWriteSlots(str(tmp_path), 1)
+        assert slots.acquire(0.05) is None
+        done.set()
+        worker.join(10)
+        assert slots.acquire(1) is not None
+    finally:
+        done.set()
+        worker.join(10)
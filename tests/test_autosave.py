@@ -0,0 +1,87 @@
+import datetime
+from types import SimpleNamespace
+
+from sqlalchemy.exc import OperationalError
+
+import app as planner
+from app import ArchivedWeek, AutosaveQueue, app, db, pack_week
+
+
+# A queue that only writes when the test flushes it
+def new_queue():
+    return AutosaveQueue(flush_interval=3600, max_pending=10000)
+
+
+def test_edits_to_a_cell_get_coalesced(client, seed_week, week):
+    user_id = seed_week("autosave", 0)
+    autosave = new_queue()
+    for value in ("T", "Ty", "Typed"):
+        autosave.enqueue(user_id, week, {"monday_task1": value})
+    autosave.enqueue(user_id, week, {"tuesday_task1": "Other"})
+    assert autosave.stats()["depth"] == 2
+
+    autosave.flush()
+    stats = autosave.stats()
+    assert (stats["depth"], stats["received"], stats["written"]) == (0, 4, 2)
+    assert stats["coalescing_ratio"] == 2
+    page = client.get(f"/index/{week}").data.decode()
+    assert 'value="Typed"' in page and 'value="Other"' in page
+
+
+# A week the writer couldn't save goes back in the queue, and what got typed meanwhile wins
+def test_failed_week_is_saved_with_the_next_flush(client, seed_week, week, monkeypatch):
+    user_id = seed_week("autosave-retry", 0)
+    autosave = new_queue()
+    autosave.enqueue(user_id, week, {"monday_task1": "Old", "tuesday_task1": "Kept"})
+
+    def locked(*args):
+        autosave.enqueue(user_id, week, {"monday_task1": "New"})
+        raise OperationalError("INSERT", {}, Exception("database is locked"))
+
+    monkeypatch.setattr(planner, "save_week_cells", locked)
+    autosave.flush()
+    stats = autosave.stats()
+    assert (stats["depth"], stats["retries"], stats["failures"]) == (2, 1, 0)
+
+    monkeypatch.undo()
+    autosave.flush()
+    assert autosave.stats()["depth"] == 0
+    page = client.get(f"/index/{week}").data.decode()
+    assert 'value="New"' in page and 'value="Kept"' in page
+
+
+# An archived week can't be saved, the route says so instead of queueing it and the writer drops it
+def test_archived_week_is_not_queued(client, seed_week, week):
+    user_id = seed_week("autosave-archived", 0)
+    archived = week - datetime.timedelta(weeks=60)
+    with app.app_context():
+        calendar = SimpleNamespace(calendar_id=0, version=1)
+        db.session.add(
+            ArchivedWeek(
+                user_id=user_id, date=archived, data=pack_week(calendar, [], [], [])
+            )
+        )
+        db.session.commit()
+    response = client.post(
+        f"/api/week/{archived}/autosave", json={"cells": {"monday_task1": "Late"}}
+    )
+    assert response.status_code == 409
+
+    autosave = new_queue()
+    autosave.enqueue(user_id, archived, {"monday_task1": "Late"})
+    autosave.flush()
+    stats = autosave.stats()
+    assert (stats["depth"], stats["retries"], stats["failures"]) == (0, 0, 1)
+
+
+def test_autosave_on_a_weekday_saves_to_its_week(client, seed_week, week, monkeypatch):
+    seed_week("autosave-weekday", 0)
+    autosave = new_queue()
+    monkeypatch.setattr(planner, "autosave_queue", autosave)
+    thursday = week + datetime.timedelta(days=3)
+    response = client.post(
+        f"/api/week/{thursday}/autosave", json={"cells": {"friday_task1": "Queued"}}
+    )
+    assert response.status_code == 202
+    autosave.flush()
+    assert b"Queued" in client.get(f"/index/{week}").data
@@ -0,0 +1,66 @@
+import datetime
+from types import SimpleNamespace
+
+from app import ArchivedWeek, Calendar, app, db, pack_week
+
+
+def test_patch_saves_only_the_sent_cells(client, seed_week, week):
+    seed_week("patch", 0.25)
+    response = client.patch(
+        f"/api/week/{week}/cells",
+        json={"cells": {"monday_task1": "Monday 1", "monday_task2": "Patched"}},
+    )
+    assert response.status_code == 200
+    # Monday 1 was already there, so only the second cell changed
+    assert response.get_json() == {"cells": {"monday_task2": "Patched"}}
+    page = client.get(f"/index/{week}").data
+    assert b"Patched" in page and b"Monday 1" in page
+
+
+# Any day of the week saves into the week, the same one the planner page shows for that day
+def test_patch_on_a_weekday_saves_to_its_week(client, seed_week, week):
+    user_id = seed_week("patch-weekday", 0)
+    wednesday = week + datetime.timedelta(days=2)
+    response = client.patch(
+        f"/api/week/{wednesday}/cells", json={"cells": {"friday_task1": "Midweek"}}
+    )
+    assert response.status_code == 200
+    assert b"Midweek" in client.get(f"/index/{week}").data
+    with app.app_context():
+        assert db.session.scalars(
+            db.select(Calendar.date).where(Calendar.user_id == user_id)
+        ).all() == [week]
+
+
+def test_patch_turns_away_unknown_cells(client, seed_week, week):
+    seed_week("patch-unknown", 0)
+    response = client.patch(
+        f"/api/week/{week}/cells",
+        json={"cells": {"monday_task1": "Kept out", "funday_task1": "Nope"}},
+    )
+    assert response.status_code == 400
+    assert response.get_json()["cells"] == ["funday_task1"]
+    assert b"Kept out" not in client.get(f"/index/{week}").data
+
+
+def test_patch_on_an_archived_week_conflicts(client, seed_week, week):
+    user_id = seed_week("patch-archived", 0)
+    archived = week - datetime.timedelta(weeks=60)
+    with app.app_context():
+        calendar = SimpleNamespace(calendar_id=0, version=1)
+        db.session.add(
+            ArchivedWeek(
+                user_id=user_id, date=archived, data=pack_week(calendar, [], [], [])
+            )
+        )
+        db.session.commit()
+    response = client.patch(
+        f"/api/week/{archived}/cells", json={"cells": {"monday_task1": "Late"}}
+    )
+    assert response.status_code == 409
+    with app.app_context():
+        assert not db.session.scalar(
+            db.select(Calendar.calendar_id).where(
+                Calendar.user_id == user_id, Calendar.date == archived
+            )
+        )
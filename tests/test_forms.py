@@ -0,0 +1,35 @@
+from app import Calendar, Task, app, db
+
+
+def day_tasks(user_id, date):
+    with app.app_context():
+        return db.session.scalars(
+            db.select(Task.task_name)
+            .join(Calendar, Task.calendar_id == Calendar.calendar_id)
+            .where(
+                Calendar.user_id == user_id,
+                Calendar.date == date,
+                Task.assigned_day == "Friday",
+            )
+        ).all()
+
+
+# The form saves into the week it was posted from, whichever week got looked at last
+def test_form_saves_to_the_posted_week(client, seed_week, week):
+    user_id = seed_week("forms", 0)
+    client.get(f"/index/{week}")
+    client.get("/index/2024-02-05")
+    response = client.post(
+        "/assign_task_to_day",
+        data={"calendar_date": str(week), "friday_task1": "Posted"},
+    )
+    assert response.status_code == 302
+    assert response.headers["Location"].endswith(f"/index/{week}")
+    assert day_tasks(user_id, week) == ["Posted"]
+
+
+def test_form_without_a_week_saves_nothing(client, seed_week, week):
+    user_id = seed_week("forms-no-week", 0)
+    response = client.post("/assign_task_to_day", data={"friday_task1": "Lost"})
+    assert response.status_code == 302
+    assert day_tasks(user_id, week) == []
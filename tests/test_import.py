@@ -0,0 +1,246 @@
+import datetime
+import io
+import json
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+
+import app as planner
+from app import Calendar, Category, RecurringTask, Task, User, app, db
+
+WEEK = "2024-03-04"
+GOOD_LINES = [
+    {"type": "calendar", "calendar_id": 1, "date": WEEK},
+    {
+        "type": "category",
+        "category_id": 1,
+        "calendar_id": 1,
+        "category_name": "School",
+    },
+    {
+        "type": "task",
+        "task_id": 1,
+        "calendar_id": 1,
+        "category_id": 1,
+        "task_name": "Homework",
+        "assigned_day": None,
+        "time_slot": None,
+        "slot_number": 1,
+    },
+    {
+        "type": "task",
+        "task_id": 2,
+        "calendar_id": 1,
+        "category_id": None,
+        "task_name": "Read",
+        "assigned_day": "Monday",
+        "time_slot": None,
+        "slot_number": 1,
+    },
+]
+
+
+def post_import(client, lines):
+    data = "\n".join(
+        line if isinstance(line, str) else json.dumps(line) for line in lines
+    )
+    return client.post(
+        "/import", data={"file": (io.BytesIO(data.encode()), "planner.jsonl")}
+    )
+
+
+# The imported week's calendars and tasks of the user
+def user_rows(user_id):
+    with app.app_context():
+        calendar_ids = db.session.scalars(
+            db.select(Calendar.calendar_id).where(
+                Calendar.user_id == user_id,
+                Calendar.date == datetime.date.fromisoformat(WEEK),
+            )
+        ).all()
+        tasks = db.session.scalar(
+            db.select(db.func.count(Task.task_id)).where(
+                Task.calendar_id.in_(calendar_ids)
+            )
+        )
+        return len(calendar_ids), tasks
+
+
+def test_import_loads_a_valid_export(client, seed_week):
+    user_id = seed_week("import-good", 0)
+    response = post_import(client, GOOD_LINES)
+    assert response.status_code == 200, response.data
+    assert user_rows(user_id) == (1, 2)
+    page = client.get(f"/index/{WEEK}")
+    assert page.status_code == 200
+    assert b"Homework" in page.data and b"Read" in page.data
+
+
+@pytest.mark.parametrize(
+    "bad_line",
+    [
+        {**GOOD_LINES[3], "task_id": 3, "assigned_day": "Funday"},
+        {**GOOD_LINES[3], "task_id": 3, "slot_number": 99},
+        {**GOOD_LINES[3], "task_id": 3, "time_slot": "25 PM"},
+        {"type": "schedule", "task_id": 2, "day_of_week": "Monday", "time_slot": 9},
+        {"type": "task", "task_id": 3},
+        {"type": "nonsense"},
+        "[1, 2, 3]",
+        "not json",
+    ],
+)
+def test_invalid_import_is_rejected_and_leaves_nothing(client, seed_week, bad_line):
+    user_id = seed_week(f"import-bad-{bad_line!r}", 0)
+    # The bad line comes last, after batches that would have been saved before
+    response = post_import(client, GOOD_LINES + [bad_line])
+    assert response.status_code == 400, response.data
+    assert user_rows(user_id) == (0, 0)
+    assert client.get(f"/index/{WEEK}").status_code == 200
+
+
+RECURRING_LINE = {
+    "type": "recurring_task",
+    "recurring_task_id": 1,
+    "task_name": "Gym",
+    "days": ["Tuesday"],
+    "time_slot": None,
+    "slot_number": 2,
+    "start_date": "2024-01-01",
+    "end_date": None,
+    "interval_weeks": 1,
+}
+
+
+def test_import_loads_recurring_tasks(client, seed_week):
+    seed_week("import-recurring", 0)
+    response = post_import(client, [RECURRING_LINE])
+    assert response.status_code == 200, response.data
+    assert response.get_json()["imported"]["recurring_task"] == 1
+    assert b"Gym" in client.get(f"/index/{WEEK}").data
+
+
+@pytest.mark.parametrize(
+    "bad_fields",
+    [
+        {"interval_weeks": 0},
+        {"slot_number": 99},
+        {"time_slot": "25 PM", "slot_number": None},
+        {"days": ["Funday"]},
+        {"days": []},
+        {"start_date": None},
+    ],
+)
+def test_invalid_recurring_import_is_rejected(client, seed_week, bad_fields):
+    seed_week(f"import-recurring-{bad_fields!r}", 0)
+    response = post_import(client, [{**RECURRING_LINE, **bad_fields}])
+    assert response.status_code == 400, response.data
+    assert client.get(f"/index/{WEEK}").status_code == 200
+
+
+# Rules that made it in before imports were checked don't take the planner down
+def test_stored_invalid_recurring_tasks_are_skipped(client, seed_week):
+    user_id = seed_week("recurring-stored", 0)
+    with app.app_context():
+        for interval_weeks, slot_number in [(0, 1), (1, 99)]:
+            db.session.add(
+                RecurringTask(
+                    user_id=user_id,
+                    task_name="Broken",
+                    days=1,
+                    slot_number=slot_number,
+                    start_date=datetime.date(2024, 1, 1),
+                    interval_weeks=interval_weeks,
+                )
+            )
+        db.session.execute(
+            db.update(User)
+            .where(User.user_id == user_id)
+            .values(recurring_version=User.recurring_version + 1)
+        )
+        db.session.commit()
+    response = client.get(f"/index/{WEEK}")
+    assert response.status_code == 200
+    assert b"Broken" not in response.data
+
+
+@pytest.mark.parametrize(
+    "extra_lines",
+    [
+        # The same Monday cell twice
+        [{**GOOD_LINES[3], "task_id": 3, "task_name": "Again"}],
+        # The same category cell twice
+        [{**GOOD_LINES[2], "task_id": 3}],
+        # The same week twice
+        [{**GOOD_LINES[0], "calendar_id": 2}],
+        [{**GOOD_LINES[0], "date": "2024-03-11"}],
+        [
+            RECURRING_LINE,
+            *[
+                {
+                    "type": "recurring_exception",
+                    "recurring_task_id": 1,
+                    "date": "2024-03-05",
+                    "task_name": None,
+                }
+            ]
+            * 2,
+        ],
+    ],
+)
+def test_duplicate_records_are_rejected(client, seed_week, extra_lines):
+    user_id = seed_week(f"import-duplicate-{extra_lines!r}", 0)
+    response = post_import(client, GOOD_LINES + extra_lines)
+    assert response.status_code == 400, response.data
+    assert "more than once" in response.get_json()["error"]
+    assert user_rows(user_id) == (0, 0)
+
+
+# The planner only ever shows weeks by their Monday
+def test_week_that_does_not_start_on_a_monday_is_rejected(client, seed_week):
+    user_id = seed_week("import-wednesday", 0)
+    lines = [{**GOOD_LINES[0], "date": "2024-03-06"}, *GOOD_LINES[1:]]
+    response = post_import(client, lines)
+    assert response.status_code == 400, response.data
+    assert "Monday" in response.get_json()["error"]
+    assert user_rows(user_id) == (0, 0)
+
+
+def test_import_commits_batch_by_batch(client, seed_week, monkeypatch):
+    user_id = seed_week("import-batches", 0)
+    monkeypatch.setitem(app.config, "IMPORT_BATCH_SIZE", 1)
+    with app.app_context():
+        engine = db.engine
+    commits = []
+    record_commit = lambda conn: commits.append(conn)  # noqa: E731
+    event.listen(engine, "commit", record_commit)
+    try:
+        response = post_import(client, GOOD_LINES)
+    finally:
+        event.remove(engine, "commit", record_commit)
+    assert response.status_code == 200, response.data
+    assert len(commits) >= len(GOOD_LINES)
+    assert user_rows(user_id) == (1, 2)
+
+
+# A batch that fails after others went in takes them back out with it
+def test_failed_batch_takes_the_import_back_out(client, seed_week, monkeypatch):
+    user_id = seed_week("import-failed-batch", 0)
+    monkeypatch.setitem(app.config, "IMPORT_BATCH_SIZE", 1)
+    insert_with_new_ids = planner.insert_with_new_ids
+
+    def failing_tasks(model, *args):
+        if model is Task:
+            raise IntegrityError("INSERT", {}, Exception("UNIQUE constraint failed"))
+        return insert_with_new_ids(model, *args)
+
+    monkeypatch.setattr(planner, "insert_with_new_ids", failing_tasks)
+    response = post_import(client, GOOD_LINES)
+    assert response.status_code == 400, response.data
+    assert user_rows(user_id) == (0, 0)
+    with app.app_context():
+        assert not db.session.scalar(
+            db.select(db.func.count(Category.category_id)).where(
+                Category.user_id == user_id, Category.category_name == "School"
+            )
+        )
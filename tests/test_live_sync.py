@@ -0,0 +1,60 @@
+from app import app, week_events
+
+
+def test_save_reaches_a_subscriber(client, seed_week, week):
+    user_id = seed_week("live-sync", 0)
+    subscription = week_events.subscribe(user_id, week)
+    try:
+        response = client.patch(
+            f"/api/week/{week}/cells", json={"cells": {"monday_task1": "Pushed"}}
+        )
+        assert response.status_code == 200
+        assert subscription.messages.get_nowait() == {
+            "version": 2,
+            "cells": {"monday_task1": "Pushed"},
+        }
+    finally:
+        week_events.unsubscribe(subscription)
+
+
+# Polling gets nothing while the page is up to date, and the week once it was saved elsewhere
+def test_poll_picks_up_a_save(client, seed_week, week):
+    seed_week("live-sync-poll", 0)
+    assert client.get(f"/api/week/{week}/changes?version=1").status_code == 204
+
+    client.patch(f"/api/week/{week}/cells", json={"cells": {"monday_task1": "Polled"}})
+    response = client.get(f"/api/week/{week}/changes?version=1")
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data["version"] == 2
+    assert data["cells"]["monday_task1"] == "Polled"
+    assert client.get(f"/api/week/{week}/changes?version=2").status_code == 204
+
+
+# A form posted from a page that missed a save only saves the cells edited on that page
+def test_stale_form_only_saves_its_edited_cells(client, seed_week, week):
+    seed_week("live-sync-stale", 0.25)
+    client.patch(
+        f"/api/week/{week}/cells", json={"cells": {"monday_task1": "Other device"}}
+    )
+    response = client.post(
+        "/assign_task_to_day",
+        data={
+            "calendar_date": str(week),
+            "version": "1",
+            "edited": "tuesday_task1",
+            "monday_task1": "Monday 1",
+            "tuesday_task1": "This page",
+        },
+    )
+    assert response.status_code == 302
+    page = client.get(f"/index/{week}").data.decode()
+    assert 'value="Other device"' in page and 'value="This page"' in page
+
+
+def test_live_sync_can_be_turned_off(client, seed_week, week, monkeypatch):
+    seed_week("live-sync-off", 0)
+    # Streams are only there when asked for
+    assert client.get(f"/api/week/{week}/events").status_code == 404
+    monkeypatch.setitem(app.config, "LIVE_SYNC", "off")
+    assert client.get(f"/api/week/{week}/changes?version=1").status_code == 404
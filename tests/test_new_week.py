@@ -0,0 +1,42 @@
+import datetime
+import threading
+
+from app import Calendar, app, db, save_week_cells
+
+
+# Two first saves of a week that was never saved both get to create it, whichever comes second
+# saves into the week the first one created
+def test_first_saves_of_a_week_can_race(client, seed_week, week):
+    user_id = seed_week("race", 0)
+    weeks = [week + datetime.timedelta(weeks=n) for n in range(1, 21)]
+    errors = []
+
+    def save(cell, barrier):
+        for new_week in weeks:
+            barrier.wait()
+            with app.app_context():
+                try:
+                    save_week_cells(user_id, new_week, {cell: "Saved"})
+                    db.session.commit()
+                except Exception as e:
+                    errors.append(e)
+
+    barrier = threading.Barrier(2)
+    threads = [
+        threading.Thread(target=save, args=(cell, barrier))
+        for cell in ("monday_task1", "tuesday_task1")
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    with app.app_context():
+        assert db.session.scalar(
+            db.select(db.func.count()).where(
+                Calendar.user_id == user_id, Calendar.date.in_(weeks)
+            )
+        ) == len(weeks)
+    page = client.get(f"/index/{weeks[-1]}").data.decode()
+    assert page.count('value="Saved"') == 2
@@ -0,0 +1,74 @@
+import datetime
+import fnmatch
+
+from sqlalchemy import update
+
+from app import Calendar, SharedCacheBackend, Task, WeekCache, app, db
+
+
+# Another worker saving the week doesn't invalidate this worker's cache, the page still has to
+# show the save and the old ETag can't get a 304 anymore
+def test_week_saved_elsewhere_is_not_served_from_the_cache(client, seed_week, week):
+    user_id = seed_week("cache", 0.25)
+    response = client.get(f"/index/{week}")
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+    assert b"Monday 1" in response.data
+
+    with app.app_context():
+        calendar_id = db.session.scalar(
+            db.select(Calendar.calendar_id).where(Calendar.user_id == user_id)
+        )
+        db.session.execute(
+            update(Task)
+            .where(Task.calendar_id == calendar_id, Task.task_name == "Monday 1")
+            .values(task_name="Saved elsewhere")
+        )
+        db.session.execute(
+            update(Calendar)
+            .where(Calendar.calendar_id == calendar_id)
+            .values(version=Calendar.version + 1)
+        )
+        db.session.commit()
+
+    response = client.get(f"/index/{week}", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert b"Saved elsewhere" in response.data
+
+
+# Stands in for a Redis client, with just what SharedCacheBackend uses
+class FakeRedis:
+    def __init__(self):
+        self.values = {}
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def setex(self, key, ttl, value):
+        self.values[key] = value
+
+    def delete(self, key):
+        self.values.pop(key, None)
+
+    def scan_iter(self, match):
+        return [key for key in list(self.values) if fnmatch.fnmatchcase(key, match)]
+
+
+def test_shared_backend_caches_and_invalidates_weeks(week):
+    cache = WeekCache(SharedCacheBackend(FakeRedis()))
+    next_week = week + datetime.timedelta(days=7)
+    for user_id, week_start_date in [(1, week), (1, next_week), (2, week)]:
+        cache.set(user_id, week_start_date, {"stamp": (1, 1), "user_id": user_id})
+
+    assert cache.get(1, week, (1, 1)) == {"stamp": (1, 1), "user_id": 1}
+    # An entry built from other rows doesn't get served
+    assert cache.get(1, week, (2, 1)) is None
+
+    cache.invalidate(1, week)
+    assert cache.get(1, week, (1, 1)) is None
+    assert cache.get(1, next_week, (1, 1)) is not None
+
+    cache.invalidate_user(1)
+    assert cache.get(1, next_week, (1, 1)) is None
+    # Only that user's weeks go
+    assert cache.get(2, week, (1, 1)) == {"stamp": (1, 1), "user_id": 2}
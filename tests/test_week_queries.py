@@ -0,0 +1,51 @@
+import pytest
+from sqlalchemy import event
+
+from app import app, db, week_cache
+
+# Looking up the week and its calendar, then its categories, tasks and schedules. The session
+# lookup isn't counted, it depends on the session store
+WEEK_QUERIES = 4
+
+
+@pytest.mark.parametrize("fill", [0.25, 1.0])
+def test_week_loads_in_a_fixed_number_of_queries(client, seed_week, week, fill):
+    user_id = seed_week(f"queries-{fill}", fill)
+    week_cache.invalidate(user_id, week)
+    with app.app_context():
+        engine = db.engine
+
+    statements = []
+
+    def count_statement(conn, cursor, statement, *args):
+        if "stored_session" not in statement:
+            statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", count_statement)
+    try:
+        response = client.get(f"/index/{week}")
+    finally:
+        event.remove(engine, "before_cursor_execute", count_statement)
+    assert response.status_code == 200
+    assert len(statements) == WEEK_QUERIES, statements
+
+
+# Looking at weeks only reads, the session included
+def test_navigating_weeks_writes_nothing(client, seed_week, week):
+    seed_week("navigate", 0.25)
+    with app.app_context():
+        engine = db.engine
+
+    writes = []
+
+    def record_write(conn, cursor, statement, *args):
+        if not statement.lstrip().upper().startswith("SELECT"):
+            writes.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record_write)
+    try:
+        for path in [f"/index/{week}", "/index/2024-01-08", f"/index/{week}"]:
+            assert client.get(path).status_code == 200
+    finally:
+        event.remove(engine, "before_cursor_execute", record_write)
+    assert writes == []
@@ -0,0 +1,14 @@
+# Production entry point, serve it with a WSGI server instead of the Flask dev server, e.g.
+#
+#   SECRET_KEY=... DATABASE_URL=sqlite:////srv/schedulify/plannerpad.db gunicorn wsgi:app
+#
+# Started from this folder gunicorn reads gunicorn.conf.py, which preloads the app into 4 threaded
+# workers (gevent ones with LIVE_SYNC=stream).
+#
+# Run `flask init-db` and `flask db upgrade` first, the app doesn't create its tables itself.
+# Preloaded, the app gets set up and warmed up once and the workers are forked from it ready
+# to serve. See the top of app.py for the rest of the settings that can come from the environment
+from app import app, set_up_app, warm_up
+
+set_up_app()
+warm_up()